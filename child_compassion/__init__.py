@@ -1,6 +1,7 @@
 from . import models
 from . import controllers
 from . import wizards
+from . import tools
 from odoo.addons.message_center_compassion.tools.load_mappings import \
     load_mapping_files
 
@@ -29,7 +29,7 @@
 # pylint: disable=C8101
 {
     "name": "Compassion Children",
-    "version": "12.0.1.1.0",
+    "version": "12.0.1.2.0",
     "category": "Other",
     "author": "Compassion CH",
     "license": "AGPL-3",
@@ -62,6 +62,7 @@
         "views/res_lang_compassion_view.xml",
         "views/child_or_fcp_property_view.xml",
         "data/validity_checks_cron.xml",
+        "data/childpool_cache_cron.xml",
         "data/child.hobby.csv",
         "data/child.household.duty.csv",
         "data/child.project.activity.csv",
@@ -1 +1,2 @@
 from . import web_children_hold
+from . import zip_export
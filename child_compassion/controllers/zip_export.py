@@ -0,0 +1,39 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import os
+
+from werkzeug.exceptions import NotFound
+
+from odoo import http
+from odoo.http import request
+
+
+class ZipExportController(http.Controller):
+    @http.route(
+        "/child_compassion/export/<int:attachment_id>",
+        type="http",
+        auth="user",
+        methods=["GET"],
+    )
+    def download_export(self, attachment_id, **parameters):
+        """ Streams an archive created with ZipExport from the filestore,
+        without loading it in memory. """
+        attachment = request.env["ir.attachment"].browse(attachment_id).exists()
+        if not attachment or not attachment.store_fname:
+            raise NotFound()
+        attachment.check("read")
+        path = attachment._full_path(attachment.store_fname)
+        if not os.path.isfile(path):
+            raise NotFound()
+        return http.send_file(
+            path,
+            mimetype=attachment.mimetype,
+            as_attachment=True,
+            filename=attachment.datas_fname,
+        )
@@ -0,0 +1,13 @@
+from openupgradelib import openupgrade
+
+
+@openupgrade.migrate(use_env=True)
+def migrate(env, version):
+    if not version:
+        return
+
+    # Holds are now processed by the hold scheduler
+    for xml_id in ("compassion_hold_cron", "no_money_cron"):
+        cron = env.ref("child_compassion." + xml_id, raise_if_not_found=False)
+        if cron:
+            cron.active = False
@@ -1,4 +1,5 @@
 from . import global_child
+from . import childpool_cache
 from . import child_compassion
 from . import child_pictures
 from . import field_office
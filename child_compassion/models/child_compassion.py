@@ -23,6 +23,9 @@ from .compassion_hold import HoldType
 
 logger = logging.getLogger(__name__)
 
+# Number of children whose pictures are updated in the same job
+PICTURES_BATCH_SIZE = 50
+
 
 class CompassionChild(models.Model):
     """ A sponsored child """
@@ -376,21 +379,46 @@ class CompassionChild(models.Model):
     ##########################################################################
     #                              ORM METHODS                               #
     ##########################################################################
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         """
         If child with global_id already exists, update it instead of creating
         a new one.
         """
-        global_id = vals.get("global_id")
-        child = self.search([("global_id", "=", global_id)])
-        if child:
-            child.write(vals)
-        else:
-            child = super().create(vals)
-            # directly fetch picture to have it before get_infos
-            child.with_delay().update_child_pictures()
-        return child
+        existing = {
+            child.global_id: child
+            for child in self.search(
+                [("global_id", "in", [vals.get("global_id") for vals in vals_list])]
+            )
+        }
+        found = list()  # Existing children or index of the values to create
+        to_create = list()
+        for vals in vals_list:
+            global_id = vals.get("global_id")
+            child = existing.get(global_id)
+            if isinstance(child, int):
+                # Same child given twice in the call: the last values win
+                to_create[child].update(vals)
+                found.append(child)
+            elif child:
+                child.write(vals)
+                found.append(child)
+            else:
+                if global_id:
+                    existing[global_id] = len(to_create)
+                found.append(len(to_create))
+                to_create.append(dict(vals))
+        new_children = super().create(to_create) if to_create else self
+        # directly fetch picture to have it before get_infos
+        for i in range(0, len(new_children), PICTURES_BATCH_SIZE):
+            new_children[i: i + PICTURES_BATCH_SIZE].with_delay()\
+                .update_child_pictures()
+        return self.browse(
+            [
+                new_children[child].id if isinstance(child, int) else child.id
+                for child in found
+            ]
+        )
 
     @api.multi
     def unlink(self):
@@ -538,10 +566,10 @@ class CompassionChild(models.Model):
         - Difference between two last pictures is at least 6 months
         - Last picture is no older than 6 months
         """
-        # Update child's pictures
-        for child in self:
-            # last_picture return false is there is no new pictures
-            if child._get_last_pictures() and len(child.pictures_ids) > 1:
+        # Update child's pictures, downloading the pictures of all children
+        # together. Children without new pictures are skipped.
+        for child in self._get_last_pictures().mapped("child_id"):
+            if len(child.pictures_ids) > 1:
                 pictures = child.pictures_ids
                 today = date.today()
                 last_photo = pictures[1].date
@@ -705,15 +733,13 @@ class CompassionChild(models.Model):
 
     @api.multi
     def _get_last_pictures(self):
-        self.ensure_one()
-
         pictures_obj = self.env["compassion.child.pictures"]
         pictures = pictures_obj.create(
-            {"child_id": self.id, "image_url": self.image_url}
+            [{"child_id": child.id, "image_url": child.image_url} for child in self]
         )
-        if pictures:
+        for child in pictures.mapped("child_id"):
             # Add a note in child
-            self.message_post(
+            child.message_post(
                 body=_("The picture has been updated."),
                 subject=_("Picture update"),
                 message_type="comment",
@@ -387,3 +387,20 @@ class ChildLifecycleEvent(models.Model):
             lifecycle_ids.append(lifecycle.id)
 
         return lifecycle_ids
+
+    @api.model
+    def process_commkit_batch(self, commkits):
+        """ Batch variant of process_commkit: the events of all messages are
+        converted at once.
+        :param commkits: list of commkit data
+        :return: list of lifecycle ids for each message
+        """
+        events = [
+            commkit_data.get("BeneficiaryLifecycleEventList", [commkit_data])
+            for commkit_data in commkits
+        ]
+        vals_list = self.json_to_data([data for commkit in events for data in commkit])
+        if isinstance(vals_list, dict):
+            vals_list = [vals_list]
+        lifecycle_ids = iter([self.create(vals).id for vals in vals_list])
+        return [[next(lifecycle_ids) for data in commkit] for commkit in events]
@@ -44,3 +44,20 @@ class ChildNote(models.Model):
             child_note = self.create(vals)
             note_ids.append(child_note.id)
         return note_ids
+
+    @api.model
+    def process_commkit_batch(self, commkits):
+        """ Batch variant of process_commkit: the notes of all messages are
+        converted at once.
+        :param commkits: list of commkit data
+        :return: list of note ids for each message
+        """
+        notes = [
+            commkit_data.get("GPPublicNotesKit", [commkit_data])
+            for commkit_data in commkits
+        ]
+        vals_list = self.json_to_data([data for commkit in notes for data in commkit])
+        if isinstance(vals_list, dict):
+            vals_list = [vals_list]
+        note_ids = iter(self.create(vals_list).ids)
+        return [[next(note_ids) for data in commkit] for commkit in notes]
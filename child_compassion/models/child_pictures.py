@@ -8,18 +8,15 @@
 #
 ##############################################################################
 import base64
+import hashlib
 import logging
-from urllib.request import urlopen, Request
 
 from odoo import models, fields, api, _
 from odoo.http import request
 
-logger = logging.getLogger(__name__)
+from ..tools.image_cache import download_images
 
-# This User-Agent simulate a browser, so that the fetch is not blocked
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows; U; Windows NT 5.1; en-US; rv:1.9.0.7) Gecko/2009021910 Firefox/3.0.7"
-}
+logger = logging.getLogger(__name__)
 
 
 class ChildPictures(models.Model):
@@ -40,6 +37,9 @@ class ChildPictures(models.Model):
     date = fields.Date("Date of pictures", default=fields.Date.today)
     fname = fields.Char(compute="_compute_filename")
     hname = fields.Char(compute="_compute_filename")
+    content_hash = fields.Char(
+        index=True, readonly=True, help="Hash of the headshot and fullshot"
+    )
     _error_msg = "Image cannot be fetched: No image url available"
 
     ##########################################################################
@@ -67,61 +67,97 @@ class ChildPictures(models.Model):
     ##########################################################################
     #                              ORM METHODS                               #
     ##########################################################################
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         """ Fetch new pictures from GMC webservice when creating
         a new Pictures object. Check if picture is the same as the previous
         and attach the pictures to the last case study.
+        The headshots and fullshots of all pictures are downloaded in
+        parallel.
         """
+        pictures = super().create(vals_list)
+        urls = {
+            picture.id: (
+                picture._get_picture_url("Headshot", width=180, height=180),
+                picture._get_picture_url("Fullshot", width=800, height=1200),
+            )
+            for picture in pictures.filtered("image_url")
+        }
+        images = download_images([url for pair in urls.values() for url in pair])
+
+        to_unlink = self
+        for picture in pictures:
+            headshot_url, fullshot_url = urls.get(picture.id, (False, False))
+            headshot = images.get(headshot_url)
+            fullshot = images.get(fullshot_url)
+            if not headshot or not fullshot:
+                # We could not retrieve a picture, we cancel the creation
+                error_msg = picture._error_msg
+                if picture.image_url:
+                    error_msg = (
+                        "Image cannot be fetched, invalid image url : "
+                        + picture.image_url
+                    )
+                picture.child_id.message_post(
+                    body=_(error_msg), subject=_("Picture update"))
+                to_unlink += picture
+                continue
 
-        pictures = super().create(vals)
-        # Retrieve Headshot
-        image_date = pictures._get_picture("Headshot", width=180, height=180)
-        # Retrieve Fullshot
-        image_date = image_date and pictures._get_picture(
-            "Fullshot", width=800, height=1200
-        )
-        if not image_date:
-            # We could not retrieve a picture, we cancel the creation
-            pictures.child_id.message_post(
-                body=_(pictures._error_msg), subject=_("Picture update"))
-            pictures.unlink()
-            return False
-
-        # Find if same pictures already exist
-        same_pictures = pictures._find_same_picture()
-        if same_pictures:
-            # That case is not likely to happens, it means that the url has
-            #  changed, while the picture stay unchanged.
-            pictures.child_id.message_post(
-                body=_("The picture was the same"), subject=_("Picture update")
+            picture.write(
+                {
+                    "headshot": base64.encodebytes(headshot),
+                    "fullshot": base64.encodebytes(fullshot),
+                    "content_hash": self._get_content_hash(headshot, fullshot),
+                    "date": picture.child_id.last_photo_date or fields.Date.today(),
+                }
             )
-            pictures.unlink()
-            return False
+            # Find if same pictures already exist
+            if picture._find_same_picture():
+                # That case is not likely to happens, it means that the url has
+                #  changed, while the picture stay unchanged.
+                picture.child_id.message_post(
+                    body=_("The picture was the same"), subject=_("Picture update")
+                )
+                to_unlink += picture
 
-        pictures.write({"date": image_date})
-        return pictures
+        to_unlink.unlink()
+        return pictures - to_unlink
 
     ##########################################################################
     #                             PRIVATE METHODS                            #
     ##########################################################################
+    @api.model
+    def _get_content_hash(self, headshot, fullshot):
+        """ Hash used to compare pictures without loading the images. """
+        return hashlib.sha256(
+            hashlib.sha256(headshot).digest() + hashlib.sha256(fullshot).digest()
+        ).hexdigest()
+
+    @api.multi
+    def _compute_missing_hashes(self):
+        """ Stores the hash of the pictures created before it was introduced. """
+        for picture in self.filtered(
+                lambda p: not p.content_hash).with_context(bin_size=False):
+            if picture.headshot and picture.fullshot:
+                picture.content_hash = self._get_content_hash(
+                    base64.b64decode(picture.headshot),
+                    base64.b64decode(picture.fullshot),
+                )
+
     @api.multi
     def _find_same_picture(self):
         self.ensure_one()
-        reference = self.with_context(bin_size=False)
-        pics = reference.search([
+        # The last picture is most probably one that could be the same.
+        pics = self.search([
             ("child_id", "=", self.child_id.id),
             ("id", "!=", self.id)
-        ], limit=1)  # The last picture is most probably one that could be the same.
-        same_pics = pics.filtered(
-            lambda record: record.fullshot == reference.fullshot
-            and record.headshot == reference.headshot
-        )
-        return same_pics
+        ], limit=1)
+        pics._compute_missing_hashes()
+        return pics.filtered(lambda p: p.content_hash == self.content_hash)
 
     @api.multi
-    def _get_picture(self, pic_type="Headshot", width=300, height=400):
-        """ Gets a picture from Compassion webservice """
+    def _get_picture_url(self, pic_type="Headshot", width=300, height=400):
+        """ Gets the url of a picture from Compassion webservice """
         self.ensure_one()
         if pic_type.lower() == "headshot":
             cloudinary = (
@@ -130,30 +166,14 @@ class ChildPictures(models.Model):
         elif pic_type.lower() == "fullshot":
             cloudinary = "w_" + str(width) + ",h_" + str(height) + ",c_fit"
 
-        _image_date = False
-        for picture in self.filtered("image_url"):
-            try:
-                image_split = picture.image_url.split("/")
-                if "upload" in picture.image_url:
-                    ind = image_split.index("upload")
-                else:
-                    ind = image_split.index("media.ci.org")
-                image_split[ind + 1] = cloudinary
-                url = "/".join(image_split)
-
-                data = urlopen(Request(url, None, HEADERS)).read()
-                data = base64.encodebytes(data)
-                _image_date = picture.child_id.last_photo_date or fields.Date.today()
-                if pic_type.lower() == "headshot":
-                    self.headshot = data
-                elif pic_type.lower() == "fullshot":
-                    self.fullshot = data
-            except Exception as e:
-                self._error_msg = (
-                    "Image cannot be fetched, invalid image "
-                    "url : " + picture.image_url
-                )
-                logger.error("Image cannot be fetched : " + picture.image_url)
-                continue
-
-        return _image_date
+        image_split = self.image_url.split("/")
+        try:
+            if "upload" in self.image_url:
+                ind = image_split.index("upload")
+            else:
+                ind = image_split.index("media.ci.org")
+            image_split[ind + 1] = cloudinary
+        except (ValueError, IndexError):
+            logger.error("Image cannot be fetched : " + self.image_url)
+            return False
+        return "/".join(image_split)
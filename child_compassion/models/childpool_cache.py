@@ -0,0 +1,201 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import logging
+
+from odoo.addons.message_center_compassion.tools.onramp_connector import OnrampConnector
+
+from odoo import models, fields, api
+
+logger = logging.getLogger(__name__)
+
+
+class ChildpoolCache(models.Model):
+    """ Local copy of the available children of the global childpool.
+    It is refreshed periodically and allows to search children without
+    calling GMC. The availability of the children is verified when they
+    are put on hold.
+    """
+
+    _name = "compassion.childpool.cache"
+    _inherit = "compassion.generic.child"
+    _description = "Childpool availability cache"
+    _order = "priority_score desc, waiting_days desc"
+
+    global_id = fields.Char(index=True)
+    local_id = fields.Char(index=True)
+    gender = fields.Selection(index=True)
+    birthdate = fields.Date(index=True)
+    birthday_month = fields.Integer(compute="_compute_birthday", store=True, index=True)
+    birthday_day = fields.Integer(compute="_compute_birthday", store=True, index=True)
+    field_office_id = fields.Many2one(store=True, index=True, readonly=True)
+    is_special_needs = fields.Boolean()
+    priority_score = fields.Float(index=True)
+    waiting_days = fields.Integer()
+    holding_global_partner_id = fields.Many2one(
+        "compassion.global.partner", "Holding global partner", readonly=True
+    )
+    hold_expiration_date = fields.Datetime()
+    source_code = fields.Char()
+    refresh_date = fields.Datetime(index=True, readonly=True)
+
+    _sql_constraints = [
+        ("unique_global_id", "unique(global_id)", "The child is already cached.")
+    ]
+
+    @api.multi
+    @api.depends("birthdate")
+    def _compute_birthday(self):
+        for child in self:
+            child.birthday_month = child.birthdate and child.birthdate.month
+            child.birthday_day = child.birthdate and child.birthdate.day
+
+    ##########################################################################
+    #                             PUBLIC METHODS                             #
+    ##########################################################################
+    @api.model
+    def is_enabled(self):
+        return bool(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("child_compassion.childpool_cache")
+        )
+
+    @api.multi
+    def get_global_child_vals(self):
+        """ Get the values for creating compassion.global.child records
+        from the cached children.
+        :return: list of dictionaries, one for each child
+        """
+        field_names = [f for f in self.get_fields() if f != "age"] + [
+            "is_area_hiv_affected",
+            "is_special_needs",
+            "priority_score",
+            "waiting_days",
+            "holding_global_partner_id",
+            "hold_expiration_date",
+            "source_code",
+        ]
+        res = list()
+        for vals in self.read(field_names):
+            del vals["id"]
+            for field_name, value in vals.items():
+                if isinstance(value, tuple):
+                    vals[field_name] = value[0]
+            res.append(vals)
+        return res
+
+    @api.model
+    def forget_children(self, global_ids):
+        """ Removes children from the cache, typically after a hold attempt:
+        either they are now on hold or they are no longer available.
+        :param global_ids: list of child global ids
+        """
+        return self.sudo().search([("global_id", "in", global_ids)]).unlink()
+
+    @api.model
+    def refresh_cache(self):
+        """ Cron fetching the available children of each field office open
+        for the childpool and replacing the cached children with them. """
+        if not self.is_enabled():
+            return True
+        take = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("child_compassion.childpool_cache_size", "200")
+        )
+        field_offices = self.env["compassion.field.office"].search(
+            [("available_on_childpool", "=", True)]
+        )
+        searches = self.env["compassion.childpool.search"].create(
+            [
+                {"field_office_ids": [(6, 0, field_office.ids)], "take": take,
+                 "skip": 0}
+                for field_office in field_offices
+            ]
+        )
+        answers = OnrampConnector().send_messages(
+            [
+                {
+                    "service_name": "beneficiaries/availabilitysearch",
+                    "message_type": "GET",
+                    "params": search.data_to_json("profile_search"),
+                }
+                for search in searches
+            ]
+        )
+        searches.unlink()
+
+        refresh_date = fields.Datetime.now()
+        refreshed_offices = self.env["compassion.field.office"]
+        children_data = list()
+        for field_office, answer in zip(field_offices, answers):
+            content = answer.get("content")
+            if answer.get("code") != 200 or not isinstance(content, dict):
+                # The error body is not always JSON
+                error = content.get("Error") if isinstance(content, dict) \
+                    else content
+                logger.error(
+                    "Childpool cache refresh failed for %s: %s",
+                    field_office.field_office_id,
+                    error or answer.get("Error"),
+                )
+                continue
+            refreshed_offices += field_office
+            children_data.extend(content.get("BeneficiarySearchResponseList") or [])
+        if children_data:
+            self._update_children(children_data, refresh_date)
+
+        # Remove the children that were not found anymore
+        self.search(
+            [
+                ("refresh_date", "<", refresh_date),
+                "|",
+                ("field_office_id", "in", refreshed_offices.ids),
+                ("field_office_id", "=", False),
+            ]
+        ).unlink()
+        self.search(
+            [("field_office_id.available_on_childpool", "=", False)]
+        ).unlink()
+        logger.info("Childpool cache refreshed with %s children", len(children_data))
+        return True
+
+    ##########################################################################
+    #                             PRIVATE METHODS                            #
+    ##########################################################################
+    def _update_children(self, children_data, refresh_date):
+        """ Creates or updates the cached children from the GMC answers.
+        :param children_data: list of JSON data of children
+        :param refresh_date: date of the refresh
+        """
+        children_vals = self.env["compassion.global.child"].json_to_data(
+            children_data, "Childpool Search Response"
+        )
+        if isinstance(children_vals, dict):
+            children_vals = [children_vals]
+        cached = {
+            child.global_id: child
+            for child in self.search(
+                [("global_id", "in", [vals.get("global_id") for vals in children_vals])]
+            )
+        }
+        to_create = dict()
+        for vals in children_vals:
+            vals = {
+                field_name: value
+                for field_name, value in vals.items()
+                if field_name in self._fields and not self._fields[field_name].compute
+            }
+            vals["refresh_date"] = refresh_date
+            child = cached.get(vals.get("global_id"))
+            if child:
+                child.write(vals)
+            else:
+                to_create[vals.get("global_id")] = vals
+        return self.create(list(to_create.values()))
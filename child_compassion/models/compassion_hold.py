@@ -46,6 +46,16 @@ class HoldType(Enum):
         return False
 
 
+# Hold types extended by the hold scheduler instead of expiring
+EXTENDED_HOLD_TYPES = [HoldType.NO_MONEY_HOLD.value, HoldType.SUB_CHILD_HOLD.value]
+# Delay given to GMC for confirming a hold before its removal
+DRAFT_HOLD_DELAY = timedelta(days=1)
+# Delay before retrying to extend a hold refused by GMC
+EXTENSION_RETRY_DELAY = timedelta(days=1)
+# Delay given to GMC for releasing an expired hold before flagging it
+OVERDUE_HOLD_DELAY = timedelta(days=1)
+
+
 class AbstractHold(models.AbstractModel):
     """ Defines the basics of each model that must set up hold values. """
 
@@ -174,6 +184,9 @@ class CompassionHold(models.Model):
     no_money_extension = fields.Integer(
         help="Counts how many time the no money hold was extended."
     )
+    extension_failure_date = fields.Datetime(
+        readonly=True, help="Last time GMC refused to extend the hold."
+    )
 
     # Track field changes
     ambassador = fields.Many2one(track_visibility="onchange", readonly=False)
@@ -189,19 +202,59 @@ class CompassionHold(models.Model):
         ("hold_id", "unique(hold_id)", "The hold already exists in database."),
     ]
 
+    def init(self):
+        # Expiration ordered indexes used by the hold scheduler to find the
+        # due holds without scanning the table.
+        self.env.cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS compassion_hold_active_expiration_index
+            ON compassion_hold (expiration_date) WHERE state = 'active'
+            """
+        )
+        self.env.cr.execute(
+            """
+            CREATE INDEX IF NOT EXISTS compassion_hold_draft_create_index
+            ON compassion_hold (create_date) WHERE state = 'draft'
+            """
+        )
+
     ##########################################################################
     #                              ORM METHODS                               #
     ##########################################################################
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         # Avoid duplicating Holds
-        hold_id = vals.get("hold_id")
-        if hold_id:
-            hold = self.search([("hold_id", "=", hold_id)])
-            if hold:
+        hold_ids = [vals["hold_id"] for vals in vals_list if vals.get("hold_id")]
+        existing = dict()
+        if hold_ids:
+            existing = {
+                hold.hold_id: hold
+                for hold in self.search([("hold_id", "in", hold_ids)])
+            }
+        found = list()  # Existing holds or index of the values to create
+        to_create = list()
+        for vals in vals_list:
+            hold_id = vals.get("hold_id")
+            hold = existing.get(hold_id)
+            if isinstance(hold, int):
+                # Same hold given twice in the call: the last values win
+                to_create[hold].update(vals)
+                found.append(hold)
+            elif hold:
                 hold.write(vals)
-                return hold
-        return super().create(vals)
+                found.append(hold)
+            else:
+                if hold_id:
+                    existing[hold_id] = len(to_create)
+                found.append(len(to_create))
+                to_create.append(dict(vals))
+        new_holds = super().create(to_create) if to_create else self
+        return self.browse(
+            [
+                new_holds[hold].id if isinstance(hold, int) else hold.id
+                for hold in found
+            ]
+        )
 
     @api.multi
     def write(self, vals):
@@ -234,19 +287,25 @@ class CompassionHold(models.Model):
     ##########################################################################
     #                             PUBLIC METHODS                             #
     ##########################################################################
+    @api.model
+    def create_holds(self, children, hold_vals):
+        """
+        Puts children on hold. The holds are sent to GMC in batched requests.
+        :param children: compassion.child recordset
+        :param hold_vals: values of the holds
+        :return: compassion.hold recordset
+        """
+        holds = self.create(
+            [dict(hold_vals, child_id=child.id) for child in children]
+        )
+        holds._send_hold_messages("child_compassion.create_hold")
+        return holds
+
     @api.multi
     def update_hold(self):
-        message_obj = self.env["gmc.message"].with_context(async_mode=False)
-        action_id = self.env.ref("child_compassion.create_hold").id
-        messages = message_obj
-        for hold in self:
-            message_vals = {
-                "action_id": action_id,
-                "object_id": hold.id,
-                "child_id": hold.child_id.id,
-            }
-            messages += message_obj.create(message_vals)
-        messages.process_messages()
+        messages = self.with_context(async_mode=False)._send_hold_messages(
+            "child_compassion.create_hold"
+        )
         failed = messages.filtered(lambda m: "failure" in m.state)
         if failed:
             self.env.cr.rollback()
@@ -365,11 +424,12 @@ class CompassionHold(models.Model):
 
     @api.multi
     def release_hold(self):
-        messages = self.env["gmc.message"].with_context(async_mode=False)
         action_id = self.env.ref("child_compassion.release_hold").id
-
-        for hold in self:
-            messages += messages.create({"action_id": action_id, "object_id": hold.id})
+        messages = (
+            self.env["gmc.message"]
+            .with_context(async_mode=False)
+            .create([{"action_id": action_id, "object_id": hold.id} for hold in self])
+        )
         try:
             messages.process_messages()
             self.hold_released()
@@ -390,34 +450,95 @@ class CompassionHold(models.Model):
         self.mapped("child_id").child_released()
         return True
 
+    @api.model
+    def run_hold_scheduler(self):
+        """
+        Hold scheduler, run frequently by a cron. Using the expiration
+        ordered indexes, it only loads the holds that are due:
+        - draft holds never confirmed by GMC are removed
+        - No Money and SUB holds entering the extension window are extended
+        - other active holds not released by GMC after their expiration date
+          are flagged for a manual check
+        :return: True
+        """
+        self.check_hold_validity()
+        self.postpone_no_money_cron()
+        self.flag_overdue_holds()
+        return True
+
     @api.model
     def check_hold_validity(self):
         """
-        Remove expired holds
+        Remove holds that were never confirmed by GMC
         :return: True
         """
-        holds = self.search([("state", "=", "draft")])
+        holds = self.search(
+            [
+                ("state", "=", "draft"),
+                ("create_date", "<=", datetime.now() - DRAFT_HOLD_DELAY),
+            ]
+        )
         holds.unlink()
         return True
 
     @api.model
     def postpone_no_money_cron(self):
-        # Search for expiring No Money Hold
-        this_week_delay = datetime.now() + timedelta(days=7)
+        # Search for No Money Holds expiring in the extension window
+        window = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("child_compassion.no_money_hold_extension_window", "7")
+        )
+        now = datetime.now()
         holds = self.search(
             [
                 ("state", "=", "active"),
-                ("expiration_date", "<=", this_week_delay),
-                (
-                    "type",
-                    "in",
-                    [HoldType.NO_MONEY_HOLD.value, HoldType.SUB_CHILD_HOLD.value],
-                ),
-            ]
+                # The expiration date of an expired hold can't be changed
+                ("expiration_date", ">=", now),
+                ("expiration_date", "<=", now + timedelta(days=window)),
+                ("type", "in", EXTENDED_HOLD_TYPES),
+                ("no_money_extension", "<", 3),
+                "|",
+                ("extension_failure_date", "=", False),
+                ("extension_failure_date", "<=", now - EXTENSION_RETRY_DELAY),
+            ],
+            order="expiration_date",
         )
         holds.postpone_no_money_hold()
         return True
 
+    @api.model
+    def flag_overdue_holds(self):
+        """
+        Schedules an activity on the active holds that passed their
+        expiration date for some time and are not extended. The holds are
+        not released here: GMC releases them with the hold removal
+        notification, and a late answer of GMC must not release children
+        that are still on hold.
+        :return: True
+        """
+        holds = self.search(
+            [
+                ("state", "=", "active"),
+                ("expiration_date", "<=", datetime.now() - OVERDUE_HOLD_DELAY),
+                "|",
+                ("type", "not in", EXTENDED_HOLD_TYPES),
+                ("no_money_extension", ">=", 3),
+                ("activity_ids", "=", False),
+            ],
+            order="expiration_date",
+        )
+        if holds:
+            logger.info("Hold scheduler flags %s overdue holds", len(holds))
+        for hold in holds:
+            hold.activity_schedule(
+                "mail.mail_activity_data_todo",
+                summary=_("Hold not released"),
+                note=_("The hold expired but GMC did not release it yet."),
+                user_id=hold.primary_owner.id or self.env.uid,
+            )
+        return True
+
     @api.model
     def beneficiary_hold_removal(self, commkit_data):
         data = commkit_data.get("BeneficiaryHoldRemovalNotification")
@@ -451,6 +572,69 @@ class CompassionHold(models.Model):
         hold.hold_released()
         return [hold.id]
 
+    @api.model
+    def beneficiary_hold_removal_batch(self, commkits):
+        """
+        Batch variant of beneficiary_hold_removal, used when GMC sends many
+        notifications at once: holds and children of all notifications are
+        fetched together.
+        :param commkits: list of BeneficiaryHoldRemovalNotification messages
+        :return: list of hold ids for each message
+        """
+        notifications = [
+            commkit_data.get("BeneficiaryHoldRemovalNotification")
+            for commkit_data in commkits
+        ]
+        holds = {
+            hold.hold_id: hold
+            for hold in self.search(
+                [("hold_id", "in", [data.get("HoldID") for data in notifications])]
+            )
+        }
+        children = {
+            child.global_id: child
+            for child in self.env["compassion.child"].search(
+                [
+                    (
+                        "global_id",
+                        "in",
+                        [data.get("Beneficiary_GlobalID") for data in notifications],
+                    )
+                ]
+            )
+        }
+        res = list()
+        to_release = self
+        for data in notifications:
+            hold = holds.get(data.get("HoldID"), self)
+            # avoid realising a hold (and related child) that has already been
+            # released
+            if hold and hold.state == "expired":
+                logger.warning("Received Beneficiary Hold Removal order from GMC for"
+                               "already expired hold.")
+                res.append(hold.ids)
+                continue
+
+            if not hold:
+                child = children.get(data.get("Beneficiary_GlobalID"))
+                if not child:
+                    res.append([-1])
+                    continue
+                hold = child.hold_id
+                if not hold:
+                    hold = self.create(
+                        {
+                            "hold_id": data.get("HoldID"),
+                            "expiration_date": fields.Datetime.now(),
+                            "child_id": child.id,
+                        }
+                    )
+            hold.comments = data.get("NotificationReason")
+            to_release |= hold
+            res.append([hold.id])
+        to_release.hold_released()
+        return res
+
     @api.multi
     def postpone_no_money_hold(self, additional_text=None):
         """
@@ -467,34 +651,161 @@ class CompassionHold(models.Model):
             "{old_expiration} and was extended to {new_expiration}."
             "{additional_text}"
         )
-        for hold in self.filtered(lambda h: h.no_money_extension < 3):
-            hold_extension = (
-                first_extension if not hold.no_money_extension else second_extension
+        # As in write, the expiration date of an expired hold can't be changed
+        now = datetime.now()
+        expired = self.filtered(lambda h: h.expiration_date < now)
+        if expired:
+            logger.error(
+                "Expired no money holds can't be extended: %s",
+                expired.mapped("hold_id"),
             )
-            new_hold_date = hold.expiration_date + timedelta(days=hold_extension)
-            next_extension = hold.no_money_extension
-            if hold.type == HoldType.NO_MONEY_HOLD.value:
-                next_extension += 1
-            hold_vals = {
-                "no_money_extension": next_extension,
+            expired.write({"extension_failure_date": fields.Datetime.now()})
+        to_extend = (self - expired).filtered(lambda h: h.no_money_extension < 3)
+        # Extensions are sent to GMC in batched requests
+        chunk_size = self.env.ref("child_compassion.create_hold").get_batch_size()
+        for i in range(0, len(to_extend), chunk_size):
+            holds = to_extend[i: i + chunk_size]
+            old_values = {
+                hold.id: (hold.expiration_date, hold.no_money_extension)
+                for hold in holds
             }
-            hold_vals["expiration_date"] = new_hold_date
-            old_date = hold.expiration_date
-            hold.write(hold_vals)
-            values = {
-                "local_id": hold.child_id.local_id,
-                "old_expiration": old_date,
-                "new_expiration": new_hold_date.strftime("%d %B %Y"),
-                "additional_text": additional_text or "",
-            }
-            hold.message_post(
-                body=_(body.format(**values)),
-                subject=_("No money hold extension"), type="comment",
+            new_dates = list()
+            next_extensions = list()
+            for hold in holds:
+                hold_extension = (
+                    first_extension if not hold.no_money_extension
+                    else second_extension
+                )
+                new_dates.append(
+                    hold.expiration_date + timedelta(days=hold_extension))
+                next_extension = hold.no_money_extension
+                if hold.type == HoldType.NO_MONEY_HOLD.value:
+                    next_extension += 1
+                next_extensions.append(next_extension)
+            holds._write_expiration_dates(new_dates, next_extensions)
+            messages = holds.with_context(async_mode=False)._send_hold_messages(
+                "child_compassion.create_hold"
+            )
+            failed_messages = messages.filtered(lambda m: "failure" in m.state)
+            failed = holds.browse(failed_messages.mapped("object_id"))
+            if failed:
+                logger.error(
+                    "No money holds couldn't be extended: %s",
+                    "; ".join(failed_messages.mapped("failure_reason")),
+                )
+                # Keep the expiration dates known by GMC
+                failed._write_expiration_dates(
+                    [old_values[hold.id][0] for hold in failed],
+                    [old_values[hold.id][1] for hold in failed],
+                )
+                failed.write({"extension_failure_date": fields.Datetime.now()})
+            extended = holds - failed
+            extended._post_notes(
+                [
+                    _(
+                        body.format(
+                            local_id=hold.child_id.local_id,
+                            old_expiration=old_values[hold.id][0],
+                            new_expiration=hold.expiration_date.strftime("%d %B %Y"),
+                            additional_text=additional_text or "",
+                        )
+                    )
+                    for hold in extended
+                ],
+                _("No money hold extension"),
             )
-            # Commit after hold is updated
+            # Commit after holds are updated
             if not test_mode:
                 self.env.cr.commit()  # pylint:disable=invalid-commit
 
+    ##########################################################################
+    #                             PRIVATE METHODS                            #
+    ##########################################################################
+    @api.multi
+    def _send_hold_messages(self, action_xml_id):
+        """
+        Creates the messages of the holds for the given action and processes
+        them together, so that they are sent to GMC in batched requests of
+        the size configured on the action.
+        :param action_xml_id: xml id of the gmc.action
+        :return: gmc.message recordset
+        """
+        action_id = self.env.ref(action_xml_id).id
+        messages = self.env["gmc.message"].create(
+            [
+                {
+                    "action_id": action_id,
+                    "object_id": hold.id,
+                    "child_id": hold.child_id.id,
+                }
+                for hold in self
+            ]
+        )
+        messages.process_messages()
+        return messages
+
+    @api.multi
+    def _write_expiration_dates(self, expiration_dates, no_money_extensions):
+        """
+        Writes the expiration dates of the holds in one statement, without
+        notifying GMC.
+        :param expiration_dates: list of expiration dates, one for each hold
+        :param no_money_extensions: list of extension counters, one for each
+                                    hold
+        :return: True
+        """
+        if not self:
+            return True
+        self.env.cr.execute(
+            """
+            UPDATE compassion_hold h
+            SET expiration_date = v.expiration_date,
+                no_money_extension = v.no_money_extension,
+                write_uid = %s,
+                write_date = (now() at time zone 'UTC')
+            FROM unnest(%s, %s::timestamp[], %s)
+                AS v(id, expiration_date, no_money_extension)
+            WHERE h.id = v.id
+            """,
+            [
+                self.env.uid,
+                self.ids,
+                [fields.Datetime.to_string(date) for date in expiration_dates],
+                no_money_extensions,
+            ],
+        )
+        field_names = ["expiration_date", "no_money_extension"]
+        self.invalidate_cache(field_names, self.ids)
+        # Update the children hold expiration
+        self.modified(field_names)
+        self.recompute()
+        return True
+
+    @api.multi
+    def _post_notes(self, bodies, subject):
+        """
+        Posts an internal note on each hold, creating all messages at once.
+        :param bodies: list of message bodies, one for each hold
+        :param subject: subject of the notes
+        :return: mail.message recordset
+        """
+        note_id = self.env.ref("mail.mt_note").id
+        author_id = self.env.user.partner_id.id
+        return self.env["mail.message"].create(
+            [
+                {
+                    "model": self._name,
+                    "res_id": hold.id,
+                    "body": body,
+                    "subject": subject,
+                    "message_type": "comment",
+                    "subtype_id": note_id,
+                    "author_id": author_id,
+                }
+                for hold, body in zip(self, bodies)
+            ]
+        )
+
     ##########################################################################
     #                              Mapping METHOD                            #
     ##########################################################################
@@ -11,10 +11,11 @@
 import base64
 import logging
 from datetime import date
-from urllib.request import urlopen
 
 from odoo import models, fields, api
 
+from ..tools.image_cache import ImageCache
+
 logger = logging.getLogger(__name__)
 
 
@@ -133,9 +134,9 @@ class GenericChild(models.AbstractModel):
         odoo_data = super().json_to_data(json, mapping_name)
 
         # Put firstname in preferred_name if not defined
-        preferred_name = odoo_data.get("preferred_name")
-        if not preferred_name:
-            odoo_data["preferred_name"] = odoo_data.get("firstname")
+        for child_data in odoo_data if isinstance(odoo_data, list) else [odoo_data]:
+            if not child_data.get("preferred_name"):
+                child_data["preferred_name"] = child_data.get("firstname")
         return odoo_data
 
     @api.multi
@@ -158,12 +159,28 @@ class GenericChild(models.AbstractModel):
                     logger.error("Wrong child image received: " + str(child.image_url))
 
         if binar:
-            for child in self.filtered("image_url"):
-                url = child.image_url if not thumb else child.thumbnail_url
-                try:
-                    child.portrait = base64.encodebytes(urlopen(url).read())
-                except:
-                    logger.error("Image cannot be fetched : " + str(url))
+            # Images are fetched in parallel and kept in the cache of the worker
+            field_name = "portrait" if thumb else "fullshot"
+            children = self.filtered("image_url")
+            urls = [
+                child.thumbnail_url if thumb else child.image_url
+                for child in children
+            ]
+            images = ImageCache.get_cache().fetch(urls)
+            for child in self - children:
+                child[field_name] = False
+            for child, url in zip(children, urls):
+                data = images.get(url)
+                child[field_name] = data and base64.encodebytes(data)
+
+    @api.multi
+    def prefetch_images(self):
+        """ Starts downloading the pictures of the children in background,
+        so that they are ready when the children are displayed. """
+        children = self.filtered("image_url")
+        ImageCache.get_cache().prefetch(
+            children.mapped("thumbnail_url") + children.mapped("image_url")
+        )
 
 
 class GlobalChild(models.TransientModel):
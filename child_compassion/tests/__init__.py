@@ -1,2 +1,6 @@
 # from . import test_webservice
-from . import test_compassion_hold
\ No newline at end of file
+from . import test_compassion_hold
+from . import test_childpool_cache
+from . import test_image_cache
+from . import test_child_pictures
+from . import test_zip_export
@@ -0,0 +1,103 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import mock
+
+from odoo.tests import TransactionCase
+from ..tools.image_cache import download_images
+
+mock_download_images = (
+    "odoo.addons.child_compassion.models.child_pictures.download_images"
+)
+mock_download = "odoo.addons.child_compassion.tools.image_cache.download_image"
+mock_project_infos = (
+    "odoo.addons.child_compassion.models.project_compassion."
+    "CompassionProject.update_informations"
+)
+
+IMAGE_URL = "https://media.ci.org/image/upload/w_150/ChildPhotos/Published/{}.jpg"
+
+
+class TestChildPictures(TransactionCase):
+
+    @mock.patch(mock_project_infos)
+    def setUp(self, project_infos):
+        super().setUp()
+        self.child = self.env["compassion.child"].create({
+            "local_id": "TE0010001",
+            "global_id": "PICTEST1",
+            "birthdate": "2010-01-01",
+            "project_id": self.env["compassion.project"].create({
+                "fcp_id": "TE001"}).id,
+        })
+        self.pictures_obj = self.env["compassion.child.pictures"]
+
+    @staticmethod
+    def _images(urls):
+        """ The headshot and fullshot of a picture are the same image. """
+        return {url: url.split("/")[-1].encode() for url in urls}
+
+    @mock.patch(mock_download_images)
+    def test_pictures_downloaded_together(self, download):
+        """ The images of all the created pictures are downloaded at once. """
+        download.side_effect = self._images
+        pictures = self.pictures_obj.create([
+            {"child_id": self.child.id, "image_url": IMAGE_URL.format(1)},
+            {"child_id": self.child.id, "image_url": IMAGE_URL.format(2)},
+        ])
+        download.assert_called_once()
+        self.assertEqual(len(download.call_args[0][0]), 4)
+        self.assertEqual(len(pictures), 2)
+        self.assertTrue(all(pictures.mapped("headshot")))
+        self.assertTrue(all(pictures.mapped("fullshot")))
+        self.assertEqual(
+            pictures[0].content_hash,
+            self.pictures_obj._get_content_hash(b"1.jpg", b"1.jpg"))
+
+    @mock.patch(mock_download_images)
+    def test_same_picture_removed(self, download):
+        """ A picture with the same content as the last one is removed,
+        as well as the pictures that could not be fetched. """
+        download.side_effect = self._images
+        picture = self.pictures_obj.create({
+            "child_id": self.child.id, "image_url": IMAGE_URL.format(1)})
+        self.assertTrue(picture)
+        same = self.pictures_obj.create({
+            "child_id": self.child.id,
+            "image_url": IMAGE_URL.format(1).replace("Published", "Other"),
+        })
+        self.assertFalse(same)
+
+        download.side_effect = lambda urls: dict.fromkeys(urls)
+        self.assertFalse(self.pictures_obj.create({
+            "child_id": self.child.id, "image_url": IMAGE_URL.format(2)}))
+        self.assertEqual(
+            self.pictures_obj.search([("child_id", "=", self.child.id)]),
+            picture)
+
+    def test_missing_hashes_computed(self):
+        """ The hash of pictures stored without one is computed when
+        looking for the same picture. """
+        with mock.patch(mock_download_images, side_effect=self._images):
+            picture = self.pictures_obj.create({
+                "child_id": self.child.id, "image_url": IMAGE_URL.format(1)})
+        content_hash = picture.content_hash
+        picture.content_hash = False
+        picture._compute_missing_hashes()
+        self.assertEqual(picture.content_hash, content_hash)
+
+    @mock.patch(mock_download)
+    def test_download_images(self, download):
+        """ Each url is downloaded once and failures are returned as None. """
+        download.side_effect = lambda url: None if url == "c" else url.encode()
+        self.assertEqual(
+            download_images(["a", "b", "a", False, "c"]),
+            {"a": b"a", "b": b"b", "c": None},
+        )
+        self.assertEqual(download.call_count, 3)
+        self.assertEqual(download_images([False]), {})
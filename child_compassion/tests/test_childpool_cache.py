@@ -0,0 +1,90 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import calendar
+import mock
+from datetime import date
+
+from odoo.exceptions import UserError
+from odoo.tests import TransactionCase
+
+mock_update_informations = (
+    "odoo.addons.child_compassion.models.project_compassion"
+    ".CompassionProject.update_informations"
+)
+mock_onramp = (
+    "odoo.addons.child_compassion.wizards.global_child_search.OnrampConnector"
+)
+
+
+class TestChildpoolCache(TransactionCase):
+
+    @mock.patch(mock_update_informations)
+    def setUp(self, update_informations):
+        super().setUp()
+        project = self.env["compassion.project"].create({"fcp_id": "BD0123"})
+        cache_obj = self.env["compassion.childpool.cache"]
+        self.children = cache_obj.create([
+            {
+                "global_id": str(1000 + i),
+                "local_id": "BD0123%05d" % i,
+                "name": "Child %s" % i,
+                "gender": "F" if i % 2 else "M",
+                "birthdate": date(2015, 1 + i % 12, 1 + i),
+                "priority_score": i,
+                "project_id": project.id,
+            }
+            for i in range(10)
+        ])
+        self.search = self.env["compassion.childpool.search"].create(
+            {"use_cache": True, "take": 3}
+        )
+
+    def test_search_cache(self):
+        """ Searches use the priority order of the cache and skip the
+        children already selected. """
+        self.search.write({"gender": "Female"})
+        self.search.do_search()
+        self.assertEqual(self.search.nb_found, 5)
+        self.assertEqual(
+            self.search.global_child_ids.mapped("global_id"),
+            ["1009", "1007", "1005"])
+        self.search.add_search()
+        self.assertEqual(len(self.search.global_child_ids), 5)
+        self.assertRaises(UserError, self.search.add_search)
+
+    def test_365_mix_cache(self):
+        self.search.do_365_mix()
+        self.assertEqual(len(self.search.global_child_ids), 10)
+        days = 366 if calendar.isleap(date.today().year) else 365
+        self.assertEqual(len(self.search.missing_dates.split()), days - 10)
+
+    def test_forget_children(self):
+        self.env["compassion.childpool.cache"].forget_children(["1000", "1001"])
+        self.assertEqual(len(self.children.exists()), 8)
+
+    @mock.patch(mock_onramp)
+    def test_search_many_failed_answer(self, onramp):
+        """ Answers without a JSON error body don't abort the other queries,
+        and an error is raised only if all the queries failed. """
+        onramp.return_value.send_messages.return_value = [
+            {"code": 502, "content": "<html>Bad Gateway</html>"},
+            {"code": 500, "content": {"Message": "Unknown"}},
+            {"code": 200, "content": {"NumberOfBeneficiaries": 0,
+                                      "BeneficiarySearchResponseList": []}},
+        ]
+        search = self.env["compassion.childpool.search"].create({})
+        results = search.search_many([{"take": 1}, {"take": 2}, {"take": 3}])
+        self.assertEqual(len(results), 3)
+        self.assertFalse(search.global_child_ids)
+
+        onramp.return_value.send_messages.return_value = [
+            {"code": 502, "content": "<html>Bad Gateway</html>"},
+        ]
+        with self.assertRaisesRegex(UserError, "Bad Gateway"):
+            search.search_many([{"take": 1}])
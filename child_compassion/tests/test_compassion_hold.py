@@ -35,3 +35,71 @@ class TestHold(TransactionCase):
         })
 
         self.assertRaises(UserError, test_hold.write, {"expiration_date": datetime.now()})
+
+    @mock.patch(mock_update_hold)
+    def test_batch_create_and_expiration(self, update_hold):
+        """
+        Holds are created in batch without duplicates and their expiration
+        dates are written at once
+        """
+        update_hold.return_value = True
+        hold_obj = self.env["compassion.hold"]
+        holds = hold_obj.create([{"hold_id": "H1"}, {"hold_id": "H2"}])
+        self.assertEqual(len(holds), 2)
+        same_holds = hold_obj.create([{"hold_id": "H2"}, {"hold_id": "H1"}])
+        self.assertEqual(same_holds.ids, holds.ids[::-1])
+        repeated_holds = hold_obj.create([
+            {"hold_id": "H3", "channel": "web"},
+            {"hold_id": "H3", "channel": "ambassador"},
+        ])
+        self.assertEqual(len(repeated_holds), 2)
+        self.assertEqual(len(set(repeated_holds.ids)), 1)
+        self.assertEqual(repeated_holds[0].channel, "ambassador")
+
+        new_dates = [datetime(2030, 1, 1), datetime(2030, 2, 1)]
+        holds._write_expiration_dates(new_dates, [1, 2])
+        self.assertEqual(holds.mapped("expiration_date"), new_dates)
+        self.assertEqual(holds.mapped("no_money_extension"), [1, 2])
+
+    @mock.patch(mock_update_hold)
+    def test_hold_scheduler_flags_overdue_holds(self, update_hold):
+        """
+        The hold scheduler never releases holds: the active holds that are
+        overdue and not extended are only flagged with an activity
+        """
+        update_hold.return_value = True
+        hold_obj = self.env["compassion.hold"]
+        due_hold = hold_obj.create({"state": "active"})
+        future_hold = hold_obj.create({"state": "active"})
+        no_money_hold = hold_obj.create(
+            {"state": "active", "type": "No Money Hold"})
+        past = datetime.now() - relativedelta(days=2)
+        (due_hold + no_money_hold)._write_expiration_dates([past, past], [0, 0])
+
+        with mock.patch.object(type(hold_obj), "postpone_no_money_cron"):
+            hold_obj.run_hold_scheduler()
+            hold_obj.run_hold_scheduler()
+        self.assertEqual(due_hold.state, "active")
+        self.assertEqual(len(due_hold.activity_ids), 1)
+        self.assertFalse(future_hold.activity_ids)
+        self.assertFalse(no_money_hold.activity_ids)
+
+    @mock.patch(mock_update_hold)
+    def test_expired_holds_not_extended(self, update_hold):
+        """
+        No money holds that already expired are not extended
+        """
+        update_hold.return_value = True
+        hold_obj = self.env["compassion.hold"]
+        hold = hold_obj.create(
+            {"state": "active", "type": "No Money Hold", "hold_id": "H4"})
+        past = datetime.now() - relativedelta(hours=1)
+        hold._write_expiration_dates([past], [0])
+
+        with mock.patch.object(type(hold_obj), "_send_hold_messages") as send:
+            hold_obj.postpone_no_money_cron()
+            hold.postpone_no_money_hold()
+        send.assert_not_called()
+        self.assertEqual(hold.expiration_date, past.replace(microsecond=0))
+        self.assertEqual(hold.no_money_extension, 0)
+        self.assertTrue(hold.extension_failure_date)
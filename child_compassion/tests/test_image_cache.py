@@ -0,0 +1,65 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import mock
+
+from odoo.tests import TransactionCase
+from ..tools.image_cache import ImageCache
+
+mock_download = "odoo.addons.child_compassion.tools.image_cache.download_image"
+mock_prefetch = (
+    "odoo.addons.child_compassion.tools.image_cache.ImageCache.prefetch"
+)
+
+IMAGE_URL = "https://media.ci.org/image/upload/w_150/ChildPhotos/Published/{}.jpg"
+
+
+class TestImageCache(TransactionCase):
+
+    @mock.patch(mock_download)
+    def test_least_recently_used_evicted(self, download):
+        """ The least recently used images are evicted when the cache is
+        full, and images bigger than the cache are not kept. """
+        download.side_effect = lambda url: url.encode() * 10
+        cache = ImageCache()
+        cache.max_size = 25
+        self.assertEqual(
+            cache.fetch(["a", "b"]), {"a": b"a" * 10, "b": b"b" * 10})
+        # "a" becomes the most recently used image
+        self.assertEqual(cache.get("a"), b"a" * 10)
+        cache.fetch(["c"])
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"a" * 10)
+        self.assertEqual(cache._size, 20)
+
+        cache.fetch(["a", "c"])
+        self.assertEqual(download.call_count, 3)
+        self.assertEqual(cache.fetch(["big"]), {"big": None})
+        self.assertEqual(cache._size, 20)
+
+    @mock.patch(mock_download)
+    def test_failed_download_not_cached(self, download):
+        download.return_value = None
+        cache = ImageCache()
+        self.assertEqual(cache.fetch(["a", False]), {"a": None})
+        cache.fetch(["a"])
+        self.assertEqual(download.call_count, 2)
+
+    @mock.patch(mock_prefetch)
+    def test_prefetch_images(self, prefetch):
+        """ The thumbnails and pictures of the children are downloaded in
+        background. """
+        children = self.env["compassion.global.child"].create([
+            {"global_id": "IMG1", "image_url": IMAGE_URL.format(1)},
+            {"global_id": "IMG2"},
+        ])
+        children.prefetch_images()
+        urls = prefetch.call_args[0][0]
+        self.assertEqual(len(urls), 2)
+        self.assertIn(IMAGE_URL.format(1), urls)
+        self.assertIn(children[0].thumbnail_url, urls)
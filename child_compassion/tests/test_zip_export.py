@@ -0,0 +1,85 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import io
+import os
+from zipfile import ZipFile
+
+from odoo.tests.common import HttpCase
+from ..tools.zip_export import ZipExport, get_download_action, EXPORT_DIR
+
+
+class TestZipExport(HttpCase):
+    def setUp(self):
+        super().setUp()
+        self.attachment_obj = self.env["ir.attachment"]
+        self.env["res.users"].create({
+            "name": "Zip Export Portal",
+            "login": "zip_export_portal",
+            "password": "zip_export_portal",
+            "groups_id": [(6, 0, [self.env.ref("base.group_portal").id])],
+        })
+
+    def _export(self, filename="test.zip"):
+        with ZipExport(self.env, filename) as export:
+            export.writestr("first.txt", b"first")
+            export.writestr("second.txt", b"second")
+        return export
+
+    def test_export(self):
+        """ The archive is written in the filestore and attached. """
+        export = self._export()
+        attachment = export.attachment
+        self.assertEqual(export.count, 2)
+        self.assertEqual(attachment.datas_fname, "test.zip")
+        self.assertEqual(attachment.mimetype, "application/zip")
+        self.assertTrue(attachment.store_fname.startswith(EXPORT_DIR + "/"))
+        path = attachment._full_path(attachment.store_fname)
+        with ZipFile(path) as archive:
+            self.assertEqual(archive.namelist(), ["first.txt", "second.txt"])
+            self.assertEqual(archive.read("second.txt"), b"second")
+        self.assertEqual(
+            get_download_action(attachment)["url"],
+            "/child_compassion/export/%s" % attachment.id,
+        )
+
+    def test_export_nothing_written(self):
+        """ No attachment is created for an empty or a failed export, and
+        the archive is removed from the filestore. """
+        with ZipExport(self.env, "empty.zip") as export:
+            pass
+        self.assertFalse(export.attachment)
+        self.assertFalse(
+            os.path.exists(self.attachment_obj._full_path(export._store_fname)))
+
+        with self.assertRaises(ValueError):
+            with ZipExport(self.env, "failed.zip") as export:
+                export.writestr("first.txt", b"first")
+                raise ValueError()
+        self.assertFalse(export.attachment)
+        self.assertFalse(
+            os.path.exists(self.attachment_obj._full_path(export._store_fname)))
+
+    def test_download_export(self):
+        """ The archive is streamed to the users allowed to read it. """
+        attachment = self._export().attachment
+        url = get_download_action(attachment)["url"]
+
+        self.authenticate("zip_export_portal", "zip_export_portal")
+        response = self.url_open(url)
+        self.assertNotEqual(response.status_code, 200)
+
+        self.authenticate("admin", "admin")
+        response = self.url_open(url)
+        self.assertEqual(response.status_code, 200)
+        with ZipFile(io.BytesIO(response.content)) as archive:
+            self.assertEqual(archive.read("first.txt"), b"first")
+
+        response = self.url_open("/child_compassion/export/%s" % (
+            attachment.id + 1000))
+        self.assertEqual(response.status_code, 404)
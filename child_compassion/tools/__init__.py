@@ -0,0 +1,2 @@
+from . import image_cache
+from . import zip_export
@@ -0,0 +1,170 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from odoo.tools.config import config
+
+_logger = logging.getLogger(__name__)
+
+# This User-Agent simulate a browser, so that the fetch is not blocked
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows; U; Windows NT 5.1; en-US; rv:1.9.0.7) "
+                  "Gecko/2009021910 Firefox/3.0.7"
+}
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """ Returns the HTTP session of the worker, sharing a pool of connections
+    to the image servers between all the downloads. """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = int(config.get("child_image_fetch_workers") or 8)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            _session = requests.Session()
+            _session.headers.update(HEADERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def download_image(url):
+    """
+    Downloads an image with the shared session.
+    :param url: image url
+    :return: image data or None if the image cannot be fetched
+    """
+    try:
+        response = get_session().get(url, timeout=30)
+        response.raise_for_status()
+        return response.content
+    except requests.RequestException:
+        _logger.error("Image cannot be fetched : %s", url)
+        return None
+
+
+def download_images(urls):
+    """
+    Downloads images in parallel with the shared session.
+    :param urls: list of image urls
+    :return: dictionary {url: data}, data being None for the images that
+             cannot be fetched
+    """
+    urls = list({url for url in urls if url})
+    if not urls:
+        return dict()
+    max_workers = min(len(urls), int(config.get("child_image_fetch_workers") or 8))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(urls, executor.map(download_image, urls)))
+
+
+class ImageCache(object):
+    """ Cache of the child images of the worker, keyed by image URL.
+
+    Missing images are downloaded in parallel by background threads and the
+    least recently used images are evicted when the cache is full.
+    Settings are read from the Odoo configuration file:
+
+    - child_image_cache_size: memory used by the cache in MB (default 64)
+    - child_image_fetch_workers: number of parallel downloads (default 8)
+    - child_image_fetch_timeout: maximum seconds a request waits for the
+      missing images (default 5). The images not received in time are still
+      downloaded in background for the next requests.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.max_size = int(config.get("child_image_cache_size") or 64) * 1024 ** 2
+        self.timeout = float(config.get("child_image_fetch_timeout") or 5)
+        self._images = OrderedDict()
+        self._size = 0
+        self._pending = dict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(config.get("child_image_fetch_workers") or 8),
+            thread_name_prefix="child.image",
+        )
+
+    @classmethod
+    def get_cache(cls):
+        """ Returns the image cache of the worker. """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def get(self, url):
+        """
+        :param url: image url
+        :return: the image data or None if it is not in the cache
+        """
+        with self._lock:
+            data = self._images.get(url)
+            if data is not None:
+                self._images.move_to_end(url)
+            return data
+
+    def prefetch(self, urls):
+        """
+        Starts downloading in background the images missing in the cache.
+        :param urls: list of image urls
+        :return: dictionary {url: future} of the images being downloaded
+        """
+        futures = dict()
+        with self._lock:
+            for url in set(urls):
+                if not url or url in self._images:
+                    continue
+                future = self._pending.get(url)
+                if future is None:
+                    future = self._executor.submit(self._download, url)
+                    self._pending[url] = future
+                futures[url] = future
+        return futures
+
+    def fetch(self, urls, timeout=None):
+        """
+        Gets images from the cache, downloading the missing ones in parallel.
+        :param urls: list of image urls
+        :param timeout: maximum seconds to wait for the missing images
+        :return: dictionary {url: data}, data being None for the images
+                 that could not be fetched in time
+        """
+        futures = self.prefetch(urls)
+        if futures:
+            wait(list(futures.values()), self.timeout if timeout is None else timeout)
+        return {url: self.get(url) for url in urls if url}
+
+    def _download(self, url):
+        data = download_image(url)
+        with self._lock:
+            self._pending.pop(url, None)
+            if (
+                data is not None
+                and url not in self._images
+                and len(data) <= self.max_size
+            ):
+                self._images[url] = data
+                self._size += len(data)
+                while self._size > self.max_size:
+                    evicted = self._images.popitem(last=False)[1]
+                    self._size -= len(evicted)
+        return data
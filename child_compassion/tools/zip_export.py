@@ -0,0 +1,90 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import os
+import tempfile
+from zipfile import ZipFile
+
+# Sub-directory of the filestore holding the exported archives
+EXPORT_DIR = "exports"
+
+
+def get_download_action(attachment):
+    """
+    :param attachment: ir.attachment of an archive created by ZipExport
+    :return: action streaming the archive to the browser
+    """
+    return {
+        "type": "ir.actions.act_url",
+        "url": "/child_compassion/export/%s" % attachment.id,
+        "target": "self",
+    }
+
+
+class ZipExport(object):
+    """ ZIP archive written directly in the filestore and stored in an
+    attachment, so that big exports are never held in memory.
+
+    Usage::
+
+        with ZipExport(env, "pictures.zip", wizard) as export:
+            export.writestr("picture.jpg", data)
+            export.write("/path/to/file.pdf", "letter.pdf")
+        attachment = export.attachment
+
+    The attachment stays empty if nothing was written in the archive.
+    """
+
+    def __init__(self, env, filename, record=None):
+        self.env = env
+        self.filename = filename
+        self.record = record
+        self.attachment = env["ir.attachment"]
+        self.count = 0
+        self._store_fname = None
+        self._zip_file = None
+
+    def __enter__(self):
+        attachment_obj = self.env["ir.attachment"]
+        directory = attachment_obj._full_path(EXPORT_DIR)
+        os.makedirs(directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="export_", dir=directory)
+        os.close(fd)
+        self._store_fname = EXPORT_DIR + "/" + os.path.basename(path)
+        # The file is removed by the garbage collector of the filestore
+        # if the transaction is rolled back.
+        attachment_obj._mark_for_gc(self._store_fname)
+        self._zip_file = ZipFile(path, "w")
+        return self
+
+    def writestr(self, fname, data):
+        """ Adds a file in the archive from its content. """
+        self._zip_file.writestr(fname, data)
+        self.count += 1
+
+    def write(self, path, fname):
+        """ Adds a file in the archive from a file on disk. """
+        self._zip_file.write(path, fname)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._zip_file.close()
+        if exc_type is not None or not self.count:
+            os.remove(self.env["ir.attachment"]._full_path(self._store_fname))
+            return False
+        self.attachment = self.env["ir.attachment"].create(
+            {
+                "name": self.filename,
+                "datas_fname": self.filename,
+                "store_fname": self._store_fname,
+                "mimetype": "application/zip",
+                "res_model": self.record and self.record._name,
+                "res_id": self.record and self.record.id,
+            }
+        )
+        return False
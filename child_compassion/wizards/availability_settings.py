@@ -21,12 +21,25 @@ class AvailabilitySettings(models.TransientModel):
     e_commerce_hold_duration = fields.Integer(help="In Minutes")
     no_money_hold_duration = fields.Integer(help="In Days")
     no_money_hold_extension = fields.Integer(help="In Days")
+    no_money_hold_extension_window = fields.Integer(
+        help="In Days. No money holds expiring in this window are extended."
+    )
     reinstatement_hold_duration = fields.Integer(help="In Days")
     reservation_duration = fields.Integer(help="In Days")
     reservation_hold_duration = fields.Integer(help="In Days")
     sponsor_cancel_hold_duration = fields.Integer(help="In Days")
     sub_child_hold_duration = fields.Integer(help="In Days")
 
+    # Childpool cache
+    childpool_cache = fields.Boolean(
+        "Search in local childpool",
+        help="Keep a local copy of the available children, refreshed "
+             "periodically, and use it for the childpool searches.",
+    )
+    childpool_cache_size = fields.Integer(
+        "Cached children per field office"
+    )
+
     @api.multi
     def set_values(self):
         super().set_values()
@@ -46,6 +59,10 @@ class AvailabilitySettings(models.TransientModel):
             "child_compassion.no_money_hold_extension",
             str(self.no_money_hold_extension),
         )
+        config.set_param(
+            "child_compassion.no_money_hold_extension_window",
+            str(self.no_money_hold_extension_window),
+        )
         config.set_param(
             "child_compassion.reinstatement_hold_duration",
             str(self.reinstatement_hold_duration),
@@ -65,6 +82,12 @@ class AvailabilitySettings(models.TransientModel):
             "child_compassion.sub_child_hold_duration",
             str(self.sub_child_hold_duration),
         )
+        config.set_param(
+            "child_compassion.childpool_cache", "1" if self.childpool_cache else ""
+        )
+        config.set_param(
+            "child_compassion.childpool_cache_size", str(self.childpool_cache_size)
+        )
 
     @api.model
     def get_values(self):
@@ -83,6 +106,10 @@ class AvailabilitySettings(models.TransientModel):
         res["no_money_hold_extension"] = int(
             param_obj.get_param("child_compassion.no_money_hold_extension", "15")
         )
+        res["no_money_hold_extension_window"] = int(
+            param_obj.get_param(
+                "child_compassion.no_money_hold_extension_window", "7")
+        )
         res["reinstatement_hold_duration"] = int(
             param_obj.get_param("child_compassion.reinstatement_hold_duration", "15")
         )
@@ -98,5 +125,11 @@ class AvailabilitySettings(models.TransientModel):
         res["sub_child_hold_duration"] = int(
             param_obj.get_param("child_compassion.sub_child_hold_duration", "30")
         )
+        res["childpool_cache"] = bool(
+            param_obj.get_param("child_compassion.childpool_cache")
+        )
+        res["childpool_cache_size"] = int(
+            param_obj.get_param("child_compassion.childpool_cache_size", "200")
+        )
 
         return res
@@ -44,36 +44,30 @@ class ChildHoldWizard(models.TransientModel):
     ##########################################################################
     @api.multi
     def send(self):
-        holds = self.env["compassion.hold"]
+        hold_obj = self.env["compassion.hold"]
+        holds = hold_obj
         child_search = (
             self.env["compassion.childpool.search"]
                 .browse(self.env.context.get("active_id"))
                 .global_child_ids
         )
-        chunk_size = 10
+        hold_vals = self.get_hold_values()
+        # Each chunk of holds is sent to GMC in one request
+        chunk_size = self.env.ref("child_compassion.create_hold").get_batch_size()
         for i in range(0, len(child_search), chunk_size):
             _logger.debug(f"Processing chunk {i} for sending hold requests")
+            global_children = child_search[i: i + chunk_size]
             try:
-                messages = self.env["gmc.message"]
-                for child in child_search[i: i + chunk_size]:
-                    # Save children form global children to compassion children
-                    child_comp = self.env["compassion.child"].create(
-                        child.get_child_vals()
-                    )
-
-                    # Create Holds for children to reserve
-                    hold_vals = self.get_hold_values()
-                    hold_vals["child_id"] = child_comp.id
-                    hold = holds.create(hold_vals)
-                    holds += hold
-
-                    # Create messages to send to Connect
-                    action_id = self.env.ref("child_compassion.create_hold").id
-
-                    messages += messages.create(
-                        {"action_id": action_id, "object_id": hold.id}
-                    )
-                messages.process_messages()
+                # Save children form global children to compassion children
+                children = self.env["compassion.child"].create(
+                    [child.get_child_vals() for child in global_children]
+                )
+                # Create Holds for children to reserve and send them to Connect
+                holds += hold_obj.create_holds(children, hold_vals)
+                # The hold request validated the availability of the children
+                self.env["compassion.childpool.cache"].forget_children(
+                    global_children.mapped("global_id")
+                )
                 if not testing:
                     self.env.cr.commit()  # pylint: disable=invalid-commit
             except:
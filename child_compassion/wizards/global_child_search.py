@@ -7,6 +7,7 @@
 #    The licence is in the file __manifest__.py
 #
 ##############################################################################
+import logging
 import sys
 from datetime import datetime, timedelta, date
 from math import ceil
@@ -18,6 +19,8 @@ from odoo.addons.queue_job.job import job
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
+_logger = logging.getLogger(__name__)
+
 
 class GlobalChildSearch(models.TransientModel):
     """
@@ -123,6 +126,13 @@ class GlobalChildSearch(models.TransientModel):
              "of a Field Office restriction configuration.",
     )
     missing_dates = fields.Text(help="All birthdates not found when using 365 search")
+    use_cache = fields.Boolean(
+        "Search in local childpool",
+        default=lambda s: s.env["compassion.childpool.cache"].is_enabled(),
+        help="Search children in the local copy of the childpool instead of "
+             "calling GMC. Their availability is verified when they are put "
+             "on hold. Advanced criteria always use GMC.",
+    )
 
     ##########################################################################
     #                             FIELDS METHODS                             #
@@ -189,7 +199,9 @@ class GlobalChildSearch(models.TransientModel):
         self.global_child_ids.unlink()
         # Skip value must be set before the search (with_context)
         self.skip = self.env.context.get("skip_value", 0)
-        if not self.advanced_criteria_used:
+        if self._use_cache():
+            self._search_cache(self._get_cache_domain(), offset=self.skip)
+        elif not self.advanced_criteria_used:
             self._call_search_service(
                 "profile_search",
                 "beneficiaries/availabilitysearch",
@@ -209,6 +221,10 @@ class GlobalChildSearch(models.TransientModel):
     @api.multi
     def add_search(self):
         self.ensure_one()
+        if self._use_cache():
+            # Children already selected are excluded from the cache search
+            self._search_cache(self._get_cache_domain())
+            return True
         self.skip += self.nb_selected
         if not self.advanced_criteria_used:
             self._call_search_service(
@@ -237,6 +253,9 @@ class GlobalChildSearch(models.TransientModel):
         # countries)
         if self.skip == 0:
             self.skip = 50000
+        if self._use_cache():
+            self._search_cache(self._get_cache_domain(criteria=False))
+            return True
         self._call_search_service(
             "rich_mix", "beneficiaries/richmix", "BeneficiaryRichMixResponseList"
         )
@@ -280,77 +299,76 @@ class GlobalChildSearch(models.TransientModel):
         Tries to find an even number of children for each country.
         :return:
         """
-        country_codes = (
-            self.env["compassion.field.office"].search([]).mapped("field_office_id")
+        if self._use_cache():
+            return self._country_mix_cache()
+        field_offices = self.env["compassion.field.office"].search(
+            [("available_on_childpool", "=", True)]
         )
-        children_by_country = {
-            code: self.env["compassion.global.child"] for code in country_codes
-        }
-        max_per_country = ceil(float(self.take) / len(country_codes))
-        found_children = self.env["compassion.global.child"]
-        children_already_seen = self.env["compassion.global.child"]
-        nb_found = 0
-        tries = 0
-        while nb_found < self.take:
-            children_already_seen += self.global_child_ids
-            self.take_more()
-            for child in self.global_child_ids - children_already_seen:
-                child_country = child.local_id[0:2]
-                country_pool = children_by_country.get(child_country)
-                if country_pool is not None and len(country_pool) < max_per_country:
-                    children_by_country[child_country] = country_pool + child
-                    found_children += child
-                    nb_found += 1
-                if nb_found == self.take:
-                    break
-            self.skip += self.take
-            tries += 1
-            if tries > 5:
-                raise UserError(
-                    _(
-                        "Cannot find enough available children in all "
-                        "countries. Try with less"
-                    )
+        if not field_offices:
+            raise UserError(_("No field office is available on the childpool."))
+        max_per_country = ceil(float(self.take) / len(field_offices))
+        self.global_child_ids.unlink()
+        # One query per country, sent concurrently
+        results = self.search_many(
+            [
+                {
+                    "field_office_ids": [(6, 0, field_office.ids)],
+                    "take": max_per_country,
+                    "skip": 0,
+                }
+                for field_office in field_offices
+            ]
+        )
+        found_children = sum(results, self.env["compassion.global.child"])
+        if len(found_children) < self.take:
+            raise UserError(
+                _(
+                    "Cannot find enough available children in all "
+                    "countries. Try with less"
                 )
+            )
 
         # Delete leftover children
-        (self.global_child_ids - found_children).unlink()
+        found_children.sorted("priority_score", reverse=True)[self.take:].unlink()
         return True
 
     @api.multi
     def do_365_mix(self):
         """ Try to find one child per day of the year having his birthdate
         on that date."""
+        if self._use_cache():
+            return self._365_mix_cache()
         today = date.today()
-        first_day = today.replace(day=1, month=1)
+        current_date = today.replace(day=1, month=1)
         last_day = today.replace(day=31, month=12)
-        current_date = first_day
-        # First step as regular search
+        birthdates = list()
+        while current_date <= last_day:
+            birthdates.append(current_date)
+            current_date += relativedelta(days=1)
+        self.global_child_ids.unlink()
         self.write(
             {
-                "birthday_day": 1,
-                "birthday_month": 1,
+                "birthday_day": False,
+                "birthday_month": False,
                 "take": 1,
                 "missing_dates": "",
                 "skip": 0,
             }
         )
-        self.do_search()
-        while current_date < last_day:
-            # Next steps: add child to the search result
-            current_date += relativedelta(days=1)
-            self.write(
-                {
-                    "birthday_day": current_date.day,
-                    "birthday_month": current_date.month,
-                    "skip": 0,
-                }
-            )
-            try:
-                self.add_search()
-            except UserError:
-                # No children found on that date: displays it.
-                self.missing_dates += current_date.strftime("%d.%m\n")
+        # One query per day of the year, sent concurrently
+        results = self.search_many(
+            [
+                {"birthday_day": birthdate.day, "birthday_month": birthdate.month}
+                for birthdate in birthdates
+            ]
+        )
+        # No children found on that date: displays it.
+        self.missing_dates = "".join(
+            birthdate.strftime("%d.%m\n")
+            for birthdate, children in zip(birthdates, results)
+            if not children
+        )
+        return True
 
     @api.multi
     def filter(self):
@@ -364,6 +382,9 @@ class GlobalChildSearch(models.TransientModel):
     @api.multi
     def take_more(self):
         self.ensure_one()
+        if self._use_cache():
+            self._search_cache(self._get_cache_domain(criteria=False))
+            return True
         # Use rich mix
         self._call_search_service(
             "rich_mix", "beneficiaries/richmix", "BeneficiaryRichMixResponseList"
@@ -400,6 +421,52 @@ class GlobalChildSearch(models.TransientModel):
         )
         holds.send()
 
+    @api.multi
+    def search_many(self, queries):
+        """
+        Runs several searches in the global childpool concurrently. Each
+        query uses the criteria of the current search, overridden by the
+        given values. The children found are added to the search results,
+        without duplicates.
+
+        :param queries: list of dictionaries with the criteria values of each
+                        query (ex: {"birthday_day": 1, "birthday_month": 1})
+        :return: list with the children found by each query
+                 (compassion.global.child recordsets)
+        """
+        self.ensure_one()
+        messages = list()
+        # A single copy of the search receives the criteria of each query
+        query_search = self.copy(
+            {"global_child_ids": [(6, 0, [])], "search_filter_ids": False})
+        criteria = {key for query in queries for key in query}
+        default_criteria = {
+            key: self._fields[key].convert_to_write(self[key], self)
+            for key in criteria
+        }
+        for query in queries:
+            query_search.write(dict(default_criteria, **query))
+            if query_search.advanced_criteria_used:
+                query_search.compute_advanced_search()
+                messages.append(
+                    {
+                        "service_name": "beneficiaries/availabilityquery",
+                        "message_type": "POST",
+                        "body": query_search.data_to_json("advanced_search"),
+                    }
+                )
+            else:
+                messages.append(
+                    {
+                        "service_name": "beneficiaries/availabilitysearch",
+                        "message_type": "GET",
+                        "params": query_search.data_to_json("profile_search"),
+                    }
+                )
+        query_search.unlink()
+        answers = OnrampConnector().send_messages(messages)
+        return self._add_search_results(answers, "BeneficiarySearchResponseList")
+
     def compute_advanced_search(self):
         self.ensure_one()
         # Remove all search filters
@@ -564,30 +631,241 @@ class GlobalChildSearch(models.TransientModel):
             result = onramp.send_message(service_name, method, params)
         else:
             result = onramp.send_message(service_name, method, None, params)
-        if result["code"] == 200:
-            self.nb_found = result["content"].get("NumberOfBeneficiaries", 0)
-
-            if not result["content"][result_name]:
-                raise UserError(_("No children found meeting criterias"))
-            new_children = self.env["compassion.global.child"]
-            for child_data in result["content"][result_name]:
-                child_vals = new_children.json_to_data(
-                    child_data, "Childpool Search Response"
-                )
+        if result["code"] == 200 and isinstance(result.get("content"), dict) \
+                and not result["content"].get(result_name):
+            raise UserError(_("No children found meeting criterias"))
+        self._add_search_results([result], result_name)
+
+    def _add_search_results(self, answers, result_name):
+        """
+        Creates the children found by the search services in one batch and
+        adds them to the search results. Children already in the results
+        or found by several searches are only added once.
+        :param answers: list of answers of the search services
+        :param result_name: Name of the wrapping tag for the answer
+        :return: list with the new children of each answer
+        """
+        global_child_obj = self.env["compassion.global.child"]
+        known_ids = set(self.global_child_ids.mapped("global_id"))
+        children_data = list()
+        answer_indexes = list()
+        errors = list()
+        nb_found = 0
+        for index, answer in enumerate(answers):
+            content = answer.get("content")
+            if answer.get("code") != 200 or not isinstance(content, dict):
+                # The error body is not always JSON
+                error = content.get("Error") if isinstance(content, dict) \
+                    else content
+                if isinstance(error, dict):
+                    error = error.get("ErrorMessage")
+                errors.append(
+                    error or answer.get("Error") or _("Childpool search failed"))
+                continue
+            nb_found += answer["content"].get("NumberOfBeneficiaries", 0)
+            for child_data in answer["content"].get(result_name) or []:
+                global_id = child_data.get("Beneficiary_GlobalID")
+                if global_id not in known_ids:
+                    known_ids.add(global_id)
+                    children_data.append(child_data)
+                    answer_indexes.append(index)
+        if errors and len(errors) == len(answers):
+            raise UserError(errors[0])
+        for error in errors:
+            _logger.error("Childpool search failed: %s", error)
+        self.nb_found = nb_found
+
+        vals_list = list()
+        if children_data:
+            vals_list = global_child_obj.json_to_data(
+                children_data, "Childpool Search Response"
+            )
+            if isinstance(vals_list, dict):
+                vals_list = [vals_list]
+        # Don't create the children of field offices restricted on childpool
+        allowed_project_ids = (
+            self.env["compassion.project"]
+            .browse(
+                list({vals["project_id"] for vals in vals_list if vals.get("project_id")})
+            )
+            .filtered("field_office_id.available_on_childpool")
+            .ids
+        )
+        create_vals = list()
+        create_indexes = list()
+        for child_vals, index in zip(vals_list, answer_indexes):
+            if child_vals.get("project_id") in allowed_project_ids:
                 child_vals["search_view_id"] = self.id
-                new_children += self.env["compassion.global.child"].create(child_vals)
-            restricted_children = new_children - new_children.filtered(
-                "field_office_id.available_on_childpool"
+                create_vals.append(child_vals)
+                create_indexes.append(index)
+        self.nb_restricted_children = len(vals_list) - len(create_vals)
+        new_children = global_child_obj.create(create_vals)
+        results = [global_child_obj] * len(answers)
+        for child, index in zip(new_children, create_indexes):
+            results[index] += child
+        self.global_child_ids += new_children
+        new_children.prefetch_images()
+        return results
+
+    def _use_cache(self):
+        """ Advanced criteria are not stored in the childpool cache. """
+        return self.use_cache and not self.advanced_criteria_used
+
+    def _get_cache_domain(self, criteria=True, birthday=True):
+        """
+        Translates the search criteria in a domain for the childpool cache.
+        :param criteria: set to False to ignore the search criteria
+        :param birthday: set to False to ignore the birthday criteria
+        :return: domain for compassion.childpool.cache
+        """
+        domain = [("field_office_id.available_on_childpool", "=", True)]
+        if self.global_child_ids:
+            domain.append(
+                ("global_id", "not in", self.global_child_ids.mapped("global_id"))
             )
-            new_children -= restricted_children
-            self.nb_restricted_children = len(restricted_children)
-            restricted_children.unlink()
-            self.global_child_ids += new_children
-        else:
-            error = result.get("content", result)["Error"]
-            if isinstance(error, dict):
-                error = error.get("ErrorMessage")
-            raise UserError(error)
+        if not criteria:
+            return domain
+        today = date.today()
+        if self.gender:
+            domain.append(("gender", "=", self.gender[0]))
+        if self.field_office_ids:
+            domain.append(("field_office_id", "in", self.field_office_ids.ids))
+        if self.fcp_ids:
+            domain.append(("project_id", "in", self.fcp_ids.ids))
+        if self.fcp_name:
+            domain.append(("project_id.name", "ilike", self.fcp_name))
+        if self.child_name:
+            domain.append(("name", "ilike", self.child_name))
+        if self.hiv_affected_area:
+            domain.append(("is_area_hiv_affected", "=", True))
+        if self.is_orphan:
+            domain.append(("is_orphan", "=", True))
+        if self.has_special_needs:
+            domain.append(("is_special_needs", "=", True))
+        if self.min_age:
+            domain.append(
+                ("birthdate", "<=", today - relativedelta(years=self.min_age))
+            )
+        if self.max_age:
+            domain.append(
+                ("birthdate", ">", today - relativedelta(years=self.max_age + 1))
+            )
+        if self.min_days_waiting:
+            domain.append(("waiting_days", ">=", self.min_days_waiting))
+        if birthday and self.birthday_month:
+            domain.append(("birthday_month", "=", self.birthday_month))
+        if birthday and self.birthday_day:
+            domain.append(("birthday_day", "=", self.birthday_day))
+        if birthday and self.birthday_year:
+            domain.extend([
+                ("birthdate", ">=", date(self.birthday_year, 1, 1)),
+                ("birthdate", "<=", date(self.birthday_year, 12, 31)),
+            ])
+        return domain
+
+    def _search_cache(self, domain, offset=0):
+        """
+        Adds the children of the childpool cache matching the domain to the
+        search results.
+        :param domain: domain for compassion.childpool.cache
+        :param offset: number of matching children to skip
+        :return: compassion.childpool.cache records found
+        """
+        cache_obj = self.env["compassion.childpool.cache"]
+        self.nb_found = cache_obj.search_count(domain)
+        # The cache holds only a part of the global childpool: don't skip
+        # all the children it contains.
+        if offset >= self.nb_found:
+            offset = 0
+        children = cache_obj.search(domain, offset=offset, limit=self.take)
+        if not children:
+            raise UserError(_("No children found meeting criterias"))
+        self._add_cached_children(children)
+        return children
+
+    def _add_cached_children(self, children):
+        vals_list = children.get_global_child_vals()
+        for vals in vals_list:
+            vals["search_view_id"] = self.id
+        new_children = self.env["compassion.global.child"].create(vals_list)
+        self.global_child_ids += new_children
+        new_children.prefetch_images()
+
+    def _country_mix_cache(self):
+        """ Country mix done with the childpool cache in one query per
+        field office. """
+        self.global_child_ids.unlink()
+        cache_obj = self.env["compassion.childpool.cache"]
+        field_offices = self.env["compassion.field.office"].search(
+            [("available_on_childpool", "=", True)]
+        )
+        if not field_offices:
+            raise UserError(_("No field office is available on the childpool."))
+        max_per_country = ceil(float(self.take) / len(field_offices))
+        domain = self._get_cache_domain(criteria=False)
+        children = cache_obj
+        for field_office in field_offices:
+            children += cache_obj.search(
+                domain + [("field_office_id", "=", field_office.id)],
+                limit=max_per_country,
+            )
+        if len(children) < self.take:
+            raise UserError(
+                _("Cannot find enough available children in all countries. Try "
+                  "with less")
+            )
+        self._add_cached_children(
+            children.sorted("priority_score", reverse=True)[: self.take]
+        )
+        return True
+
+    def _365_mix_cache(self):
+        """ 365 mix done with the childpool cache: takes the child with the
+        best priority for each birthday in one query. """
+        self.global_child_ids.unlink()
+        self.write(
+            {
+                "birthday_day": False,
+                "birthday_month": False,
+                "take": 1,
+                "missing_dates": "",
+                "skip": 0,
+            }
+        )
+        cache_obj = self.env["compassion.childpool.cache"]
+        candidates = cache_obj.search(
+            self._get_cache_domain(birthday=False) + [("birthdate", "!=", False)]
+        )
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT ON (birthday_month, birthday_day) id
+            FROM compassion_childpool_cache
+            WHERE id = ANY(%s)
+            ORDER BY birthday_month, birthday_day, priority_score DESC,
+                     waiting_days DESC
+            """,
+            [candidates.ids],
+        )
+        children = cache_obj.browse([row[0] for row in self.env.cr.fetchall()])
+        found_children = {
+            (child.birthday_month, child.birthday_day): child for child in children
+        }
+        today = date.today()
+        current_date = today.replace(day=1, month=1)
+        last_day = today.replace(day=31, month=12)
+        selected = cache_obj
+        missing_dates = ""
+        while current_date <= last_day:
+            child = found_children.get((current_date.month, current_date.day))
+            if child:
+                selected += child
+            else:
+                missing_dates += current_date.strftime("%d.%m\n")
+            current_date += relativedelta(days=1)
+        self.write({"missing_dates": missing_dates, "nb_found": len(selected)})
+        if selected:
+            self._add_cached_children(selected)
+        return True
 
     def _does_match(self, child):
         """ Returns if the selected criterias correspond to the given child.
@@ -41,7 +41,9 @@
         "security/gmc_groups.xml",
         "security/ir.model.access.csv",
         "data/query_operators.xml",
+        "data/gmc_message_batch_cron.xml",
         "views/gmc_message_view.xml",
+        "views/gmc_message_stat_view.xml",
         "views/advanced_query_view.xml",
         "views/compassion_mapping_view.xml",
         "views/import_json_mapping_view.xml",
@@ -10,9 +10,12 @@
 import json
 import logging
 
+from psycopg2 import IntegrityError
+
 from odoo import http, exceptions
 from odoo.exceptions import ValidationError
 from odoo.http import request
+from ..tools.ingest_buffer import IngestBuffer
 from ..tools.onramp_connector import OnrampConnector
 
 _logger = logging.getLogger(__name__)
@@ -48,58 +51,67 @@ class RestController(http.Controller):
             "Timestamp": request.timestamp,
             "code": 200,
         }
-        action_connect = (
-            request.env["gmc.action.connect"]
-            .sudo(request.uid)
-            .search([("connect_schema", "=", message_type)])
-        )
-        if not action_connect:
-            try:
-                action_connect = (
-                    request.env["gmc.action.connect"]
-                    .sudo(request.uid)
-                    .create({"connect_schema": message_type})
-                )
-            except ValidationError:
-                action_connect = (
-                    request.env["gmc.action.connect"]
-                    .sudo(request.uid)
-                    .search([("connect_schema", "=", message_type)])
-                )
-
-        action = action_connect.action_id
+        connect_id, action_id, ignored = self._get_action_connect(message_type)
+        buffered = IngestBuffer.enabled()
         params = {
             "request_id": request.uuid,
             "headers": json.dumps(dict(headers.items())),
-            "content": json.dumps(request.jsonrequest, indent=4, sort_keys=True),
-            "state": "success" if action_connect.ignored else "new",
+            # The raw body is kept in high throughput mode
+            "content": request.httprequest.get_data(as_text=True) if buffered
+            else json.dumps(request.jsonrequest, indent=4, sort_keys=True),
+            "state": "success" if ignored else "new",
         }
 
-        if action.id:
-            params["action_id"] = action.id
+        if action_id:
+            params["action_id"] = action_id
             result["Message"] = "Your message was successfully received."
         else:
             params["direction"] = "in"
-            if action_connect.ignored:
+            if ignored:
                 _logger.warning("Ignored message type received: " + message_type)
                 result["Message"] = "Ignored message type - not processed."
             else:
                 _logger.warning("Unknown message type received: " + message_type)
                 result["Message"] = "Unknown message type - not processed."
 
-        request.env["gmc.message"].sudo(request.uid).create(params)
+        if buffered:
+            # The message is saved in the inbox before it is confirmed to GMC
+            # and stored later with other received messages. The buffer is
+            # notified once the message is visible to its flush.
+            request.env["gmc.message.inbox"].sudo().store(request.uid, params)
+            request.env.cr.after("commit", IngestBuffer.get(request.db).notify)
+        else:
+            request.env["gmc.message"].sudo(request.uid).create(params)
 
         return result
 
+    def _get_action_connect(self, message_type):
+        """
+        Finds the action for the received message type, creating the message
+        type if it is received for the first time.
+        :param message_type: x-cim-MessageType header
+        :return: tuple (gmc.action.connect id, gmc.action id, ignored)
+        """
+        connect_obj = request.env["gmc.action.connect"].sudo(request.uid)
+        action_connect = connect_obj.get_schema_action(message_type)
+        if not action_connect:
+            try:
+                with request.env.cr.savepoint():
+                    connect_obj.create({"connect_schema": message_type})
+            except (ValidationError, IntegrityError):
+                # The message type was created by a concurrent request
+                connect_obj.clear_caches()
+            action_connect = connect_obj.get_schema_action(message_type)
+        return action_connect
+
     def _validate_headers(self, headers):
         from_address = headers.get("x-cim-FromAddress") or headers.get(
             "X-Cim-Fromaddress"
         )
         if from_address not in AUTHORIZED_SENDERS:
             raise exceptions.AccessDenied()
-        company_obj = request.env["res.company"].sudo(request.uid)
-        companies = company_obj.search([])
-        country_codes = companies.mapped("partner_id.country_id.code")
+        country_codes = request.env["res.company"].sudo(
+            request.uid).get_gmc_country_codes()
         to_address = headers.get("x-cim-ToAddress") or headers.get("X-Cim-ToAddress")
         if to_address not in country_codes:
             raise AttributeError("This message is not for me.")
@@ -2,6 +2,9 @@ from . import compassion_mapped_model
 from . import compassion_mapping
 from . import field_to_json
 from . import gmc_message
+from . import gmc_message_batch
+from . import gmc_message_inbox
+from . import gmc_message_stat
 from . import gmc_action
 from . import gmc_action_connect
 from . import ir_http
@@ -9,3 +12,4 @@ from . import connect_multipicklist
 from . import advanced_query
 from . import queue_job
 from . import res_partner_test
+from . import res_company
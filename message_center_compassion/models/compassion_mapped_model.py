@@ -11,7 +11,8 @@ from odoo import models, api, _
 from odoo.exceptions import UserError
 
 from odoo.addons.message_center_compassion.tools.onramp_connector import OnrampConnector
-from odoo.addons.message_center_compassion.models.field_to_json import RelationNotFound
+from odoo.addons.message_center_compassion.models.field_to_json import \
+    RelationNotFound, RelationalIndex
 
 
 class MappingKeyNotFound(UserError):
@@ -39,24 +40,29 @@ class CompassionMappedModel(models.AbstractModel):
                              if not specified.
         :return: A dictionary or list with the json field name and the data.
         """
-        search_criterias = [("model_id.model", "=", self._name)]
-        if mapping_name:
-            search_criterias.append(("name", "=", mapping_name))
-        mapping = (
-            self.env["compassion.mapping"].sudo().search(search_criterias, limit=1)
+        plan = self.env["compassion.mapping"]._get_mapping_plan(
+            self._name, mapping_name
         )
-        result = list()
-        for record in self:
-            json = {}
-            for json_spec in mapping.json_spec_ids.filtered(
-                    lambda jspec: not jspec.exclude_from_json
-            ):
-                if json_spec.sub_mapping_id:
+        specs = [spec for spec in plan.specs if not spec.exclude_from_json]
+        json_specs = (
+            self.env["compassion.field.to.json"]
+            .sudo()
+            .browse([spec.spec_id for spec in specs])
+        )
+        # Read the mapped fields for the whole recordset at once instead of
+        # letting each record fetch its values.
+        for spec in specs:
+            if spec.odoo_field and not spec.sub_mapping_name:
+                self.mapped(spec.odoo_field)
+        result = [{} for record in self]
+        for json_spec, spec in zip(json_specs, specs):
+            if spec.sub_mapping_name:
+                for i, record in enumerate(self):
                     sub_record = record
-                    if json_spec.field_name:
+                    if spec.field_name:
                         # Take the relational field as base for mapping
                         # conversion
-                        sub_record = record.mapped(json_spec.field_name)
+                        sub_record = record.mapped(spec.field_name)
                         if not hasattr(sub_record, "data_to_json"):
                             raise UserError(
                                 _(
@@ -65,24 +71,22 @@ class CompassionMappedModel(models.AbstractModel):
                                     "mappings."
                                 )
                             )
-                    json[json_spec.json_name] = sub_record.data_to_json(
-                        json_spec.sub_mapping_id.name
+                    result[i][spec.json_name] = sub_record.data_to_json(
+                        spec.sub_mapping_name
                     )
-                else:
-                    # Calls the conversion function defined in field_to_json
-                    odoo_field = json_spec.field_name
-                    if json_spec.relational_field_id:
-                        odoo_field = (
-                            json_spec.relational_field_id.name + "." + odoo_field
-                        )
+            else:
+                # Calls the conversion function defined in field_to_json
+                values = list()
+                for record in self:
                     value = None
-                    if odoo_field:
-                        value = record.mapped(odoo_field)
+                    if spec.odoo_field:
+                        value = record.mapped(spec.odoo_field)
                         # Unwrap single values
                         if isinstance(value, list) and len(value) == 1:
                             value = value[0]
-                    json.update(json_spec.to_json(value))
-            result.append(json)
+                    values.append(value)
+                for json, json_value in zip(result, json_spec.to_json_values(values)):
+                    json.update(json_value)
         return result[0] if len(result) == 1 else result
 
     @api.model
@@ -96,39 +100,57 @@ class CompassionMappedModel(models.AbstractModel):
                              if not specified.
         :return: A list or a dictionary with the odoo field name and the data.
         """
-        search_criterias = [("model_id.model", "=", self._name)]
-        if mapping_name:
-            search_criterias.append(("name", "=", mapping_name))
-        mapping = self.env["compassion.mapping"].search(search_criterias, limit=1)
-        all_fields = mapping.json_spec_ids.filtered("field_id")
-        res = []
+        plan = self.env["compassion.mapping"]._get_mapping_plan(
+            self._name, mapping_name
+        )
+        specs = [spec for spec in plan.specs if spec.has_field]
+        all_fields = self.env["compassion.field.to.json"].browse(
+            [spec.spec_id for spec in specs]
+        )
         if not isinstance(json, list):
             json = [json]
-        for single_json in json:
-            data = {}
-            for json_spec in all_fields:
-                for attempt in range(10):  # try x attempts, avoid while loop
-                    try:
-                        json_value = single_json.get(json_spec.json_name)
-                        if json_spec.sub_mapping_id and json_value:
-                            # Convert data using sub_mapping
-                            sub_model = self.env[
-                                json_spec.sub_mapping_id.model_id.model
-                            ]
-                            sub_data = sub_model.json_to_data(
-                                json_value, json_spec.sub_mapping_id.name
-                            )
-                            data.update(json_spec.from_json(sub_data))
-                        else:
-                            data.update(json_spec.from_json(json_value))
-                        break  # break from attempts if successful
-                    except RelationNotFound as e:
-                        self.fetch_missing_relational_records(
-                            e.field_relation, e.field_name, e.value, e.json_name
-                        )
-            res.append(data)
+        res = [{} for single_json in json]
+        for json_spec in all_fields:
+            json_values = [
+                single_json.get(json_spec.json_name) for single_json in json
+            ]
+            if json_spec.sub_mapping_id:
+                # Convert data using sub_mapping
+                sub_model = self.env[json_spec.sub_mapping_id.model_id.model]
+                json_values = [
+                    sub_model.json_to_data(json_value, json_spec.sub_mapping_id.name)
+                    if json_value else json_value
+                    for json_value in json_values
+                ]
+            for data, odoo_data in zip(
+                    res, self._convert_json_values(json_spec, json_values)):
+                data.update(odoo_data)
         return res[0] if len(res) == 1 and not isinstance(res[0], tuple) else res
 
+    def _convert_json_values(self, json_spec, json_values):
+        """
+        Converts all the JSON values of a field specification, fetching the
+        missing relational records when needed.
+        :param json_spec: compassion.field.to.json record
+        :param json_values: list of JSON values
+        :return: list of odoo data (dict), one for each JSON value
+        """
+        for attempt in range(10):  # try x attempts, avoid while loop
+            try:
+                return json_spec.from_json_values(json_values)
+            except RelationNotFound as e:
+                self.fetch_missing_relational_records(
+                    e.field_relation, e.field_name, e.value, e.json_name
+                )
+        # Skip only the values that still can't be converted
+        res = []
+        for json_value in json_values:
+            try:
+                res.append(json_spec.from_json(json_value))
+            except RelationNotFound:
+                res.append({})
+        return res
+
     def fetch_missing_relational_records(self, field_relation, field_name, values,
                                          json_name):
         """ Fetch missing relational records in various languages.
@@ -145,7 +167,6 @@ class CompassionMappedModel(models.AbstractModel):
         :type json_name: str
 
         """
-        onramp = OnrampConnector()
         # mapping of languages for translations
         languages_map = {
             "English": "en_US",
@@ -184,15 +205,18 @@ class CompassionMappedModel(models.AbstractModel):
                     "missing relational records"
                 ) % (self._name)
             )
+        # The index of the relation is outdated by the records created below
+        RelationalIndex.get(self.env).forget(field_relation)
         # transform values to list first
         if not isinstance(values, list):
             values = [values]
         # go over all missing values, keep count of index to know which translation
         # to take from onramp result
+        relation_obj = self.env[field_relation].sudo()
+        created_records = list()
         for i, value in enumerate(values):
             # check if hobby/household duty, etc... exists in our database
             search_vals = [(field_name, "=", value)]
-            relation_obj = self.env[field_relation].sudo()
             if hasattr(relation_obj, "value"):
                 # Useful for connect.multipicklist objects
                 search_vals.insert(0, "|")
@@ -200,28 +224,50 @@ class CompassionMappedModel(models.AbstractModel):
             search_count = relation_obj.search_count(search_vals)
             # if not exist, then create it
             if not search_count:
-                value_record = (
-                    relation_obj.create({field_name: value, "value": value})
+                created_records.append(
+                    (i, relation_obj.create({field_name: value, "value": value}))
                 )
-                if not hasattr(relation_obj, "value"):
-                    return
-                # fetch translations for connect.multipicklist values
-                must_manually_translate = False
-                for lang_literal, lang_context in languages_map.items():
-                    result = onramp.send_message(
-                        endpoint.format(getattr(self, id_), lang_literal), "GET"
-                    )
-                    if content_key in result.get("content", {}):
-                        content = result["content"][content_key][0]
-                        if json_name in content:
-                            content_values = content[json_name]
-                            if not isinstance(content_values, list):
-                                content_values = [content_values]
-                            translation = content_values[i]
-                            if translation == value_record.value:
-                                must_manually_translate = True
-                            value_record.with_context(
-                                lang=lang_context
-                            ).value = translation
-                if must_manually_translate:
-                    value_record.assign_translation()
+        if not created_records or not hasattr(relation_obj, "value"):
+            return
+        # fetch translations for connect.multipicklist values, the kits in all
+        # languages are downloaded once for all the missing values.
+        kits = self._fetch_translated_kits(
+            [endpoint.format(getattr(self, id_), lang_literal)
+             for lang_literal in languages_map.keys()]
+        )
+        for i, value_record in created_records:
+            must_manually_translate = False
+            for lang_context, result in zip(languages_map.values(), kits):
+                if content_key in result.get("content", {}):
+                    content = result["content"][content_key][0]
+                    if json_name in content:
+                        content_values = content[json_name]
+                        if not isinstance(content_values, list):
+                            content_values = [content_values]
+                        if len(content_values) <= i:
+                            continue
+                        translation = content_values[i]
+                        if translation == value_record.value:
+                            must_manually_translate = True
+                        value_record.with_context(
+                            lang=lang_context
+                        ).value = translation
+            if must_manually_translate:
+                value_record.assign_translation()
+
+    def _fetch_translated_kits(self, urls):
+        """
+        Downloads concurrently the kits from GMC that are needed to translate
+        missing relational values. The answers are kept for the rest of the
+        import, so that other missing values reuse them.
+        :param urls: list of GMC services to call
+        :return: list of the GMC answers, in the same order as the urls
+        """
+        kits = RelationalIndex.get(self.env).translated_kits
+        to_fetch = [url for url in urls if url not in kits]
+        if to_fetch:
+            results = OnrampConnector().send_messages([
+                {"service_name": url, "message_type": "GET"} for url in to_fetch
+            ])
+            kits.update(zip(to_fetch, results))
+        return [kits[url] for url in urls]
@@ -7,9 +7,27 @@
 #    The licence is in the file __manifest__.py
 #
 ##############################################################################
-from odoo import models, fields, api, _
+from collections import namedtuple
+
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError, ValidationError
 
+# Compiled representation of a mapping, which is cached in the registry.
+# It holds only plain values so that it can be shared between environments.
+MappingPlan = namedtuple("MappingPlan", ["mapping_id", "name", "specs"])
+SpecPlan = namedtuple(
+    "SpecPlan",
+    [
+        "spec_id",
+        "json_name",
+        "field_name",
+        "odoo_field",
+        "sub_mapping_name",
+        "exclude_from_json",
+        "has_field",
+    ],
+)
+
 
 class CompassionMapping(models.Model):
     _name = "compassion.mapping"
@@ -31,6 +49,57 @@ class CompassionMapping(models.Model):
         readonly=False,
     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.clear_caches()
+        return super().create(vals_list)
+
+    @api.multi
+    def write(self, vals):
+        self.clear_caches()
+        return super().write(vals)
+
+    @api.multi
+    def unlink(self):
+        self.clear_caches()
+        return super().unlink()
+
+    @api.model
+    @tools.ormcache("model_name", "mapping_name")
+    def _get_mapping_plan(self, model_name, mapping_name=None):
+        """
+        Compiles the mapping of a model into a plan that can be applied on
+        whole recordsets. The plan is built once and kept in the registry
+        cache until a mapping or a field specification is modified.
+
+        :param model_name: Name of the mapped model
+        :param mapping_name: Name of the mapping to be used.
+                             Will select the first mapping found for the model
+                             if not specified.
+        :return: MappingPlan namedtuple
+        """
+        search_criterias = [("model_id.model", "=", model_name)]
+        if mapping_name:
+            search_criterias.append(("name", "=", mapping_name))
+        mapping = self.sudo().search(search_criterias, limit=1)
+        specs = list()
+        for json_spec in mapping.json_spec_ids:
+            odoo_field = json_spec.field_name or False
+            if odoo_field and json_spec.relational_field_id:
+                odoo_field = json_spec.relational_field_id.name + "." + odoo_field
+            specs.append(
+                SpecPlan(
+                    spec_id=json_spec.id,
+                    json_name=json_spec.json_name,
+                    field_name=json_spec.field_name or False,
+                    odoo_field=odoo_field,
+                    sub_mapping_name=json_spec.sub_mapping_id.name or False,
+                    exclude_from_json=json_spec.exclude_from_json,
+                    has_field=bool(json_spec.field_id),
+                )
+            )
+        return MappingPlan(mapping.id, mapping.name, tuple(specs))
+
     @api.model
     def create_from_json(self, json):
         """
@@ -8,13 +8,28 @@
 #
 ##############################################################################
 import logging
+import weakref
 
-from odoo import models, fields, _
-from odoo.exceptions import UserError
-from odoo.tools import safe_eval
+from psycopg2 import OperationalError
+from werkzeug.exceptions import HTTPException
+
+from odoo import models, fields, api, _
+from odoo.exceptions import (
+    UserError, except_orm, AccessDenied, RedirectWarning, Warning as OdooWarning
+)
+from odoo.tools.safe_eval import test_expr, unsafe_eval, _SAFE_OPCODES, _BUILTINS
 
 _logger = logging.getLogger(__name__)
 
+# Compiled conversion snippets of the mappings, keyed by their source code.
+_conversion_codes = {}
+
+# JSON values sent by GMC that must be considered as empty
+INVALID_JSON_VALUES = ("null", "false", "none", "other", "unknown")
+
+# Field types that can be matched case-insensitively in the relational index
+INDEXABLE_TYPES = ("char", "text", "selection", "integer")
+
 
 class RelationNotFound(UserError):
     def __init__(self, msg, **kwargs):
@@ -25,6 +40,120 @@ class RelationNotFound(UserError):
         self.field_name = kwargs['field_name']
 
 
+class RelationalIndex(object):
+    """ Case-insensitive index of the relational records found by the JSON
+    conversion. One index is kept per database cursor and discarded at the
+    end of the transaction, so that the values of a relation are searched
+    only once while importing several records. Values that are not found are
+    not kept, since their records can be created later in the transaction. """
+
+    # Index of each opened cursor
+    _indexes = weakref.WeakKeyDictionary()
+
+    def __init__(self):
+        # {(model, field, lang, uid): {lowered value: tuple of ids}}
+        self._records = {}
+        # {model: set of ids created through the index}
+        self._created = {}
+        # {GMC service url: answer} of the kits fetched to translate values
+        self.translated_kits = {}
+
+    @classmethod
+    def get(cls, env):
+        """ Returns the index of the current transaction. """
+        cr = env.cr
+        index = cls._indexes.get(cr)
+        if index is None:
+            index = cls._indexes[cr] = cls()
+            cr.after("commit", lambda: cls._indexes.pop(cr, None))
+            cr.after("rollback", lambda: cls._indexes.pop(cr, None))
+        return index
+
+    @staticmethod
+    def _key(value):
+        return str(value).lower()
+
+    def _index(self, model, field_name):
+        """ Index of the values of a field, which depend on the language and
+        the user (access rules) of the lookup. """
+        return self._records.setdefault(
+            (model._name, field_name, model.env.context.get("lang"), model.env.uid),
+            {})
+
+    def lookup(self, model, field_name, values):
+        """
+        Finds the records matching the given values, searching all values
+        that are not yet indexed with a single query.
+        :param model: relational model
+        :param field_name: field used to match the values
+        :param values: list of values to find
+        :return: dict {lowered value: tuple of ids}, with an empty tuple for
+                 the values not found
+        """
+        index = self._index(model, field_name)
+        keys = {self._key(val): val for val in values if val}
+        missing = [val for key, val in keys.items() if key not in index]
+        if missing:
+            domain = ["|"] * (2 * len(missing) - 1)
+            for val in missing:
+                domain.extend([(field_name, "=", val), (field_name, "=ilike", str(val))])
+            found = {}
+            for record in model.search(domain):
+                found.setdefault(self._key(record[field_name]), []).append(record.id)
+            for key, ids in found.items():
+                index[key] = tuple(ids)
+        return {key: index.get(key, ()) for key in keys}
+
+    def search(self, model, field_name, value):
+        """ Returns the recordset matching a single value. """
+        if not value:
+            return model
+        return model.browse(self.lookup(model, field_name, [value])[self._key(value)])
+
+    def create_missing(self, model, field_name, values):
+        """
+        Creates in one call the records for the values not found in the index.
+        :return: recordset of created records
+        """
+        found = self.lookup(model, field_name, values)
+        to_create = {}
+        for val in values:
+            key = self._key(val)
+            if val and not found[key] and key not in to_create:
+                to_create[key] = {field_name: val}
+        if not to_create:
+            return model
+        records = model.create(list(to_create.values()))
+        index = self._index(model, field_name)
+        for key, record in zip(to_create.keys(), records):
+            index[key] = (record.id,)
+        self._created.setdefault(model._name, set()).update(records.ids)
+        return records
+
+    def refresh(self, model):
+        """
+        Drops the created records that were rolled back (i.e. by a
+        savepoint) since their creation.
+        """
+        created = self._created.get(model._name)
+        if not created:
+            return
+        valid_ids = set(model.browse(list(created)).exists().ids)
+        for key, index in self._records.items():
+            if key[0] != model._name:
+                continue
+            for value, ids in list(index.items()):
+                if not valid_ids.issuperset(set(ids).intersection(created)):
+                    del index[value]
+        self._created[model._name] = valid_ids
+
+    def forget(self, model_name):
+        """ Removes all indexed values of a model. """
+        for key in [key for key in self._records if key[0] == model_name]:
+            del self._records[key]
+        self._created.pop(model_name, None)
+
+
 class FieldToJson(models.Model):
     """ This model is used to make a link between odoo
         field and GMC Connect Json field name for the compassion mapping
@@ -113,6 +242,76 @@ class FieldToJson(models.Model):
         ("unique", "unique(mapping_id,json_name)", _("This field is already mapped"))
     ]
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Invalidate the compiled mapping plans
+        self.clear_caches()
+        return super().create(vals_list)
+
+    @api.multi
+    def write(self, vals):
+        self.clear_caches()
+        if "to_json_conversion" in vals or "from_json_conversion" in vals:
+            self._clear_conversion_codes()
+        return super().write(vals)
+
+    @api.multi
+    def unlink(self):
+        self.clear_caches()
+        self._clear_conversion_codes()
+        return super().unlink()
+
+    @api.multi
+    def _clear_conversion_codes(self):
+        for json_spec in self:
+            _conversion_codes.pop(json_spec.to_json_conversion, None)
+            _conversion_codes.pop(json_spec.from_json_conversion, None)
+
+    @staticmethod
+    def _eval_conversion(source, eval_context):
+        """
+        Evaluates a conversion snippet in the same restricted environment as
+        safe_eval, but compiles the snippet only once per worker.
+        :param source: python expression of the conversion
+        :param eval_context: dict of the values available in the expression
+        :return: result of the expression
+        """
+        code = _conversion_codes.get(source)
+        if code is None:
+            code = test_expr(source, _SAFE_OPCODES, mode="eval")
+            _conversion_codes[source] = code
+        globals_dict = dict(eval_context, __builtins__=_BUILTINS)
+        try:
+            return unsafe_eval(code, globals_dict)
+        except (except_orm, OdooWarning, RedirectWarning, AccessDenied,
+                HTTPException, OperationalError, ZeroDivisionError):
+            # Same exceptions as safe_eval: the serialization failures must
+            # reach Odoo for the transaction to be retried.
+            raise
+        except Exception as e:
+            raise ValueError(
+                '%s: "%s" while evaluating\n%r' % (type(e), e, source)) from e
+
+    def to_json_values(self, odoo_values):
+        """
+        Converts a list of values to their JSON representation.
+        :param odoo_values: list of raw Odoo values
+        :return: list of JSON representations (dict), one for each value
+        """
+        self.ensure_one()
+        return [self.to_json(odoo_value) for odoo_value in odoo_values]
+
+    def from_json_values(self, json_values):
+        """
+        Converts a list of JSON values to Odoo field values.
+        :param json_values: list of JSON representations of the field
+        :return: list of odoo data (dict), one for each value
+        """
+        self.ensure_one()
+        if self.relational_field_id and self.search_relational_record:
+            self._prefetch_relational_values(json_values)
+        return [self.from_json(json_value) for json_value in json_values]
+
     def to_json(self, odoo_value):
         """
         Converts the value to its JSON representation.
@@ -121,7 +320,7 @@ class FieldToJson(models.Model):
         self.ensure_one()
         res = {self.json_name: odoo_value}
         if self.to_json_conversion:
-            res[self.json_name] = safe_eval(
+            res[self.json_name] = self._eval_conversion(
                 self.to_json_conversion,
                 {"odoo_value": odoo_value, "self": self, "fields": fields},
             )
@@ -149,19 +348,13 @@ class FieldToJson(models.Model):
         if not json_value and not isinstance(json_value, (bool, int, float)):
             return {}
         # Skip invalid data
-        if isinstance(json_value, str) and json_value.lower() in (
-                "null",
-                "false",
-                "none",
-                "other",
-                "unknown",
-        ):
+        if isinstance(json_value, str) and json_value.lower() in INVALID_JSON_VALUES:
             return {}
         converted_value = json_value
         field_name = self.field_name
         if self.from_json_conversion:
             # Calls a conversion method defined in mapping
-            converted_value = safe_eval(
+            converted_value = self._eval_conversion(
                 self.from_json_conversion,
                 {"json_value": json_value, "self": self},
             )
@@ -193,13 +386,7 @@ class FieldToJson(models.Model):
             values = value if isinstance(value, list) else [value]
             for val in values:
                 # Skip invalid data
-                if isinstance(val, str) and val.lower() in (
-                        "null",
-                        "false",
-                        "none",
-                        "other",
-                        "unknown",
-                ):
+                if isinstance(val, str) and val.lower() in INVALID_JSON_VALUES:
                     continue
                 search_field = self.field_name
                 search_val = val
@@ -209,10 +396,8 @@ class FieldToJson(models.Model):
                     # and use one value in particular to find a matching record.
                     search_field = self.search_key
                     search_val = val.get(self.search_key)
-                records = relational_model.search([
-                    "|", (search_field, "=", search_val),
-                    (search_field, "=ilike", str(search_val))
-                ]) if search_val else relational_model
+                records = self._search_relational_records(
+                    relational_model, search_field, search_val)
                 if field.ttype == "many2one":
                     record = records[:1]  # Only take one relation
                     if not record and self.allow_relational_creation:
@@ -282,6 +467,67 @@ class FieldToJson(models.Model):
             )
         return False
 
+    def _search_relational_records(self, relational_model, search_field, search_val):
+        """
+        Finds the relational records matching a JSON value, using the
+        relational index of the transaction when the field allows it.
+        """
+        if not search_val:
+            return relational_model
+        field = relational_model._fields.get(search_field)
+        if field is not None and field.type in INDEXABLE_TYPES \
+                and not isinstance(search_val, (dict, list)):
+            return RelationalIndex.get(self.env).search(
+                relational_model, search_field, search_val)
+        return relational_model.search([
+            "|", (search_field, "=", search_val),
+            (search_field, "=ilike", str(search_val))
+        ])
+
+    def _prefetch_relational_values(self, json_values):
+        """
+        Resolves all the relational values of a list of JSON values with one
+        query and creates the missing relational records in one call.
+        :param json_values: list of JSON values
+        :return: None
+        """
+        self.ensure_one()
+        relational_model = self.env[self.relational_field_id.relation]
+        search_field = self.search_key or self.field_name
+        field = relational_model._fields.get(search_field)
+        if field is None or field.type not in INDEXABLE_TYPES:
+            return
+        search_vals = list()
+        simple_vals = list()
+        for json_value in json_values:
+            if not json_value and not isinstance(json_value, (bool, int, float)):
+                continue
+            if isinstance(json_value, str) and \
+                    json_value.lower() in INVALID_JSON_VALUES:
+                continue
+            value = json_value
+            if self.from_json_conversion:
+                value = self._eval_conversion(
+                    self.from_json_conversion, {"json_value": json_value, "self": self}
+                )
+            for val in value if isinstance(value, list) else [value]:
+                if isinstance(val, str) and val.lower() in INVALID_JSON_VALUES:
+                    continue
+                if self.search_key and isinstance(val, dict):
+                    val = val.get(self.search_key)
+                elif isinstance(val, (dict, list)):
+                    continue
+                else:
+                    simple_vals.append(val)
+                if val:
+                    search_vals.append(val)
+        index = RelationalIndex.get(self.env)
+        index.refresh(relational_model)
+        index.lookup(relational_model, search_field, search_vals)
+        if self.allow_relational_creation and not self.search_key and \
+                self.relational_field_id.ttype in ("many2one", "many2many"):
+            index.create_missing(relational_model, search_field, simple_vals)
+
     def _get_relational_creation_values(self, field_values):
         """
         Given a dictionary with JSON field values, will create an ORM
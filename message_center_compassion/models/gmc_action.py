@@ -10,6 +10,9 @@
 from odoo import api, models, fields, _
 from odoo.exceptions import ValidationError
 
+# Answer codes indicating that GMC couldn't process a batch in time
+TIMEOUT_CODES = (408, 503, 504)
+
 
 class GmcAction(models.Model):
     """
@@ -23,6 +26,10 @@ class GmcAction(models.Model):
         - Calls a method 'incoming_method'
           ('process_commkit' by default) of the action model which must
           return a list of ids of the updated records.
+        - When the model implements a batch variant of this method, suffixed
+          by '_batch' (i.e. 'process_commkit_batch'), it is called once with
+          the list of the data of all pending messages and must return a
+          list of ids of updated records for each message.
 
     Outgoing actions :
         - The object can implement 'on_send_to_connect' method in order
@@ -78,6 +85,76 @@ class GmcAction(models.Model):
     no_outgoing_data = fields.Boolean(
         help="Put to true to force sending empty message"
     )
+    batch_size = fields.Integer(
+        default=20, help="Number of objects sent in a single message to GMC"
+    )
+    batch_concurrency = fields.Integer(
+        default=1, help="Number of batches that are sent at the same time"
+    )
+    adaptive_batch_size = fields.Boolean(
+        help="Set to True for adapting the batch size to the answers of GMC: "
+             "it is reduced when GMC doesn't answer in time and increased "
+             "when it answers quickly."
+    )
+    batch_size_min = fields.Integer(default=5)
+    batch_size_max = fields.Integer(default=100)
+    batch_target_duration = fields.Float(
+        default=30.0,
+        help="Expected duration in seconds of a batch sending. The batch size "
+             "is increased when GMC answers in less than half this time."
+    )
+    current_batch_size = fields.Integer(
+        readonly=True, help="Batch size reached by the adaptive sizing"
+    )
+
+    @api.multi
+    def get_batch_size(self):
+        """ Returns the number of objects to send in a single message. """
+        self.ensure_one()
+        if self.adaptive_batch_size and self.current_batch_size:
+            return self.current_batch_size
+        return max(self.batch_size, 1)
+
+    @api.multi
+    def adapt_batch_size(self, batch_size, onramp_answer):
+        """
+        Computes the size of the next batch given the answer of GMC.
+        :param batch_size: size of the batch that was sent
+        :param onramp_answer: answer returned by the OnrampConnector
+        :return: size of the next batch
+        """
+        self.ensure_one()
+        if not self.adaptive_batch_size:
+            return batch_size
+        code = onramp_answer.get("code")
+        new_size = batch_size
+        if code in TIMEOUT_CODES:
+            new_size = max(self.batch_size_min, batch_size // 2, 1)
+        elif code and 200 <= code < 300 and \
+                onramp_answer.get("duration", 0) < self.batch_target_duration / 2:
+            new_size = min(self.batch_size_max, batch_size + max(batch_size // 4, 1))
+        if new_size != self.current_batch_size:
+            self._store_batch_size(new_size)
+        return new_size
+
+    @api.multi
+    def _store_batch_size(self, batch_size):
+        """ Saves the batch size reached by a job, for the next jobs.
+        Each job adapts its own batch size: it is saved in a separate
+        transaction and skipped when another job is saving it, so that jobs
+        sending at the same time never conflict on the action. """
+        self.ensure_one()
+        with self.pool.cursor() as cr:
+            cr.execute(
+                """
+                UPDATE gmc_action SET current_batch_size = %s
+                WHERE id IN (
+                    SELECT id FROM gmc_action WHERE id = %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                """,
+                (batch_size, self.id),
+            )
 
     def write(self, vals):
         # prevent writing direction which should not be changed and is performance heavy
@@ -7,7 +7,7 @@
 #    The licence is in the file __manifest__.py
 #
 ##############################################################################
-from odoo import models, fields, _
+from odoo import api, models, fields, tools, _
 
 
 class GmcActionConnect(models.Model):
@@ -34,3 +34,34 @@ class GmcActionConnect(models.Model):
             _("You cannot have two actions with same connect schema."),
         )
     ]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.clear_caches()
+        return super().create(vals_list)
+
+    @api.multi
+    def write(self, vals):
+        self.clear_caches()
+        return super().write(vals)
+
+    @api.multi
+    def unlink(self):
+        self.clear_caches()
+        return super().unlink()
+
+    @api.model
+    @tools.ormcache("connect_schema")
+    def get_schema_action(self, connect_schema):
+        """
+        Finds the action linked to a message type, kept in cache for the
+        handling of incoming messages.
+        :param connect_schema: message type received from GMC
+        :return: tuple (gmc.action.connect id, gmc.action id, ignored)
+                 or None if the message type is not known
+        """
+        action_connect = self.sudo().search(
+            [("connect_schema", "=", connect_schema)], limit=1)
+        if not action_connect:
+            return None
+        return action_connect.id, action_connect.action_id.id, action_connect.ignored
@@ -75,6 +75,9 @@ class GmcMessage(models.Model):
     headers = fields.Text(readonly=True)
     content = fields.Text()
     answer = fields.Text(readonly=True)
+    batch_id = fields.Many2one(
+        "gmc.message.batch", "Batch", readonly=True, index=True, ondelete="set null"
+    )
 
     ##########################################################################
     #                             FIELDS METHODS                             #
@@ -92,24 +95,53 @@ class GmcMessage(models.Model):
     ##########################################################################
     #                              ORM METHODS                               #
     ##########################################################################
-    @api.model
-    def create(self, vals):
-        message = False
-        if "object_id" in vals:
-            message = self.search(
+    @api.model_create_multi
+    def create(self, vals_list):
+        """ Messages waiting for the same object and action are reused, also
+        when they are given several times: the result can hold fewer
+        records than vals_list and cannot be zipped with it. """
+        # Reuse messages waiting for the same object and action, searched
+        # once for all the values.
+        keys = [
+            (vals["object_id"], vals["action_id"])
+            for vals in vals_list if "object_id" in vals
+        ]
+        existing = dict()
+        if keys:
+            for message in self.search(
                 [
-                    ("object_id", "=", vals["object_id"]),
+                    ("object_id", "in", list({key[0] for key in keys})),
                     ("state", "in", ("new", "pending")),
-                    ("action_id", "=", vals["action_id"]),
+                    ("action_id", "in", list({key[1] for key in keys})),
                 ]
-            )
-
-        if not message:
-            message = super().create(vals)
-
-        if message.action_id.auto_process:
-            message.process_messages()
-        return message
+            ):
+                key = (message.object_id, message.action_id.id or False)
+                existing[key] = existing.get(key, self) | message
+
+        to_create = list()
+        found = list()  # Existing messages or index of the values to create
+        for vals in vals_list:
+            key = (vals["object_id"], vals["action_id"]) if "object_id" in vals \
+                else None
+            if key in existing:
+                found.append(existing[key])
+                continue
+            if key is not None:
+                # Avoid creating duplicates given in the same call
+                existing[key] = len(to_create)
+            found.append(len(to_create))
+            to_create.append(vals)
+        new_messages = super().create(to_create) if to_create else self
+
+        messages = self
+        for message in found:
+            messages |= new_messages[message] if isinstance(message, int) \
+                else message
+
+        # Process messages of the same action together
+        for action in messages.mapped("action_id").filtered("auto_process"):
+            messages.filtered(lambda m: m.action_id == action).process_messages()
+        return messages
 
     ##########################################################################
     #                             PUBLIC METHODS                             #
@@ -182,6 +214,17 @@ class GmcMessage(models.Model):
     @related_action(action="related_action_messages")
     def _process_messages(self):
         """ Process given messages in pool. """
+        stat_obj = self.env["gmc.message.stat"]
+        # Measures left by a previous job of the thread are not booked on
+        # this one.
+        stat_obj.reset()
+        try:
+            return self._process_pending_messages()
+        finally:
+            # The measures of a failed job are dropped with its transaction
+            stat_obj.reset()
+
+    def _process_pending_messages(self):
         today = datetime.now()
         messages = self.filtered(lambda mess: mess.state == "pending")
         if not self.env.context.get("force_send"):
@@ -203,44 +246,128 @@ class GmcMessage(models.Model):
             return True
 
         message_update = {"process_date": fields.Datetime.now()}
+        results = dict()
         if action.direction == "in":
-            try:
-                message_update.update(self._perform_incoming_action())
-            except:
-                # Abort pending operations
-                logger.error("Failure when processing message", exc_info=True)
-                self.env.cr.rollback()
-                self.env.clear()
-                # Write error
-                message_update.update(
-                    {"state": "failure", "failure_reason": traceback.format_exc()}
-                )
-
+            results = messages._perform_incoming_action()
         elif action.direction == "out":
             self._perform_outgoing_action()
         else:
             raise NotImplementedError
 
         self.write(message_update)
-        if message_update.get("state") == "success":
-            # Remove thread history
-            self.mapped("message_ids").unlink()
+        success = self._write_incoming_results(results)
+        # Remove thread history
+        success.mapped("message_ids").unlink()
+        self.env["gmc.message.stat"].flush()
 
         return True
 
     def _perform_incoming_action(self):
         """ Convert the data incoming from Connect into Odoo object values
-        and call the process_commkit method on the related object. """
-        object_ids = list()
+        and call the process_commkit method on the related object.
+
+        When the model implements a batch variant of the incoming method
+        (suffixed by _batch, i.e. process_commkit_batch), it receives the
+        data of all messages at once and must return a list with the ids of
+        the updated records for each message. If the batch fails, the
+        messages are processed one by one. Messages are processed in
+        their own savepoint, so that a failing message doesn't affect the
+        others.
+
+        :return: dict {message id: values to write on the message}
+        """
         action = self.mapped("action_id")
+        model_obj = self.env[action.model]
+        stat_obj = self.env["gmc.message.stat"]
+        results = dict()
+        commkits = list()
         for message in self:
-            model_obj = self.env[action.model]
-            commkit_data = [json.loads(message.content)]
+            try:
+                content = message.content
+                with stat_obj.measure(action, "decode",
+                                      payload_size=len(content or "")):
+                    commkits.append((message, json.loads(content)))
+            except (TypeError, ValueError):
+                logger.error("Invalid message content", exc_info=True)
+                results[message.id] = {
+                    "state": "failure", "failure_reason": traceback.format_exc()
+                }
+
+        batch_method = getattr(model_obj, action.incoming_method + "_batch", None)
+        if batch_method is not None and len(commkits) > 1:
+            try:
+                with self.env.cr.savepoint(), stat_obj.measure(
+                        action, "orm", batch_size=len(commkits)):
+                    batch_results = batch_method([data for m, data in commkits])
+                    if len(batch_results) != len(commkits):
+                        raise ValueError(
+                            "%s returned %s results for %s messages" % (
+                                batch_method.__name__, len(batch_results),
+                                len(commkits)))
+                for (message, data), object_ids in zip(commkits, batch_results):
+                    results[message.id] = self._get_incoming_result(object_ids)
+                commkits = list()
+            except Exception:
+                # Fallback to individual processing, for finding which
+                # messages are failing.
+                logger.error("Failure when processing messages in batch",
+                             exc_info=True)
+                self.env.clear()
+
+        for message, commkit_data in commkits:
+            try:
+                with self.env.cr.savepoint(), stat_obj.measure(action, "orm"):
+                    object_ids = getattr(model_obj, action.incoming_method)(
+                        commkit_data)
+                results[message.id] = self._get_incoming_result(object_ids)
+            except Exception:
+                # Abort pending operations of the message
+                logger.error("Failure when processing message", exc_info=True)
+                self.env.clear()
+                results[message.id] = {
+                    "state": "failure", "failure_reason": traceback.format_exc()
+                }
+        return results
 
-            object_ids.extend(
-                map(str, getattr(model_obj, action.incoming_method)(*commkit_data))
+    @api.model
+    def _write_incoming_results(self, results):
+        """ Writes the results of incoming messages, with one write for all
+        the messages having the same state and failure reason. The related
+        records, which differ for each message, are set with one query.
+        :param results: dict {message id: values to write on the message}
+        :return: the messages processed successfully
+        """
+        groups = dict()
+        object_ids = dict()
+        for message_id, result in results.items():
+            result = dict(result)
+            if "object_ids" in result:
+                object_ids[message_id] = result.pop("object_ids") or None
+            groups.setdefault(tuple(sorted(result.items())), list()).append(
+                message_id)
+        success = self.browse()
+        for values, message_ids in groups.items():
+            values = dict(values)
+            messages = self.browse(message_ids)
+            messages.write(values)
+            if values.get("state") == "success":
+                success |= messages
+        if object_ids:
+            self.env.cr.execute(
+                """
+                UPDATE gmc_message SET object_ids = %s::json ->> id::text
+                WHERE id IN %s
+                """,
+                (json.dumps(object_ids), tuple(object_ids)),
             )
+            self.invalidate_cache(["object_ids"], list(object_ids))
+        return success
 
+    @api.model
+    def _get_incoming_result(self, object_ids):
+        """ Values of an incoming message given the ids of the records
+        returned by the incoming method. """
+        object_ids = list(map(str, object_ids or []))
         return {
             "state": "success" if object_ids else "failure",
             "object_ids": ",".join(object_ids),
@@ -257,14 +384,27 @@ class GmcMessage(models.Model):
                 .browse(self.mapped("object_id"))
         )
 
-        # Replay answer if message was already sent and received success
+        # Resume batches whose answer was received but not processed.
+        # The messages already processed are skipped by _process_answer.
         to_send = self
+        for batch in self.mapped("batch_id").filtered(lambda b: b.state == "sent"):
+            batch_messages = batch.get_messages()
+            if batch_messages.filtered(lambda m: m.state != "success"):
+                batch_messages._process_answer(
+                    json.loads(batch.content), json.loads(batch.answer))
+            batch.state = "done"
+            to_send -= batch_messages
+
+        # Replay answer if message was already sent and received success
         for i, message in enumerate(self):
-            if message.request_id:
+            if message.request_id and message in to_send:
                 answer_data = json.loads(message.answer)
                 message._process_single_answer(data_objects[i], answer_data)
                 to_send -= message
 
+        if not to_send:
+            return
+
         # Notify objects sent to connect for special handling if needed.
         data_objects = (
             self.env[action.model]
@@ -274,33 +414,21 @@ class GmcMessage(models.Model):
         if hasattr(data_objects, "on_send_to_connect"):
             data_objects.on_send_to_connect()
 
+        stat_obj = self.env["gmc.message.stat"]
         message_data = {}
         if action.connect_outgoing_wrapper:
             # Object is wrapped in a tag. ("MessageTag": [objects_to_send])
             if action.batch_send:
                 # Send multiple objects in a single message to GMC
-                # make batch of 20 messages to avoid timeouts
-                split = 20
-                nb_batches = len(data_objects) // split
-                remaining = (len(data_objects) % split) and 1
-                for j in range(0, nb_batches + remaining):
-                    i = j * split
-                    message_data = {action.connect_outgoing_wrapper: list()}
-                    for data_object in data_objects[i: i + split]:
-                        if not action.no_outgoing_data:
-                            message_data[action.connect_outgoing_wrapper].append(
-                                data_object.data_to_json(action.mapping_id.name)
-                            )
-                        else:
-                            message_data[action.connect_outgoing_wrapper].append({})
-                    to_send[i: i + split]._send_message(message_data)
+                to_send._send_batches(data_objects)
             else:
                 # Send individual message for each object
                 for i in range(0, len(data_objects)):
                     if not action.no_outgoing_data:
-                        message_data[action.connect_outgoing_wrapper] = [
-                            data_objects[i].data_to_json(action.mapping_id.name)
-                        ]
+                        with stat_obj.measure(action, "mapping"):
+                            message_data[action.connect_outgoing_wrapper] = [
+                                data_objects[i].data_to_json(action.mapping_id.name)
+                            ]
                     else:
                         message_data[action.connect_outgoing_wrapper] = {}
                     to_send[i]._send_message(message_data)
@@ -309,22 +437,108 @@ class GmcMessage(models.Model):
             # Send individual message for each object without Wrapper
             for i in range(0, len(data_objects)):
                 if not action.no_outgoing_data:
-                    message_data = data_objects[i].data_to_json(action.mapping_id.name)
+                    with stat_obj.measure(action, "mapping"):
+                        message_data = data_objects[i].data_to_json(
+                            action.mapping_id.name)
                 to_send[i]._send_message(message_data)
 
-    def _send_message(self, message_data):
-        """Sends the prepared message and gets the answer from GMC."""
+    def _send_batches(self, data_objects):
+        """
+        Sends the messages in batches of several objects. The batch size is
+        given by the action and can adapt itself to the answers of GMC.
+        Several batches can be sent at the same time, and each answer is
+        stored in the batch journal before it is processed.
+        :param data_objects: objects to send, in the same order as the messages
+        :return: None
+        """
         action = self.mapped("action_id")
+        wrapper = action.connect_outgoing_wrapper
         onramp = OnrampConnector()
-        url_endpoint = self._get_url_endpoint()
+        stat_obj = self.env["gmc.message.stat"]
+        batch_size = action.get_batch_size()
+        i = 0
+        while i < len(self):
+            # Prepare as many batches as can be sent at the same time
+            batches = list()
+            for n in range(max(action.batch_concurrency, 1)):
+                if i >= len(self):
+                    break
+                message_data = {wrapper: list()}
+                batch_objects = data_objects[i: i + batch_size]
+                with stat_obj.measure(action, "mapping", batch_size=len(batch_objects)):
+                    for data_object in batch_objects:
+                        if not action.no_outgoing_data:
+                            message_data[wrapper].append(
+                                data_object.data_to_json(action.mapping_id.name)
+                            )
+                        else:
+                            message_data[wrapper].append({})
+                batches.append((self[i: i + batch_size], message_data))
+                i += batch_size
+            answers = onramp.send_messages([
+                messages._get_connect_request(message_data)
+                for messages, message_data in batches
+            ])
+            for (messages, message_data), onramp_answer in zip(batches, answers):
+                content = json.dumps(message_data)
+                messages._add_connect_stat(onramp_answer, len(content))
+                journal = self.env["gmc.message.batch"].create({
+                    "action_id": action.id,
+                    "message_order": ",".join(map(str, messages.ids)),
+                    "batch_size": len(messages),
+                    "duration": onramp_answer.get("duration", 0),
+                    "content": content,
+                    "answer": json.dumps(onramp_answer),
+                })
+                messages.write({"batch_id": journal.id})
+                if not testing:
+                    self.env.cr.commit()  # pylint:disable=invalid-commit
+                with stat_obj.measure(action, "orm", batch_size=len(messages)):
+                    messages._process_answer(message_data, onramp_answer)
+                journal.state = "done"
+                batch_size = action.adapt_batch_size(batch_size, onramp_answer)
+
+    def _get_connect_request(self, message_data):
+        """ Arguments of OnrampConnector.send_message for sending the
+        prepared message. """
+        action = self.mapped("action_id")
+        request = {
+            "service_name": self._get_url_endpoint(),
+            "message_type": action.request_type,
+        }
         if action.request_type == "GET":
-            onramp_answer = onramp.send_message(
-                url_endpoint, action.request_type, params=message_data
-            )
+            request["params"] = message_data
         else:
-            onramp_answer = onramp.send_message(
-                url_endpoint, action.request_type, body=message_data
-            )
+            request["body"] = message_data
+        return request
+
+    def _send_message(self, message_data):
+        """Sends the prepared message and gets the answer from GMC."""
+        onramp_answer = OnrampConnector().send_message(
+            **self._get_connect_request(message_data))
+        self._add_connect_stat(onramp_answer, len(json.dumps(message_data)))
+        with self.env["gmc.message.stat"].measure(
+                self.mapped("action_id"), "orm", batch_size=len(self)):
+            self._process_answer(message_data, onramp_answer)
+
+    def _add_connect_stat(self, onramp_answer, payload_size):
+        """ Records the measures of a round trip to Connect. """
+        self.env["gmc.message.stat"].add(
+            self.mapped("action_id"),
+            "connect",
+            onramp_answer.get("duration", 0),
+            payload_size=payload_size,
+            batch_size=len(self),
+            status_code=onramp_answer.get("code"),
+            retries=onramp_answer.get("retries", 0),
+        )
+
+    def _process_answer(self, message_data, onramp_answer):
+        """ Processes the answer received from GMC for the messages.
+        :param message_data: the data sent to GMC
+        :param onramp_answer: the answer returned by the OnrampConnector
+        """
+        action = self.mapped("action_id")
 
         # Extract the Answer
         results = onramp_answer.get("content", {})
@@ -352,6 +566,9 @@ class GmcMessage(models.Model):
             # Success, loop through answer to get individual results
             for i in range(0, len(results)):
                 result = results[i]
+                if self[i].state == "success":
+                    # Already processed before a batch was resumed
+                    continue
                 content_data = (
                     json.dumps(content_sent[i], indent=4, sort_keys=True)
                     if isinstance(content_sent, list)
@@ -0,0 +1,57 @@
+##############################################################################
+#
+#    Copyright (C) 2020 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#    @author: Emanuel Cino <ecino@compassion.ch>
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+from datetime import datetime, timedelta
+
+from odoo import api, models, fields, _
+
+
+class GmcMessageBatch(models.Model):
+    """ Journal of the batches of messages sent to GMC. The answer of a batch
+    is stored before it is processed, so that a job interrupted in the middle
+    of a sending resumes from the batches that were not acknowledged instead
+    of sending again all the messages. """
+
+    _name = "gmc.message.batch"
+    _description = "Connect Message Batch"
+    _order = "date desc"
+
+    action_id = fields.Many2one(
+        "gmc.action", "GMC Action", ondelete="cascade", readonly=True
+    )
+    message_ids = fields.One2many(
+        "gmc.message", "batch_id", "Messages", readonly=True
+    )
+    message_order = fields.Char(
+        readonly=True, help="Ids of the messages in the order they were sent "
+                            "(separated by commas)"
+    )
+    date = fields.Datetime(required=True, default=fields.Datetime.now, readonly=True)
+    state = fields.Selection(
+        [("sent", _("Sent")), ("done", _("Done"))], default="sent", readonly=True
+    )
+    batch_size = fields.Integer(readonly=True)
+    duration = fields.Float(readonly=True, help="Seconds waited for the answer")
+    content = fields.Text(readonly=True)
+    answer = fields.Text(readonly=True)
+
+    @api.multi
+    def get_messages(self):
+        """ Returns the messages of the batch in the order they were sent. """
+        self.ensure_one()
+        return self.env["gmc.message"].browse(
+            list(map(int, self.message_order.split(",")))
+        ).exists()
+
+    @api.model
+    def clean_journal(self, days=7):
+        """ Removes the processed batches older than the given days. """
+        limit = datetime.now() - timedelta(days=days)
+        self.search([("state", "=", "done"), ("date", "<", limit)]).unlink()
+        return True
@@ -0,0 +1,124 @@
+##############################################################################
+#
+#    Copyright (C) 2020 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#    @author: Emanuel Cino <ecino@compassion.ch>
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import json
+import logging
+import traceback
+
+from odoo import api, models, fields
+
+_logger = logging.getLogger(__name__)
+
+# Number of times a message is stored before it is left in the inbox
+MAX_ATTEMPTS = 3
+
+
+class GmcMessageInbox(models.Model):
+    """ Messages received on /onramp in buffered mode. They are inserted in
+    the inbox before GMC gets the confirmation, and moved in bulk to
+    gmc.message by the IngestBuffer (or by a cron for the messages left by a
+    stopped worker). Messages that cannot be stored after several attempts
+    stay in the inbox with the reason of the failure. """
+
+    _name = "gmc.message.inbox"
+    _description = "Connect Incoming Message Inbox"
+    _order = "id"
+
+    user_id = fields.Many2one("res.users", "Receiver", readonly=True)
+    vals = fields.Text("Message values", readonly=True)
+    attempts = fields.Integer(readonly=True)
+    failure_reason = fields.Text(readonly=True)
+
+    @api.model
+    def store(self, uid, vals):
+        """
+        Inserts a received message in the inbox, with a single query.
+        :param uid: user receiving the message
+        :param vals: values of the gmc.message to create
+        :return: None
+        """
+        self.env.cr.execute(
+            """
+            INSERT INTO gmc_message_inbox
+                (user_id, vals, attempts, create_uid, write_uid,
+                 create_date, write_date)
+            VALUES (%s, %s, 0, %s, %s,
+                    now() at time zone 'UTC', now() at time zone 'UTC')
+            """,
+            (uid, json.dumps(vals), uid, uid),
+        )
+
+    @api.model
+    def process_inbox(self, limit=None, min_age=0):
+        """
+        Creates the gmc.message of the messages waiting in the inbox. The
+        messages are created in bulk, or one by one if the bulk creation
+        fails. Messages taken by another worker are skipped.
+        :param limit: maximum number of messages processed
+        :param min_age: only process messages received at least this number
+                        of seconds ago
+        :return: number of messages taken from the inbox
+        """
+        cr = self.env.cr
+        cr.execute(
+            """
+            SELECT id, user_id, vals FROM gmc_message_inbox
+            WHERE failure_reason IS NULL
+            AND create_date <= (now() at time zone 'UTC') - %s * interval '1s'
+            ORDER BY id LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (min_age, limit),
+        )
+        rows = cr.fetchall()
+        if not rows:
+            return 0
+        message_obj = self.env["gmc.message"]
+        failures = dict()
+        try:
+            with cr.savepoint():
+                by_user = dict()
+                for inbox_id, uid, vals in rows:
+                    by_user.setdefault(uid, list()).append(json.loads(vals))
+                for uid, vals_list in by_user.items():
+                    message_obj.sudo(uid).create(vals_list)
+        except Exception:
+            _logger.warning(
+                "Failed to store %s onramp messages at once, storing them one by one",
+                len(rows), exc_info=True)
+            self.env.clear()
+            for inbox_id, uid, vals in rows:
+                try:
+                    with cr.savepoint():
+                        message_obj.sudo(uid).create(json.loads(vals))
+                except Exception:
+                    self.env.clear()
+                    failures[inbox_id] = traceback.format_exc()
+
+        stored_ids = [row[0] for row in rows if row[0] not in failures]
+        if stored_ids:
+            cr.execute(
+                "DELETE FROM gmc_message_inbox WHERE id IN %s", (tuple(stored_ids),))
+        for inbox_id, failure in failures.items():
+            cr.execute(
+                """
+                UPDATE gmc_message_inbox SET attempts = attempts + 1,
+                    failure_reason = CASE WHEN attempts + 1 >= %s THEN %s END,
+                    write_date = now() at time zone 'UTC'
+                WHERE id = %s
+                RETURNING failure_reason
+                """,
+                (MAX_ATTEMPTS, failure, inbox_id),
+            )
+            if cr.fetchone()[0]:
+                _logger.error(
+                    "Onramp message %s could not be stored and is left in the "
+                    "inbox: %s", inbox_id, failure)
+        self.invalidate_cache()
+        return len(rows)
@@ -0,0 +1,249 @@
+##############################################################################
+#
+#    Copyright (C) 2020 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#    @author: Emanuel Cino <ecino@compassion.ch>
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import base64
+import csv
+import io
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from odoo import api, models, fields, _
+
+# Measures waiting to be stored, for each thread processing messages.
+_pending_stats = threading.local()
+
+
+class GmcMessageStat(models.Model):
+    """ Aggregated measures of the processing of GMC messages. Each line
+    sums up the executions of a processing phase for an action during one
+    hour, which gives throughput and latency figures for benchmarking the
+    message center. """
+
+    _name = "gmc.message.stat"
+    _description = "Connect Message Statistics"
+    _order = "period desc, action_id"
+    _rec_name = "action_id"
+
+    period = fields.Datetime(required=True, readonly=True, index=True)
+    action_id = fields.Many2one(
+        "gmc.action", "GMC Action", required=True, readonly=True,
+        ondelete="cascade", index=True
+    )
+    direction = fields.Selection(related="action_id.direction", store=True)
+    phase = fields.Selection(
+        [
+            ("decode", _("Decode")),
+            ("mapping", _("Mapping conversion")),
+            ("orm", _("ORM processing")),
+            ("connect", _("Connect round trip")),
+        ],
+        required=True,
+        readonly=True,
+    )
+    status_code = fields.Integer("HTTP status", readonly=True)
+    count = fields.Integer(readonly=True)
+    total_duration = fields.Float("Total duration (s)", readonly=True)
+    max_duration = fields.Float(
+        "Max duration (s)", readonly=True, group_operator="max")
+    avg_duration = fields.Float(
+        "Average duration (s)", compute="_compute_averages", store=True,
+        group_operator="avg"
+    )
+    payload_size = fields.Integer("Payload size (bytes)", readonly=True)
+    batch_size = fields.Integer("Records", readonly=True)
+    avg_batch_size = fields.Float(
+        "Average batch size", compute="_compute_averages", store=True,
+        group_operator="avg"
+    )
+    retries = fields.Integer(readonly=True)
+
+    _sql_constraints = [
+        (
+            "unique_measure",
+            "unique(period, action_id, phase, status_code)",
+            _("Measures are aggregated by period, action, phase and status"),
+        )
+    ]
+
+    @api.depends("count", "total_duration", "batch_size")
+    def _compute_averages(self):
+        for stat in self:
+            stat.avg_duration = stat.count and stat.total_duration / stat.count
+            stat.avg_batch_size = stat.count and stat.batch_size / stat.count
+
+    @api.model
+    def add(self, action, phase, duration, payload_size=0, batch_size=1,
+            status_code=0, retries=0):
+        """
+        Adds a measure, which is kept in memory until flush is called.
+        :param action: gmc.action record
+        :param phase: decode, mapping, orm or connect
+        :param duration: seconds spent in the phase
+        :param payload_size: size of the processed data in bytes
+        :param batch_size: number of records processed
+        :param status_code: HTTP status returned by GMC
+        :param retries: number of times the request was retried
+        :return: None
+        """
+        stats = getattr(_pending_stats, "stats", None)
+        if stats is None:
+            stats = _pending_stats.stats = dict()
+        key = (self.env.cr.dbname, action.id, phase, status_code or 0)
+        stat = stats.setdefault(key, [0, 0.0, 0.0, 0, 0, 0])
+        stat[0] += 1
+        stat[1] += duration
+        stat[2] = max(stat[2], duration)
+        stat[3] += payload_size or 0
+        stat[4] += batch_size or 0
+        stat[5] += retries or 0
+
+    @api.model
+    @contextmanager
+    def measure(self, action, phase, **kwargs):
+        """ Context manager measuring the duration of a phase. """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(action, phase, time.time() - start, **kwargs)
+
+    @api.model
+    def flush(self):
+        """ Stores the measures of the current thread in the aggregated
+        table, with one statement per measured phase. """
+        stats = getattr(_pending_stats, "stats", None)
+        if not stats:
+            return True
+        dbname = self.env.cr.dbname
+        period = datetime.now().replace(minute=0, second=0, microsecond=0)
+        for key in [key for key in stats if key[0] == dbname]:
+            count, duration, max_duration, payload, batch, retries = stats.pop(key)
+            self.env.cr.execute(
+                """
+                INSERT INTO gmc_message_stat (
+                    period, action_id, phase, status_code, count, total_duration,
+                    max_duration, avg_duration, payload_size, batch_size,
+                    avg_batch_size, retries, create_uid, create_date,
+                    write_uid, write_date)
+                VALUES (%(period)s, %(action)s, %(phase)s, %(status)s, %(count)s,
+                        %(duration)s, %(max)s, %(duration)s / %(count)s,
+                        %(payload)s, %(batch)s, %(batch)s::float / %(count)s,
+                        %(retries)s, %(uid)s, now() at time zone 'UTC',
+                        %(uid)s, now() at time zone 'UTC')
+                ON CONFLICT (period, action_id, phase, status_code) DO UPDATE SET
+                    count = gmc_message_stat.count + EXCLUDED.count,
+                    total_duration =
+                        gmc_message_stat.total_duration + EXCLUDED.total_duration,
+                    max_duration = GREATEST(
+                        gmc_message_stat.max_duration, EXCLUDED.max_duration),
+                    avg_duration =
+                        (gmc_message_stat.total_duration + EXCLUDED.total_duration)
+                        / (gmc_message_stat.count + EXCLUDED.count),
+                    payload_size =
+                        gmc_message_stat.payload_size + EXCLUDED.payload_size,
+                    batch_size = gmc_message_stat.batch_size + EXCLUDED.batch_size,
+                    avg_batch_size =
+                        (gmc_message_stat.batch_size + EXCLUDED.batch_size)::float
+                        / (gmc_message_stat.count + EXCLUDED.count),
+                    retries = gmc_message_stat.retries + EXCLUDED.retries,
+                    write_uid = EXCLUDED.write_uid,
+                    write_date = EXCLUDED.write_date
+                """,
+                {
+                    "period": period,
+                    "action": key[1],
+                    "phase": key[2],
+                    "status": key[3],
+                    "count": count,
+                    "duration": duration,
+                    "max": max_duration,
+                    "payload": payload,
+                    "batch": batch,
+                    "retries": retries,
+                    "uid": self.env.uid,
+                },
+            )
+        # Update direction of new lines
+        self.env.cr.execute(
+            """
+            UPDATE gmc_message_stat s SET direction = a.direction
+            FROM gmc_action a
+            WHERE s.action_id = a.id AND s.direction IS NULL
+            """
+        )
+        self.invalidate_cache()
+        return True
+
+    @api.model
+    def reset(self):
+        """ Drops the measures of the current thread that were not stored. """
+        stats = getattr(_pending_stats, "stats", None)
+        if stats:
+            dbname = self.env.cr.dbname
+            for key in [key for key in stats if key[0] == dbname]:
+                del stats[key]
+        return True
+
+    @api.model
+    def get_benchmark(self, domain=None):
+        """
+        Gives the aggregated measures for benchmarking, one line for each
+        action and phase.
+        :param domain: optional search domain on the measures
+        :return: list of dict
+        """
+        groups = self.read_group(
+            domain or [],
+            ["count", "total_duration", "max_duration", "payload_size",
+             "batch_size", "retries"],
+            ["action_id", "phase"],
+            lazy=False,
+        )
+        res = list()
+        for group in groups:
+            count = group["count"] or 1
+            res.append({
+                "action": group["action_id"] and group["action_id"][1],
+                "phase": group["phase"],
+                "count": group["count"],
+                "total_duration": group["total_duration"],
+                "avg_duration": group["total_duration"] / count,
+                "max_duration": group["max_duration"],
+                "avg_payload_size": group["payload_size"] / count,
+                "avg_batch_size": group["batch_size"] / count,
+                "records_per_second": group["total_duration"] and
+                group["batch_size"] / group["total_duration"],
+                "retries": group["retries"],
+            })
+        return res
+
+    @api.multi
+    def export_benchmark(self):
+        """ Downloads the benchmark of the selected measures as CSV file. """
+        benchmark = self.get_benchmark([("id", "in", self.ids)])
+        output = io.StringIO()
+        columns = ["action", "phase", "count", "total_duration", "avg_duration",
+                   "max_duration", "avg_payload_size", "avg_batch_size",
+                   "records_per_second", "retries"]
+        writer = csv.DictWriter(output, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(benchmark)
+        attachment = self.env["ir.attachment"].create({
+            "name": "gmc_benchmark.csv",
+            "datas_fname": "gmc_benchmark.csv",
+            "datas": base64.b64encode(output.getvalue().encode("utf-8")),
+            "mimetype": "text/csv",
+        })
+        return {
+            "type": "ir.actions.act_url",
+            "url": "/web/content/%s?download=true" % attachment.id,
+            "target": "self",
+        }
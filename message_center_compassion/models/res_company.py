@@ -0,0 +1,49 @@
+##############################################################################
+#
+#    Copyright (C) 2020 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#    @author: Emanuel Cino <ecino@compassion.ch>
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+from odoo import api, models, tools
+
+
+class ResCompany(models.Model):
+    _inherit = "res.company"
+
+    @api.model
+    @tools.ormcache()
+    def get_gmc_country_codes(self):
+        """ Country codes of the companies, to which GMC can send messages. """
+        return tuple(
+            self.sudo().search([]).mapped("partner_id.country_id.code")
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.clear_caches()
+        return super().create(vals_list)
+
+    @api.multi
+    def write(self, vals):
+        if "partner_id" in vals:
+            self.clear_caches()
+        return super().write(vals)
+
+    @api.multi
+    def unlink(self):
+        self.clear_caches()
+        return super().unlink()
+
+
+class ResPartner(models.Model):
+    _inherit = "res.partner"
+
+    @api.multi
+    def write(self, vals):
+        if "country_id" in vals and self.env["res.company"].sudo().search_count(
+                [("partner_id", "in", self.ids)]):
+            self.clear_caches()
+        return super().write(vals)
@@ -1,4 +1,4 @@
-from odoo import models
+from odoo import api, models
 from odoo.tools import config
 
 # For the tests, we will create a mapping for res.partner object.
@@ -6,3 +6,14 @@ if config.get("test_enable"):
     class ResPartnerTest(models.Model):
         _inherit = ["compassion.mapped.model", "res.partner"]
         _name = "res.partner"
+
+        @api.model
+        def process_test_message(self, commkit_data):
+            """ Incoming method creating the partner of a test message. """
+            if not commkit_data.get("Name"):
+                raise ValueError("The partner has no name")
+            return self.create({"name": commkit_data["Name"]}).ids
+
+        @api.model
+        def process_test_message_batch(self, commkit_list):
+            return [self.process_test_message(data) for data in commkit_list]
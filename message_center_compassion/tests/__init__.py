@@ -1,3 +1,6 @@
 from . import onramp_base_test
 from . import test_onramp_controller
 from . import test_mapping
+from . import test_onramp_connector
+from . import test_message_inbox
+from . import test_gmc_message
@@ -0,0 +1,211 @@
+##############################################################################
+#
+#    Copyright (C) 2020 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import json
+
+from mock import patch
+
+from odoo.tests import TransactionCase
+from ..models.gmc_message_stat import _pending_stats
+
+mock_onramp = (
+    "odoo.addons.message_center_compassion.models.gmc_message.OnrampConnector"
+)
+
+
+class TestGmcMessage(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.partner_class = type(self.env["res.partner"])
+        mapping = self.env["compassion.mapping"].create({
+            "name": "test messages",
+            "model_id": self.env.ref("base.model_res_partner").id,
+        })
+        self.in_action = self.env["gmc.action"].create({
+            "name": "Test incoming",
+            "direction": "in",
+            "mapping_id": mapping.id,
+            "incoming_method": "process_test_message",
+        })
+        self.out_action = self.env["gmc.action"].create({
+            "name": "Test outgoing",
+            "direction": "out",
+            "mapping_id": mapping.id,
+            "connect_service": "test/partners",
+            "connect_outgoing_wrapper": "Partners",
+            "connect_answer_wrapper": "Responses",
+            "request_type": "POST",
+            "no_outgoing_data": True,
+            "batch_send": True,
+            "batch_size": 4,
+            "adaptive_batch_size": True,
+            "batch_size_min": 1,
+            "batch_size_max": 10,
+        })
+        self.message_obj = self.env["gmc.message"].with_context(
+            async_mode=False, force_send=True)
+
+    def _receive(self, names):
+        messages = self.message_obj.create([
+            {"action_id": self.in_action.id, "content": json.dumps({"Name": name})}
+            for name in names
+        ])
+        messages.process_messages()
+        return messages
+
+    def _send(self, nb_messages):
+        partners = self.env["res.partner"].create([
+            {"name": "Sent partner %s" % i} for i in range(nb_messages)])
+        messages = self.message_obj.create([
+            {"action_id": self.out_action.id, "object_id": partner.id}
+            for partner in partners
+        ])
+        messages.process_messages()
+        return messages
+
+    @staticmethod
+    def _answer(code=200, duration=1.0, nb_results=1):
+        return {
+            "code": code,
+            "duration": duration,
+            "content": {"Responses": [{"Code": 2000}] * nb_results}
+            if code == 200 else "Gateway Time-out",
+        }
+
+    def _patch_batch(self, side_effect=None):
+        return patch.object(
+            self.partner_class, "process_test_message_batch", autospec=True,
+            side_effect=side_effect or
+            self.partner_class.process_test_message_batch)
+
+    def test_incoming_batch(self):
+        """ The messages are processed with one call of the batch method
+        and are related to their own records. """
+        names = ["Batch partner 1", "Batch partner 2", "Batch partner 3"]
+        with self._patch_batch() as batch_method:
+            messages = self._receive(names)
+        self.assertEqual(batch_method.call_count, 1)
+        self.assertEqual(messages.mapped("state"), ["success"] * 3)
+        for message, name in zip(messages, names):
+            partner = self.env["res.partner"].browse(int(message.object_ids))
+            self.assertEqual(partner.name, name)
+
+    def test_incoming_batch_failure(self):
+        """ When the batch fails, the messages are processed one by one and
+        only the failing message is in failure. """
+        with self._patch_batch() as batch_method:
+            messages = self._receive(["Fallback 1", False, "Fallback 3"])
+        self.assertEqual(batch_method.call_count, 1)
+        self.assertEqual(messages.mapped("state"), ["success", "failure", "success"])
+        self.assertIn("The partner has no name", messages[1].failure_reason)
+        self.assertFalse(messages[1].object_ids)
+        self.assertEqual(
+            self.env["res.partner"].search(
+                [("name", "like", "Fallback")]).mapped("name"),
+            ["Fallback 1", "Fallback 3"])
+
+    def test_incoming_batch_wrong_length(self):
+        """ A batch method not returning one result per message is not
+        trusted: the messages are processed one by one. """
+        with self._patch_batch(lambda model, commkits: [[]]):
+            messages = self._receive(["Length 1", "Length 2"])
+        self.assertEqual(messages.mapped("state"), ["success"] * 2)
+        self.assertTrue(all(messages.mapped("object_ids")))
+
+    def test_create_reuses_messages(self):
+        """ Values given several times for the same object and action
+        create a single message. """
+        vals = {"action_id": self.in_action.id, "object_id": 1}
+        messages = self.message_obj.create(
+            [vals, dict(vals, object_id=2), dict(vals)])
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(self.message_obj.create([dict(vals)]), messages[0])
+
+    @patch(mock_onramp)
+    def test_adaptive_batch_size(self, onramp):
+        """ The batch size is halved when GMC doesn't answer in time and
+        increased when it answers quickly. """
+        sizes = list()
+        codes = [504, 200, 200, 200]
+
+        def send_messages(requests):
+            size = len(requests[0]["body"]["Partners"])
+            sizes.append(size)
+            return [self._answer(codes[len(sizes) - 1], nb_results=size)]
+
+        onramp.return_value.send_messages.side_effect = send_messages
+        with patch.object(type(self.out_action), "_store_batch_size",
+                          autospec=True) as store_batch_size:
+            messages = self._send(11)
+        # 504: 4 -> 2, then quick answers: 2 -> 3 -> 4 (2 messages left) -> 3
+        self.assertEqual(sizes, [4, 2, 3, 2])
+        self.assertEqual(
+            [call[0][1] for call in store_batch_size.call_args_list],
+            [2, 3, 4, 3])
+        self.assertEqual(messages[0].state, "failure")
+        self.assertEqual(messages[4:].mapped("state"), ["success"] * 7)
+        journal = messages[4:].mapped("batch_id")
+        self.assertEqual(len(journal), 3)
+        self.assertEqual(journal.mapped("state"), ["done"] * 3)
+
+    @patch(mock_onramp)
+    def test_slow_answer_keeps_batch_size(self, onramp):
+        self.out_action.current_batch_size = 4
+        onramp.return_value.send_messages.side_effect = lambda requests: [
+            self._answer(duration=20.0, nb_results=len(r["body"]["Partners"]))
+            for r in requests
+        ]
+        with patch.object(type(self.out_action), "_store_batch_size",
+                          autospec=True) as store_batch_size:
+            messages = self._send(8)
+        self.assertEqual(onramp.return_value.send_messages.call_count, 2)
+        store_batch_size.assert_not_called()
+        self.assertEqual(messages.mapped("state"), ["success"] * 8)
+
+    @patch(mock_onramp)
+    def test_resume_sent_batch(self, onramp):
+        """ A batch whose answer was stored is processed from the journal
+        without being sent again, skipping the messages already processed. """
+        partners = self.env["res.partner"].create([
+            {"name": "Resumed partner %s" % i} for i in range(3)])
+        messages = self.message_obj.create([
+            {"action_id": self.out_action.id, "object_id": partner.id}
+            for partner in partners
+        ])
+        journal = self.env["gmc.message.batch"].create({
+            "action_id": self.out_action.id,
+            "message_order": ",".join(map(str, messages.ids)),
+            "batch_size": 3,
+            "content": json.dumps({"Partners": [{}, {}, {}]}),
+            "answer": json.dumps(self._answer(nb_results=3)),
+        })
+        messages.write({"batch_id": journal.id})
+        messages[0].write({"state": "success", "answer": "processed"})
+
+        messages.process_messages()
+        onramp.return_value.send_messages.assert_not_called()
+        self.assertEqual(journal.state, "done")
+        self.assertEqual(messages.mapped("state"), ["success"] * 3)
+        self.assertEqual(messages[0].answer, "processed")
+        self.assertTrue(messages[1].request_id)
+
+    def test_stats_booked_on_their_job(self):
+        """ Measures left by a previous job of the thread are dropped, and
+        the measures of a failed job are not booked on the next one. """
+        stat_obj = self.env["gmc.message.stat"]
+        stat_obj.add(self.in_action, "decode", 1.0)
+        self._receive(["Stat partner 1", "Stat partner 2"])
+        stat = stat_obj.search([
+            ("action_id", "=", self.in_action.id), ("phase", "=", "decode")])
+        self.assertEqual(stat.count, 2)
+
+        with patch.object(type(self.message_obj), "_write_incoming_results",
+                          side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self._receive(["Stat partner 3"])
+        self.assertFalse(_pending_stats.stats)
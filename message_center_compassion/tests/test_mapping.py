@@ -1,7 +1,15 @@
+from mock import patch
+
 from odoo.exceptions import ValidationError
 from odoo.tests import SingleTransactionCase
+from ..models.field_to_json import RelationalIndex
 from ..tools.load_mappings import load_mapping_files
 
+mock_send_messages = (
+    "odoo.addons.message_center_compassion.tools.onramp_connector."
+    "OnrampConnector.send_messages"
+)
+
 
 class TestMapping(SingleTransactionCase):
     @classmethod
@@ -37,3 +45,49 @@ class TestMapping(SingleTransactionCase):
             [("model_id.model", "=", "res.partner")]
         )
         self.assertTrue(partner_mapping)
+
+    def test_mapping_plan_cache(self):
+        """ Test that the compiled mapping plan is reused and invalidated
+        when a field specification changes. """
+        mapping_obj = self.env["compassion.mapping"]
+        plan = mapping_obj._get_mapping_plan(
+            "compassion.query.filter", "advanced query")
+        self.assertTrue(plan.specs)
+        self.assertIs(
+            plan,
+            mapping_obj._get_mapping_plan("compassion.query.filter", "advanced query")
+        )
+        json_spec = self.env["compassion.field.to.json"].browse(plan.specs[0].spec_id)
+        json_name = json_spec.json_name
+        json_spec.json_name = "PlanCacheTest"
+        new_plan = mapping_obj._get_mapping_plan(
+            "compassion.query.filter", "advanced query")
+        self.assertEquals(new_plan.specs[0].json_name, "PlanCacheTest")
+        json_spec.json_name = json_name
+
+    @patch(mock_send_messages)
+    def test_translated_kits_fetched_once(self, send_messages):
+        """ Test that the kits used for translations are downloaded once
+        per transaction, in the same order as requested. """
+        send_messages.side_effect = lambda messages: [
+            {"content": {"url": m["service_name"]}} for m in messages]
+        query_obj = self.env["compassion.query.filter"]
+        kits = query_obj._fetch_translated_kits(["kit/en", "kit/fr"])
+        self.assertEquals(
+            [k["content"]["url"] for k in kits], ["kit/en", "kit/fr"])
+        kits = query_obj._fetch_translated_kits(["kit/fr", "kit/de"])
+        self.assertEquals(
+            [k["content"]["url"] for k in kits], ["kit/fr", "kit/de"])
+        self.assertEquals(send_messages.call_count, 2)
+        self.assertEquals(
+            send_messages.call_args[0][0],
+            [{"service_name": "kit/de", "message_type": "GET"}])
+
+    def test_relational_index_misses(self):
+        """ A value not found is searched again, so that a record created
+        later in the transaction is found. """
+        index = RelationalIndex.get(self.env)
+        category_obj = self.env["res.partner.category"]
+        self.assertFalse(index.search(category_obj, "name", "Index test"))
+        category = category_obj.create({"name": "Index test"})
+        self.assertEquals(index.search(category_obj, "name", "index TEST"), category)
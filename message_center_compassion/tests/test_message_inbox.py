@@ -0,0 +1,103 @@
+##############################################################################
+#
+#    Copyright (C) 2020 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+from mock import patch
+
+from odoo.tests import TransactionCase
+from ..models.gmc_message_inbox import MAX_ATTEMPTS
+from ..tools.ingest_buffer import IngestBuffer
+
+mock_buffer = (
+    "odoo.addons.message_center_compassion.tools.ingest_buffer.IngestBuffer"
+)
+mock_process_inbox = (
+    "odoo.addons.message_center_compassion.models.gmc_message_inbox."
+    "GmcMessageInbox.process_inbox"
+)
+
+
+class TestMessageInbox(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.inbox_obj = self.env["gmc.message.inbox"]
+        self.env.cr.execute("DELETE FROM gmc_message_inbox")
+
+    def _store(self, request_id, **vals):
+        vals.update({
+            "request_id": request_id,
+            "headers": "{}",
+            "content": "{}",
+            "direction": "in",
+            "state": "new",
+        })
+        self.inbox_obj.store(self.env.uid, vals)
+
+    def _messages(self, request_ids):
+        return self.env["gmc.message"].search([("request_id", "in", request_ids)])
+
+    def test_process_inbox(self):
+        """ The messages are moved from the inbox to gmc.message. """
+        self._store("inbox-test-1")
+        self._store("inbox-test-2")
+        self.assertEqual(self.inbox_obj.search_count([]), 2)
+        self.assertEqual(self.inbox_obj.process_inbox(limit=10), 2)
+        self.assertEqual(len(self._messages(["inbox-test-1", "inbox-test-2"])), 2)
+        self.assertFalse(self.inbox_obj.search([]))
+        self.assertEqual(self.inbox_obj.process_inbox(limit=10), 0)
+
+    def test_process_inbox_min_age(self):
+        """ Messages received less than min_age seconds ago are left. """
+        self._store("inbox-test-1")
+        self.assertEqual(self.inbox_obj.process_inbox(limit=10, min_age=60), 0)
+        self.assertEqual(self.inbox_obj.search_count([]), 1)
+
+    def test_process_inbox_failure(self):
+        """ A failing message doesn't prevent the others from being stored,
+        and is left in the inbox after several attempts. """
+        self._store("inbox-test-1")
+        # Unknown action
+        self._store("inbox-test-2", action_id=-1)
+        self._store("inbox-test-3")
+        self.assertEqual(self.inbox_obj.process_inbox(limit=10), 3)
+        self.assertEqual(len(self._messages(["inbox-test-1", "inbox-test-3"])), 2)
+        self.assertFalse(self._messages(["inbox-test-2"]))
+        failed = self.inbox_obj.search([])
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed.attempts, 1)
+        self.assertFalse(failed.failure_reason)
+
+        for attempt in range(2, MAX_ATTEMPTS + 1):
+            self.assertEqual(self.inbox_obj.process_inbox(limit=10), 1)
+        self.assertEqual(failed.attempts, MAX_ATTEMPTS)
+        self.assertTrue(failed.failure_reason)
+        # The message is not processed anymore
+        self.assertEqual(self.inbox_obj.process_inbox(limit=10), 0)
+
+    @patch(mock_buffer + "._flush_loop")
+    def test_buffer_notify(self, flush_loop):
+        """ The flush is woken up when the buffer is full. """
+        buffer = IngestBuffer(self.env.cr.dbname)
+        buffer.size = 2
+        buffer.notify()
+        self.assertEqual(buffer._pending, 1)
+        self.assertFalse(buffer._wakeup.is_set())
+        buffer.notify()
+        self.assertTrue(buffer._wakeup.is_set())
+
+    @patch(mock_process_inbox)
+    @patch(mock_buffer + "._flush_loop")
+    def test_buffer_flush(self, flush_loop, process_inbox):
+        """ The flush stores the inbox by chunks until it is empty. """
+        process_inbox.side_effect = [2, 2, 1]
+        buffer = IngestBuffer(self.env.cr.dbname)
+        buffer.size = 2
+        buffer.notify()
+        buffer.flush()
+        self.assertEqual(process_inbox.call_count, 3)
+        process_inbox.assert_called_with(limit=2)
+        self.assertEqual(buffer._pending, 0)
@@ -0,0 +1,59 @@
+##############################################################################
+#
+#    Copyright (C) 2019 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+from mock import MagicMock, patch
+
+from odoo.tests import TransactionCase
+from ..tools.onramp_connector import OnrampConnector
+
+mock_connector = "odoo.addons.message_center_compassion.tools.onramp_connector."
+
+
+def _response(status, headers=None):
+    response = MagicMock()
+    response.status_code = status
+    response.headers = headers or {}
+    return response
+
+
+@patch(mock_connector + "time.sleep")
+@patch(mock_connector + "OnrampConnector._get_token_header", return_value={})
+class TestOnrampConnector(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        # Avoid the singleton which requires the Connect configuration
+        self.connector = object.__new__(OnrampConnector)
+        self.connector._session = MagicMock()
+
+    def _request(self, method, *statuses):
+        self.connector._session.request.side_effect = list(statuses)
+        return self.connector._request(method, "https://connect/test")
+
+    def test_get_retried_on_gateway_error(self, token, sleep):
+        response = self._request("GET", _response(502), _response(200))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.retries, 1)
+
+    def test_post_not_retried_on_gateway_error(self, token, sleep):
+        """ Connect may have handled a POST answered by 500, 502 or 504:
+        the answer is returned without sending the request again. """
+        for status in (500, 502, 503, 504):
+            response = self._request("POST", _response(status), _response(200))
+            self.assertEqual(response.status_code, status)
+            self.assertEqual(response.retries, 0)
+        self.assertEqual(self.connector._session.request.call_count, 4)
+        sleep.assert_not_called()
+
+    def test_post_retried_when_refused(self, token, sleep):
+        response = self._request("POST", _response(429), _response(200))
+        self.assertEqual(response.status_code, 200)
+        response = self._request(
+            "PUT", _response(503, {"Retry-After": "2"}), _response(200))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.retries, 1)
+        sleep.assert_called_with(2.0)
@@ -1,2 +1,3 @@
 from . import onramp_connector
 from . import load_mappings
+from . import ingest_buffer
@@ -0,0 +1,128 @@
+##############################################################################
+#
+#    Copyright (C) 2020 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#    @author: Emanuel Cino <ecino@compassion.ch>
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import atexit
+import logging
+import threading
+import time
+
+import odoo
+from odoo import api, SUPERUSER_ID
+from odoo.tools.config import config
+
+_logger = logging.getLogger(__name__)
+
+
+class IngestBuffer(object):
+    """ Write-behind buffer of the messages received on /onramp.
+
+    The received messages are inserted in the gmc.message.inbox table before
+    GMC gets the confirmation, and the buffer of the worker creates their
+    gmc.message in bulk, either when enough messages were received or after
+    a short delay, so that notification storms from GMC don't need a full
+    message creation per request. Messages left in the inbox by a stopped
+    worker are stored by the next flush or by a cron.
+    Settings are read from the Odoo configuration file:
+
+    - onramp_buffered_ingest: set to True for enabling the buffer
+    - onramp_buffer_size: number of messages flushed at once (default 100)
+    - onramp_buffer_interval: maximum delay in seconds before a received
+      message is stored in the database (default 2)
+    """
+
+    # Buffer of each database
+    _buffers = dict()
+    _buffers_lock = threading.Lock()
+
+    def __init__(self, dbname):
+        self.dbname = dbname
+        self.size = int(config.get("onramp_buffer_size") or 100)
+        self.interval = float(config.get("onramp_buffer_interval") or 2)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Number of messages received since the last flush
+        self._pending = 0
+        self._first_time = None
+        self._wakeup = threading.Event()
+        thread = threading.Thread(
+            target=self._flush_loop, name="onramp.buffer." + dbname, daemon=True)
+        thread.start()
+
+    @classmethod
+    def enabled(cls):
+        return str(config.get("onramp_buffered_ingest", "")).lower() in (
+            "1", "true", "yes")
+
+    @classmethod
+    def get(cls, dbname):
+        """ Returns the buffer of the given database. """
+        with cls._buffers_lock:
+            buffer = cls._buffers.get(dbname)
+            if buffer is None:
+                buffer = cls._buffers[dbname] = cls(dbname)
+            return buffer
+
+    @classmethod
+    def flush_all(cls):
+        for buffer in list(cls._buffers.values()):
+            buffer.flush()
+
+    def notify(self):
+        """
+        Signals that a message was inserted in the inbox. It must be called
+        after the transaction inserting the message is committed.
+        :return: None
+        """
+        with self._lock:
+            if not self._pending:
+                self._first_time = time.time()
+            self._pending += 1
+            full = self._pending >= self.size
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """ Creates the messages waiting in the inbox. """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, 0
+                self._first_time = None
+            stored = 0
+            try:
+                registry = odoo.registry(self.dbname)
+                with api.Environment.manage():
+                    processed = self.size
+                    while processed >= self.size:
+                        with registry.cursor() as cr:
+                            env = api.Environment(cr, SUPERUSER_ID, {})
+                            processed = env["gmc.message.inbox"].process_inbox(
+                                limit=self.size)
+                        stored += processed
+            except Exception:
+                # The messages stay in the inbox for the next flush
+                _logger.error("Failed to store onramp messages", exc_info=True)
+            if stored:
+                _logger.info(
+                    "Stored %s onramp messages (%s received by the worker)",
+                    stored, pending)
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            with self._lock:
+                due = self._pending and (
+                    self._pending >= self.size
+                    or time.time() - self._first_time >= self.interval
+                )
+            if due:
+                self.flush()
+
+
+atexit.register(IngestBuffer.flush_all)
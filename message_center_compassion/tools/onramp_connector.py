@@ -9,10 +9,17 @@
 ##############################################################################
 import json
 import logging
-from datetime import datetime, timedelta
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from json.decoder import JSONDecodeError
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
 from odoo import _
 from odoo.exceptions import UserError
@@ -20,6 +27,175 @@ from odoo.tools.config import config
 
 _logger = logging.getLogger(__name__)
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# HTTP statuses for which a request to Connect is retried
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# HTTP verbs that can be sent twice without side effects
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _config_value(key, default, value_type=int):
+    """ Reads a connector setting from the Odoo configuration file. """
+    value = config.get(key)
+    return value_type(value) if value not in (None, False, "") else default
+
+
+# Maximum number of requests sent at the same time to Connect by a worker
+_concurrency = threading.BoundedSemaphore(
+    _config_value("connect_max_concurrency", 8))
+
+
+class GmcTokenCache(object):
+    """ Thread-safe cache of the GMC OAuth token.
+
+    The token is refreshed ahead of its expiration, by a single thread while
+    the others keep using the current token. When a cache file is available
+    (connect_token_cache setting, or gmc_token.json in the Odoo data
+    directory), the token is shared with the other worker processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._header = None
+        self._expires_at = 0.0
+        self.metrics = {
+            "refresh_count": 0,
+            "refresh_failures": 0,
+            "last_refresh_duration": 0.0,
+            "max_refresh_duration": 0.0,
+            "total_refresh_duration": 0.0,
+            "last_refresh": None,
+            "shared_loads": 0,
+        }
+
+    @property
+    def path(self):
+        path = config.get("connect_token_cache")
+        if path is None and config.get("data_dir"):
+            path = os.path.join(config["data_dir"], "gmc_token.json")
+        return path or None
+
+    def _remaining(self):
+        return self._expires_at - time.time()
+
+    def get_header(self, fetch_token, force=False):
+        """
+        Returns a valid authorization header.
+        :param fetch_token: function returning the header and its validity
+                            in seconds, called when the token must be renewed
+        :param force: set to True for renewing the token
+        :return: dict: Authorisation header
+        """
+        margin = _config_value("connect_token_refresh_margin", 300.0, float)
+        remaining = self._remaining()
+        if not force and self._header and remaining > margin:
+            return self._header
+        if not force and self._header and remaining > 0:
+            # The token is about to expire: only one thread renews it and the
+            # others keep using the current token meanwhile.
+            if not self._lock.acquire(blocking=False):
+                return self._header
+        else:
+            self._lock.acquire()
+        try:
+            if not force and self._header and self._remaining() > margin:
+                return self._header
+            if not force and self._load_shared(margin):
+                return self._header
+            with self._file_lock():
+                # Another process may have renewed the token in the meantime
+                if not force and self._load_shared(margin):
+                    return self._header
+                self._refresh(fetch_token)
+                self._save_shared()
+            return self._header
+        finally:
+            self._lock.release()
+
+    def _refresh(self, fetch_token):
+        start = time.time()
+        try:
+            header, expires_in = fetch_token()
+        except Exception:
+            self.metrics["refresh_failures"] += 1
+            raise
+        duration = time.time() - start
+        self._header = header
+        self._expires_at = start + expires_in
+        metrics = self.metrics
+        metrics["refresh_count"] += 1
+        metrics["last_refresh_duration"] = duration
+        metrics["max_refresh_duration"] = max(metrics["max_refresh_duration"], duration)
+        metrics["total_refresh_duration"] += duration
+        metrics["last_refresh"] = start
+        _logger.info("GMC token refreshed in %.3fs", duration)
+
+    def _load_shared(self, margin):
+        """ Loads the token renewed by another worker process, if still valid. """
+        path = self.path
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with open(path) as token_file:
+                data = json.load(token_file)
+        except (OSError, ValueError):
+            return False
+        if data.get("expires_at", 0) - time.time() <= margin:
+            return False
+        self._header = data["header"]
+        self._expires_at = data["expires_at"]
+        self.metrics["shared_loads"] += 1
+        return True
+
+    def _save_shared(self):
+        path = self.path
+        if not path:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "w") as token_file:
+                json.dump({"header": self._header, "expires_at": self._expires_at},
+                          token_file)
+            os.replace(tmp_path, path)
+        except OSError:
+            _logger.warning("Cannot share GMC token in %s", path, exc_info=True)
+
+    def _file_lock(self):
+        """ Lock preventing several processes from renewing the token. """
+        return _FileLock(self.path and self.path + ".lock")
+
+
+class _FileLock(object):
+    """ Exclusive lock on a file, doing nothing if the file is not usable. """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if self.path and fcntl is not None:
+            try:
+                self._file = open(self.path, "a")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except OSError:
+                _logger.warning("Cannot lock %s", self.path, exc_info=True)
+                self.__exit__()
+        return self
+
+    def __exit__(self, *args):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+# Token shared by all connectors of the worker
+_token_cache = GmcTokenCache()
+
 
 class OnrampConnector(object):
     """ Singleton class to connect to U.S. Onramp in order to send
@@ -28,9 +204,6 @@ class OnrampConnector(object):
     # Private instance of the class
     __instance = None
 
-    # Holds the last time a token was retrieved from GMC.
-    _token_time = None
-
     # Requests Session that will be used across calls to server
     _session = None
 
@@ -46,9 +219,8 @@ class OnrampConnector(object):
             if connect_url and api_key:
                 OnrampConnector.__instance._connect_url = connect_url
                 OnrampConnector.__instance._api_key = api_key
-                session = requests.Session()
-                session.params.update({"api_key": api_key, "gpid": "CH"})
-                OnrampConnector.__instance._session = session
+                OnrampConnector.__instance._session = cls._create_session(
+                    {"api_key": api_key, "gpid": "CH"})
             else:
                 raise UserError(
                     _(
@@ -60,9 +232,7 @@ class OnrampConnector(object):
 
     def __init__(self):
         """ Get a fresh token if needed. """
-        now = datetime.now()
-        if not self._token_time or self._token_time + timedelta(hours=1) <= now:
-            self._retrieve_token()
+        self._session.headers.update(self._get_token_header())
 
     def send_message(self, service_name, message_type, body=None, params=None):
         """ Sends a message to Compassion Connect.
@@ -74,23 +244,26 @@ class OnrampConnector(object):
 
         :returns: A dictionary with the content of the answer to the message.
                   {'code': http_status_code, 'content': response,
-                   'Error': error_message, 'request_id': request id header}
+                   'Error': error_message, 'request_id': request id header,
+                   'duration': seconds spent waiting for Connect,
+                   'retries': number of times the request was retried}
         """
         headers = {"Content-type": "application/json"}
         url = self._connect_url + service_name
         self.log_message(message_type, url, headers, body, self._session)
-        if message_type == "GET":
-            r = self._session.get(url, headers=headers, params=params)
-        elif message_type == "POST":
-            r = self._session.post(url, headers=headers, json=body, params=params)
-        elif message_type == "PUT":
-            r = self._session.put(url, headers=headers, json=body, params=params)
-        else:
+        if message_type not in ("GET", "POST", "PUT"):
             return {"code": 404, "Error": "No valid HTTP verb used"}
+        kwargs = {"headers": headers, "params": params}
+        if message_type != "GET":
+            kwargs["json"] = body
+        start = time.time()
+        r = self._request(message_type, url, **kwargs)
         status = r.status_code
         result = {
             "code": status,
             "request_id": r.headers.get("cf-request-id"),
+            "duration": time.time() - start,
+            "retries": getattr(r, "retries", 0),
         }
         self.log_message(status, "RESULT", message=r.text)
         try:
@@ -103,10 +276,155 @@ class OnrampConnector(object):
             result["content"] = r.text
         return result
 
+    def send_messages(self, messages):
+        """ Sends several messages concurrently to Compassion Connect.
+        The number of requests running at the same time is limited by the
+        connect_max_concurrency setting.
+
+        :param messages: list of dictionaries with the arguments of
+                         send_message (service_name, message_type, body, params)
+        :returns: list of answers as returned by send_message, in the same
+                  order as the messages. Network errors are returned as
+                  {'code': 503, 'Error': error_message}
+        """
+        if not messages:
+            return []
+
+        def _send(message):
+            try:
+                return self.send_message(**message)
+            except requests.RequestException as e:
+                _logger.error("Connect request failed: %s", e)
+                return {"code": 503, "Error": str(e)}
+
+        max_workers = min(len(messages), _config_value("connect_max_concurrency", 8))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_send, messages))
+
+    def _request(self, method, url, **kwargs):
+        """ Performs an HTTP request with the pooled session, retrying
+        with a jittered exponential backoff on network errors and on the
+        statuses that indicate a temporary failure of Connect.
+        Requests that may have changed data in Connect (POST, PUT) are
+        only retried when Connect refused them (429, or 503 with a
+        Retry-After header) or after a network error if they never reached
+        Connect.
+
+        :param method: HTTP verb
+        :param url: url of the request
+        :param kwargs: other arguments passed to requests
+        :returns: requests.Response
+        """
+        kwargs.setdefault("timeout", (
+            _config_value("connect_connect_timeout", 10.0, float),
+            _config_value("connect_timeout", 120.0, float),
+        ))
+        max_retries = _config_value("connect_max_retries", 3)
+        backoff = _config_value("connect_retry_backoff", 1.0, float)
+        attempt = 0
+        token_renewed = False
+        while True:
+            kwargs["headers"] = dict(kwargs.get("headers") or {})
+            kwargs["headers"].update(self._get_token_header())
+            try:
+                with _concurrency:
+                    response = self._session.request(method, url, **kwargs)
+                if response.status_code == 401 and not token_renewed:
+                    # The token was revoked before its expiration
+                    token_renewed = True
+                    response.close()
+                    self._get_token_header(force=True)
+                    continue
+                if attempt >= max_retries or not self._can_retry(method, response):
+                    response.retries = attempt
+                    return response
+                delay = response.headers.get("Retry-After", "")
+                delay = float(delay) if delay.isdigit() else None
+                # Release the connection of streamed responses
+                response.close()
+                _logger.warning(
+                    "[%s] %s returned %s, retrying", method, url, response.status_code)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt >= max_retries or (
+                    method not in IDEMPOTENT_METHODS
+                    and not self._is_unsent(error)
+                ):
+                    raise
+                delay = None
+                _logger.warning("[%s] %s failed, retrying", method, url, exc_info=True)
+            attempt += 1
+            if delay is None:
+                delay = backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            time.sleep(delay)
+
+    @staticmethod
+    def _can_retry(method, response):
+        """
+        Tells if a request can be sent again after receiving the given answer.
+        A gateway error (500, 502, 504) may come after Connect handled the
+        request, hence only requests without side effects are retried then.
+        :param method: HTTP verb of the request
+        :param response: requests.Response received
+        :returns: True if the request can be retried
+        """
+        status = response.status_code
+        if method in IDEMPOTENT_METHODS:
+            return status in RETRY_STATUSES
+        return status == 429 or (
+            status == 503 and "Retry-After" in response.headers)
+
+    @staticmethod
+    def _is_unsent(error):
+        """
+        Tells if a request failed before being sent to Connect, in which
+        case it can safely be sent again.
+        :param error: requests.RequestException raised by the request
+        :returns: True if Connect did not receive the request
+        """
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        if isinstance(error, requests.Timeout):
+            # The request was sent but the answer did not come in time
+            return False
+        reason = error.args[0] if error.args else None
+        # requests wraps the errors of urllib3 in a MaxRetryError
+        reason = getattr(reason, "reason", reason)
+        return isinstance(reason, NewConnectionError)
+
+    @classmethod
+    def _create_session(cls, params):
+        """ Creates a requests session with a connection pool sized for
+        concurrent calls to Connect.
+        :param params: default query parameters of the session
+        :returns: requests.Session
+        """
+        session = requests.Session()
+        session.params.update(params)
+        max_connections = _config_value("connect_max_connections", 10)
+        adapter = HTTPAdapter(
+            pool_connections=max_connections, pool_maxsize=max_connections,
+            pool_block=True
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
     def _retrieve_token(self):
-        """ Retrieves the token from Connect. """
-        self._token_time = datetime.now()
-        self._session.headers.update(self.get_gmc_token())
+        """ Retrieves a new token from Connect. """
+        self._session.headers.update(self._get_token_header(force=True))
+
+    @classmethod
+    def _get_token_header(cls, force=False):
+        """ Returns the authorization header, renewing the token if needed. """
+        return _token_cache.get_header(cls._fetch_gmc_token, force)
+
+    @classmethod
+    def token_metrics(cls):
+        """
+        Gives statistics about the token renewals of the worker.
+        :return: dict with refresh count, failures and durations (seconds)
+        """
+        return dict(_token_cache.metrics)
 
     @classmethod
     def get_gmc_token(cls):
@@ -114,6 +432,14 @@ class OnrampConnector(object):
         Class method that fetches a token from GMC OAuth server.
         :return: dict: Authorisation header.
         """
+        return cls._fetch_gmc_token()[0]
+
+    @classmethod
+    def _fetch_gmc_token(cls):
+        """
+        Fetches a token from GMC OAuth server.
+        :return: tuple (dict: Authorisation header, int: validity in seconds)
+        """
         client = config.get("connect_client")
         secret = config.get("connect_secret")
         provider = config.get("connect_token_server")
@@ -129,12 +455,14 @@ class OnrampConnector(object):
             "Content-type": "application/x-www-form-urlencoded",
         }
         response = requests.post(
-            provider, data=params_post, auth=(client, secret), headers=header_post
+            provider, data=params_post, auth=(client, secret), headers=header_post,
+            timeout=_config_value("connect_timeout", 120.0, float)
         )
         try:
             token = response.json()
-            return {"Authorization": "{token_type} {access_token}".format(**token)}
-        except (AttributeError, KeyError, JSONDecodeError):
+            header = {"Authorization": "{token_type} {access_token}".format(**token)}
+            return header, int(token.get("expires_in") or 3600)
+        except (AttributeError, KeyError, ValueError, JSONDecodeError):
             _logger.error("GMC token retrieval error: %s",
                           response.text, exc_info=True)
             raise UserError(_("Token validation failed."))
@@ -150,6 +478,8 @@ class OnrampConnector(object):
         :param session: session of request
         :return: None
         """
+        if not _logger.isEnabledFor(logging.DEBUG):
+            return
         if headers is None:
             headers = dict()
         if message is None:
@@ -262,11 +262,14 @@ class CompassionCorrespondence(models.Model):
         })
         return super().process_letter()
 
-    @api.model
-    def create(self, vals):
-        letter = super().create(vals)
-        if vals.get("direction") == "Supporter To Beneficiary":
-            letter.mapped("partner_id.app_messages").write({
-                "force_refresh": True
-            })
-        return letter
+    @api.model_create_multi
+    def create(self, vals_list):
+        letters = super().create(vals_list)
+        sponsor_letters = self.browse([
+            letter.id for letter, vals in zip(letters, vals_list)
+            if vals.get("direction") == "Supporter To Beneficiary"
+        ])
+        sponsor_letters.mapped("partner_id.app_messages").write({
+            "force_refresh": True
+        })
+        return letters
@@ -7,7 +7,6 @@
 #    The licence is in the file __manifest__.py
 #
 ##############################################################################
-import requests
 import simplejson
 from odoo.addons.message_center_compassion.tools.onramp_connector import OnrampConnector
 
@@ -32,9 +31,8 @@ class TestOnrampConnector(OnrampConnector):
             if connect_url and api_key:
                 TestOnrampConnector.__instance._connect_url = connect_url
                 TestOnrampConnector.__instance._api_key = api_key
-                session = requests.Session()
-                session.params.update({"api_key": api_key})
-                TestOnrampConnector.__instance._session = session
+                TestOnrampConnector.__instance._session = cls._create_session(
+                    {"api_key": api_key})
             else:
                 raise UserError(
                     _(
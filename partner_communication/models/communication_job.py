@@ -17,12 +17,17 @@ from reportlab.lib.colors import white
 from reportlab.lib.units import mm
 from reportlab.pdfgen.canvas import Canvas
 
+from odoo.addons.queue_job.job import job
+
 from odoo import api, models, fields, _, tools
 from odoo.exceptions import UserError
 
 logger = logging.getLogger(__name__)
 testing = tools.config.get("test_enable")
 
+# Maximum number of communications refreshed by one queue job
+REFRESH_BATCH_SIZE = 100
+
 try:
     from PyPDF2 import PdfFileWriter, PdfFileReader
 except ImportError:
@@ -449,36 +454,105 @@ class CommunicationJob(models.Model):
 
     @api.multi
     def refresh_text(self, refresh_uid=False):
+        """
+        Regenerates the attachments and the texts of the jobs. The jobs using
+        the same template and language are rendered together.
+        :param refresh_uid: set the current user as responsible of the jobs
+        :return: True
+        """
         self.mapped("attachment_ids").unlink()
         failed = self.set_attachments()
-        for job in self - failed:
-            lang = self.env.context.get("lang_preview", job.partner_id.lang)
-            if job.email_template_id and job.object_ids:
-                try:
-                    fields = (
-                        self.env["mail.compose.message"]
-                            .with_context(lang=lang)
-                            .get_generated_fields(job.email_template_id, [job.id])
-                    )
-                    job.write({
-                        "body_html": fields["body_html"],
-                        "subject": fields["subject"],
-                        "state": job.state if job.state != "failure" else "pending"
-                    })
-                except UserError:
-                    logger.error("Failed to generate communication", exc_info=True)
-                    job.env.clear()
-                    if job.state == "pending":
-                        job.write({
-                            "state": "failure",
-                            "body_html": "Error in template"
-                        })
-                finally:
-                    if refresh_uid:
-                        job.user_id = self.env.user
+        to_render = (self - failed).filtered("email_template_id").filtered(
+            "object_ids")
+        for (template, lang), jobs in to_render._get_refresh_groups().items():
+            texts = jobs._render_texts(template, lang)
+            rendered = jobs.filtered(lambda j: j.id in texts)
+            for job in rendered:
+                # The pages are counted once the texts of all jobs are written
+                job.with_context(skip_pdf_count=True).write({
+                    "body_html": texts[job.id]["body_html"],
+                    "subject": texts[job.id]["subject"],
+                })
+            for state in set(rendered.mapped("state")):
+                rendered.filtered(lambda j: j.state == state).write({
+                    "state": state if state != "failure" else "pending"
+                })
+            rendered.filtered("body_html").count_pdf_page()
+            (jobs - rendered).filtered(lambda j: j.state == "pending").write({
+                "state": "failure",
+                "body_html": "Error in template"
+            })
+        if refresh_uid:
+            to_render.write({"user_id": self.env.uid})
+        return True
 
+    @api.multi
+    def refresh_text_async(self, refresh_uid=False):
+        """
+        Refreshes the jobs in background, with one queue job for each batch
+        of jobs using the same template and language, so that they are
+        rendered in parallel.
+        :param refresh_uid: set the current user as responsible of the jobs
+        :return: True
+        """
+        for jobs in self._get_refresh_groups().values():
+            for i in range(0, len(jobs), REFRESH_BATCH_SIZE):
+                jobs[i:i + REFRESH_BATCH_SIZE].with_delay().refresh_text_job(
+                    refresh_uid)
         return True
 
+    @api.multi
+    @job(default_channel="root.partner_communication")
+    def refresh_text_job(self, refresh_uid=False):
+        return self.exists().refresh_text(refresh_uid)
+
+    @api.multi
+    def action_refresh_text(self):
+        """ Refresh from the user interface, in background for big
+        selections. """
+        if len(self) > REFRESH_BATCH_SIZE:
+            return self.refresh_text_async(refresh_uid=True)
+        return self.refresh_text(refresh_uid=True)
+
+    def _get_refresh_groups(self):
+        """
+        Groups the jobs that can be rendered together.
+        :return: dict {(mail.template, lang): partner.communication.job}
+        """
+        groups = defaultdict(lambda: self.browse())
+        lang_preview = self.env.context.get("lang_preview")
+        for job in self:
+            groups[(job.email_template_id, lang_preview or job.partner_id.lang)] += job
+        return groups
+
+    def _render_texts(self, template, lang):
+        """
+        Renders the texts of jobs using the same template and language in one
+        pass. If the rendering fails, the jobs are rendered one by one to
+        find the failing ones.
+        :param template: mail.template record
+        :param lang: language of the texts
+        :return: dict {job id: generated fields}, without the failed jobs
+        """
+        try:
+            values = (
+                self.env["mail.compose.message"]
+                    .with_context(lang=lang)
+                    .get_generated_fields(template, self.ids)
+            )
+        except UserError:
+            self.env.clear()
+            if len(self) == 1:
+                logger.error("Failed to generate communication", exc_info=True)
+                return dict()
+            res = dict()
+            for job in self:
+                res.update(job._render_texts(template, lang))
+            return res
+        if not isinstance(values, list):
+            values = [values]
+        return dict(zip(self.ids, values))
+
     @api.multi
     def quick_refresh(self):
         # Only refresh text and subject, all at once
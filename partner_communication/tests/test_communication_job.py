@@ -8,6 +8,9 @@
 ##############################################################################
 import logging
 
+from mock import patch
+
+from odoo.exceptions import UserError
 from odoo.tests.common import TransactionCase
 
 logger = logging.getLogger(__name__)
@@ -166,6 +169,64 @@ class TestCommunicationJob(TransactionCase):
         # until now.
         self.assertEqual(self.partner.communication_count, 2)
 
+    def test_refresh_groups(self):
+        other_partner = self.env["res.partner"].browse(self.ref("base.res_partner_3"))
+        other_partner.lang = self.partner.lang
+        jobs = self.env["partner.communication.job"].create(
+            [
+                {"partner_id": self.partner.id, "config_id": self.config.id},
+                {"partner_id": other_partner.id, "config_id": self.config.id},
+            ]
+        )
+        # Both jobs use the same template and language
+        groups = jobs._get_refresh_groups()
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(list(groups.values())[0], jobs)
+        groups = jobs.with_context(lang_preview="fr_CH")._get_refresh_groups()
+        self.assertEqual(list(groups.keys())[0][1], "fr_CH")
+        self.assertTrue(jobs.refresh_text())
+
+    def test_refresh_group_failure(self):
+        """ When the rendering of a group fails, its jobs are rendered one by
+        one: only the failing job is marked as failed. """
+        self.config.email_template_id = self.env["mail.template"].create({
+            "name": "Refresh test",
+            "model_id": self.ref(
+                "partner_communication.model_partner_communication_job"),
+            "subject": "Refresh test",
+            "body_html": "<p>Refresh test</p>",
+        })
+        partners = self.partner + self.env["res.partner"].browse(
+            [self.ref("base.res_partner_3"), self.ref("base.res_partner_4")])
+        partners.write({"lang": self.partner.lang})
+        jobs = self.env["partner.communication.job"].create([
+            {"partner_id": partner.id, "config_id": self.config.id}
+            for partner in partners
+        ])
+        failing_job = jobs[1]
+
+        def get_generated_fields(wizard, template, res_ids):
+            if failing_job.id in res_ids:
+                raise UserError("Rendering failed")
+            values = [
+                {"body_html": "<p>Job %s</p>" % res_id, "subject": "Refreshed"}
+                for res_id in res_ids
+            ]
+            return values[0] if len(values) == 1 else values
+
+        with patch.object(
+                type(self.env["mail.compose.message"]), "get_generated_fields",
+                autospec=True, side_effect=get_generated_fields) as render:
+            self.assertTrue(jobs.refresh_text())
+        # One call for the group, then one for each job
+        self.assertEqual(render.call_count, 4)
+        self.assertEqual(failing_job.state, "failure")
+        self.assertEqual(failing_job.body_html, "Error in template")
+        for job in jobs - failing_job:
+            self.assertEqual(job.state, "pending")
+            self.assertEqual(job.subject, "Refreshed")
+            self.assertIn("Job %s" % job.id, job.body_html)
+
     def test_omr_generation(self):
         job = self.env["partner.communication.job"].create(
             {"partner_id": self.partner.id, "config_id": self.config.id}
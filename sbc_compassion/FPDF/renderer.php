@@ -0,0 +1,37 @@
+<?php
+// Errors must not be mixed with the PDFs written on the standard output
+ini_set('display_errors', 'stderr');
+require('src/myfpdf.php');
+require('src/pdfcreator.php');
+
+/**
+* Long-lived version of pdf.php, launched once by Python to generate many PDFs.
+* It reads JSON descriptions of PDFs from the standard input and writes the
+* generated PDFs on the standard output, until the input is closed.
+* Each message is preceded by a line holding its length in bytes. The length
+* is -1 if the PDF could not be generated, in which case the error is written
+* on the standard error.
+*/
+
+while(($line = fgets(STDIN)) !== false)
+{
+    $length = (int)trim($line);
+    $json = '';
+    while(strlen($json) < $length && !feof(STDIN))
+    {
+        $json .= fread(STDIN, $length - strlen($json));
+    }
+    try
+    {
+        $pdfCreator = new PDFCreator(json_decode($json, true));
+        $pdf = $pdfCreator->createPDF();
+        fwrite(STDOUT, strlen($pdf) . "\n" . $pdf);
+    }
+    catch(Throwable $e)
+    {
+        fwrite(STDERR, $e->getMessage() . "\n");
+        fwrite(STDOUT, "-1\n");
+    }
+    fflush(STDOUT);
+}
+?>
@@ -11,9 +11,9 @@ class Header extends PositionedObject
     protected $text;
     protected $height;
 
-    function __construct($filename, $minX, $minY, $maxX, $maxY, $height=TemplateUtils::DEFAULT_CELL_HEIGHT)
+    function __construct($source, $minX, $minY, $maxX, $maxY, $height=TemplateUtils::DEFAULT_CELL_HEIGHT)
     {
-        $this->text = utf8_decode(file_get_contents($filename));
+        $this->text = ReadTextSource($source);
         $this->height = $height;
 
         parent::__construct($minX, $minY, $maxX, $maxY);
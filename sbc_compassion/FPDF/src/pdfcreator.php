@@ -82,9 +82,10 @@ class PDFCreator
 
 
     /**
-    *
+    * Writes the PDF in the given file, or returns it as a string if no file
+    * name is given.
     */
-    function createPDF($pdf_name)
+    function createPDF($pdf_name=null)
     {
         // SET UP
         $pdf = new MyFPDF($this->utils);
@@ -111,7 +112,7 @@ class PDFCreator
         }
 
         // COMPLETE THE END OF THE PDF AND WRITE IT
-        $this->CompleteAndWritePDF($pdf, $pdf_name);
+        return $this->CompleteAndWritePDF($pdf, $pdf_name);
     }
 
 
@@ -273,7 +274,11 @@ class PDFCreator
             }
             array_splice($this->images, 0, 2);
         }
-        $pdf->Output("F", $pdf_name);
+        if($pdf_name === null)
+        {
+            return $pdf->Output("S");
+        }
+        return $pdf->Output("F", $pdf_name);
     }
 
 
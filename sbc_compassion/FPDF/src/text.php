@@ -6,14 +6,27 @@
 * Author:  Théo Nikles (theo.nikles@gmail.com)                                 *
 *******************************************************************************/
 
+/**
+* Returns the text of a source, which is either the name of a file holding the
+* text or an array holding directly the text as its only element.
+*/
+function ReadTextSource($source)
+{
+    if(is_array($source))
+    {
+        return utf8_decode($source[0]);
+    }
+    return utf8_decode(file_get_contents($source));
+}
+
 class Text
 {
     protected $text;
     protected $type;
 
-    function __construct($filename, $type)
+    function __construct($source, $type)
     {
-        $this->text = utf8_decode(file_get_contents($filename));
+        $this->text = ReadTextSource($source);
         $this->type = $type;
     }
 
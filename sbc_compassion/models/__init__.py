@@ -16,6 +16,7 @@ from . import correspondence_template
 from . import import_config
 from . import import_letters_history
 from . import import_letter_line
+from . import barcode_strategy_stat
 from . import contracts
 from . import correspondence_positioned_objects
 from . import project_compassion
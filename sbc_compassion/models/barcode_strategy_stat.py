@@ -0,0 +1,66 @@
+##############################################################################
+#
+#    Copyright (C) 2020 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+from odoo import api, models, fields, _
+
+
+class BarcodeStrategyStat(models.Model):
+    """ Number of letter barcodes found by each reading strategy of
+    read_barcode, used to try the best strategies first. """
+
+    _name = "letter.barcode.strategy.stat"
+    _description = "Letter barcode reading statistics"
+    _rec_name = "strategy"
+    _order = "count desc"
+
+    strategy = fields.Char(required=True, readonly=True)
+    count = fields.Integer(readonly=True)
+
+    _sql_constraints = [
+        (
+            "unique_strategy",
+            "unique(strategy)",
+            _("The barcodes are counted once for each strategy"),
+        )
+    ]
+
+    @api.model
+    def get_stats(self):
+        """
+        :return: dict with the number of barcodes found by each strategy
+        """
+        self.env.cr.execute(
+            "SELECT strategy, count FROM letter_barcode_strategy_stat")
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def add_stats(self, found):
+        """
+        Adds the barcodes found by the strategies, incrementing the counters
+        in the database so that concurrent imports don't lose counts.
+        :param found: dict with the number of barcodes found by each strategy
+        :return: the updated statistics
+        """
+        for strategy, count in found.items():
+            self.env.cr.execute(
+                """
+                INSERT INTO letter_barcode_strategy_stat (
+                    strategy, count, create_uid, create_date, write_uid,
+                    write_date)
+                VALUES (%(strategy)s, %(count)s, %(uid)s,
+                        now() at time zone 'UTC', %(uid)s,
+                        now() at time zone 'UTC')
+                ON CONFLICT (strategy) DO UPDATE SET
+                    count = letter_barcode_strategy_stat.count + EXCLUDED.count,
+                    write_uid = EXCLUDED.write_uid,
+                    write_date = EXCLUDED.write_date
+                """,
+                {"strategy": strategy, "count": count, "uid": self.env.uid},
+            )
+        self.invalidate_cache()
+        return self.get_stats()
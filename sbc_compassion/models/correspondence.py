@@ -19,6 +19,7 @@ from odoo.exceptions import UserError
 from odoo.tools import config
 from .correspondence_page import BOX_SEPARATOR, PAGE_SEPARATOR
 from ..tools.onramp_connector import SBCConnector
+from ..tools.pdf_cache import PDFCache, get_cache_key
 
 _logger = logging.getLogger(__name__)
 test_mode = config.get("test_enable")
@@ -458,67 +459,85 @@ class Correspondence(models.Model):
     ##########################################################################
     #                              ORM METHODS                               #
     ##########################################################################
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         """ Fill missing fields.
         The field `letter_image` is a binary and will be stored in an ir.attachment
         If `stored_letter_image` is set to False, `letter_image` is dropped and PDFs
         will be generated when requested using the template and
         """
-        if (
-                vals.get("direction", "Supporter To Beneficiary")
-                == "Supporter To Beneficiary"
-        ):
-            vals["communication_type_ids"] = [
-                (4, self.env.ref("sbc_compassion.correspondence_type_supporter").id)
-            ]
-            if not vals.get("translation_language_id"):
-                vals["translation_language_id"] = vals.get("original_language_id")
-        else:
-            vals["status_date"] = fields.Datetime.now()
-            if "communication_type_ids" not in vals:
-                vals["communication_type_ids"] = [
-                    (4, self.env.ref("sbc_compassion.correspondence_type_scheduled").id)
-                ]
-            # Allows manually creating a B2S letter
-            if vals.get("state", "Received in the system") == "Received in the system":
-                vals["state"] = "Published to Global Partner"
-
-        if vals.get("store_letter_image", True) is False:
-            vals["letter_image"] = False
-
-        contract = self.env["recurring.contract"].browse(vals["sponsorship_id"])
-        if vals.get("direction") == "Supporter To Beneficiary":
-            contract.last_sponsor_letter = fields.Date.today()
-
-        if "partner_id" not in vals:
-            vals["partner_id"] = contract.correspondent_id.id
-
-        type_ = ".pdf"
-        letter_data = False
-        if vals.get("letter_image"):
-            letter_data = base64.b64decode(vals["letter_image"])
-            ftype = magic.from_buffer(letter_data, True).lower()
-            if "pdf" in ftype:
-                type_ = ".pdf"
-            elif "tiff" in ftype:
-                type_ = ".tiff"
+        supporter_type = self.env.ref("sbc_compassion.correspondence_type_supporter")
+        scheduled_type = self.env.ref("sbc_compassion.correspondence_type_scheduled")
+        # Number of pages of each letter image, inspected once for each image
+        image_pages = dict()
+        letters_pages = list()
+        sponsor_letter_contracts = self.env["recurring.contract"]
+        for vals in vals_list:
+            if (
+                    vals.get("direction", "Supporter To Beneficiary")
+                    == "Supporter To Beneficiary"
+            ):
+                vals["communication_type_ids"] = [(4, supporter_type.id)]
+                if not vals.get("translation_language_id"):
+                    vals["translation_language_id"] = vals.get("original_language_id")
             else:
-                raise UserError(_("You can only attach tiff or pdf files"))
-
-        letter = super().create(vals)
-        letter.file_name = letter._get_file_name()
-        if letter_data and type_ == ".pdf":
+                vals["status_date"] = fields.Datetime.now()
+                if "communication_type_ids" not in vals:
+                    vals["communication_type_ids"] = [(4, scheduled_type.id)]
+                # Allows manually creating a B2S letter
+                if vals.get("state", "Received in the system") == \
+                        "Received in the system":
+                    vals["state"] = "Published to Global Partner"
+
+            if vals.get("store_letter_image", True) is False:
+                vals["letter_image"] = False
+
+            contract = self.env["recurring.contract"].browse(vals["sponsorship_id"])
+            if vals.get("direction") == "Supporter To Beneficiary":
+                sponsor_letter_contracts |= contract
+
+            if "partner_id" not in vals:
+                vals["partner_id"] = contract.correspondent_id.id
+
+            letter_image = vals.get("letter_image")
+            if letter_image and letter_image not in image_pages:
+                image_pages[letter_image] = self._get_image_pages(letter_image)
+            letters_pages.append(image_pages.get(letter_image, 0))
+
+        if sponsor_letter_contracts:
+            sponsor_letter_contracts.write({"last_sponsor_letter": fields.Date.today()})
+
+        letters = super().create(vals_list)
+        pages_vals = list()
+        for letter, nb_pages in zip(letters, letters_pages):
+            letter.file_name = letter._get_file_name()
             # Set the correct number of pages
-            image_pdf = PdfFileReader(BytesIO(letter_data))
-            if letter.nbr_pages < image_pdf.numPages:
-                for i in range(letter.nbr_pages, image_pdf.numPages):
-                    letter.page_ids.create({"correspondence_id": letter.id})
+            pages_vals.extend(
+                {"correspondence_id": letter.id}
+                for i in range(letter.nbr_pages, nb_pages)
+            )
+        if pages_vals:
+            self.env["correspondence.page"].create(pages_vals)
 
         if not self.env.context.get("no_comm_kit"):
-            letter.create_commkit()
+            letters.create_commkit()
+
+        return letters
 
-        return letter
+    @api.model
+    def _get_image_pages(self, letter_image):
+        """
+        Checks the type of a letter image and counts its pages.
+        :param letter_image: base64 image of the letter
+        :return: number of pages of a PDF, 0 for a TIFF image
+        """
+        letter_data = base64.b64decode(letter_image)
+        ftype = magic.from_buffer(letter_data, True).lower()
+        if "pdf" in ftype:
+            return PdfFileReader(BytesIO(letter_data)).numPages
+        elif "tiff" in ftype:
+            return 0
+        raise UserError(_("You can only attach tiff or pdf files"))
 
     @api.multi
     def write(self, vals):
@@ -563,28 +582,34 @@ class Correspondence(models.Model):
     ##########################################################################
     @api.multi
     def create_commkit(self):
-        for letter in self:
-            action_id = self.env.ref("sbc_compassion.create_letter").id
-            message = self.env["gmc.message"].create(
+        """ Creates the messages sending the letters to GMC, all at once. """
+        action_id = self.env.ref("sbc_compassion.create_letter").id
+        messages = self.env["gmc.message"].create(
+            [
                 {
                     "action_id": action_id,
                     "object_id": letter.id,
                     "child_id": letter.child_id.id,
                     "partner_id": letter.partner_id.id,
                 }
-            )
-            if (
-                    letter.sponsorship_id.state not in ("active", "terminated")
-                    or letter.child_id.project_id.hold_s2b_letters
-            ):
-                message.state = "postponed"
-                if letter.child_id.project_id.hold_s2b_letters:
-                    letter.state = "Exception"
-                    letter.message_post(
-                        body=_(
-                            "Letter was put on hold because the project is suspended"),
-                        subject=_("Project suspended"),
-                    )
+                for letter in self
+            ]
+        )
+        postponed = self.filtered(
+            lambda l: l.sponsorship_id.state not in ("active", "terminated")
+            or l.child_id.project_id.hold_s2b_letters
+        )
+        messages.filtered(lambda m: m.object_id in postponed.ids).write(
+            {"state": "postponed"})
+        on_hold = postponed.filtered("child_id.project_id.hold_s2b_letters")
+        if on_hold:
+            on_hold.write({"state": "Exception"})
+            for letter in on_hold:
+                letter.message_post(
+                    body=_(
+                        "Letter was put on hold because the project is suspended"),
+                    subject=_("Project suspended"),
+                )
         return True
 
     @api.multi
@@ -684,17 +709,27 @@ class Correspondence(models.Model):
 
     @api.model
     def process_commkit(self, commkit_data):
-        """ Update or Create the letter with given values. """
-        letter_ids = list()
-        process_letters = self
-        for commkit in commkit_data.get("Responses", [commkit_data]):
-            vals = self.json_to_data(commkit)
-            published_state = "Published to Global Partner"
-            is_published = vals.get("state") == published_state
+        """ Update or Create the letters with given values.
+        The existing letters are searched at once and the new ones are
+        created together. """
+        published_state = "Published to Global Partner"
+        commkits = commkit_data.get("Responses", [commkit_data])
+        vals_list = self.json_to_data(commkits)
+        kit_identifiers = [vals.get("kit_identifier") for vals in vals_list]
+        letters = {
+            letter.kit_identifier: letter
+            for letter in self.search(
+                [("kit_identifier", "in", [k for k in kit_identifiers if k])]
+            )
+        }
 
-            # Write/update letter
-            kit_identifier = vals.get("kit_identifier")
-            letter = self.search([("kit_identifier", "=", kit_identifier)])
+        # Write/update letters and collect the new ones
+        to_create = dict()
+        published = dict()
+        for index, vals in enumerate(vals_list):
+            is_published = vals.get("state") == published_state
+            kit_identifier = vals.get("kit_identifier") or index
+            letter = letters.get(kit_identifier)
             if letter:
                 # Avoid to publish twice a same letter
                 is_published = is_published and letter.state != published_state
@@ -703,26 +738,77 @@ class Correspondence(models.Model):
             else:
                 if "id" in vals:
                     del vals["id"]
-                letter = self.with_context(no_comm_kit=True).create(vals)
+                to_create.setdefault(kit_identifier, dict()).update(vals)
+            published[kit_identifier] = published.get(kit_identifier) or is_published
 
-            if is_published:
-                process_letters += letter
+        if to_create:
+            new_letters = self.with_context(no_comm_kit=True).create(
+                list(to_create.values()))
+            letters.update(zip(to_create.keys(), new_letters))
 
+        letter_ids = list()
+        process_letters = self
+        for index, kit_identifier in enumerate(kit_identifiers):
+            letter = letters[kit_identifier or index]
+            if published[kit_identifier or index] and letter not in process_letters:
+                process_letters += letter
             letter_ids.append(letter.id)
 
         process_letters.process_letter()
         return letter_ids
 
+    @api.model
+    def process_commkit_batch(self, commkits):
+        """ Batch variant of process_commkit, used when several messages
+        with letters are received: the letters of all messages are processed
+        together.
+        :param commkits: list of commkit data
+        :return: list of letter ids for each message
+        """
+        responses = [
+            commkit_data.get("Responses", [commkit_data]) for commkit_data in commkits
+        ]
+        letter_ids = iter(self.process_commkit(
+            {"Responses": [data for commkit in responses for data in commkit]}
+        ))
+        return [[next(letter_ids) for data in commkit] for commkit in responses]
+
     def on_send_to_connect(self):
         """
         Method called before Letter is sent to GMC.
         Upload the image to Persistence if not already done.
+        The images are generated and uploaded concurrently by small batches,
+        so that only the images being sent are kept in memory. The URLs of
+        the uploaded images are saved even if other uploads fail.
         """
-        onramp = SBCConnector()
-        for letter in self.filtered(lambda l: not l.original_letter_url):
-            letter.original_letter_url = onramp.send_letter_image(
-                letter.get_image(), letter.letter_format, base64encoded=False
+        letters = self.filtered(lambda l: not l.original_letter_url)
+        if not letters:
+            return
+        connector = SBCConnector()
+        batch_size = int(config.get("connect_max_concurrency") or 8)
+        errors = list()
+        for i in range(0, len(letters), batch_size):
+            batch = letters[i: i + batch_size]
+            results = connector.send_letter_images(
+                [
+                    {
+                        "image_data": image,
+                        "image_type": letter.letter_format,
+                        "base64encoded": False,
+                    }
+                    for letter, image in zip(batch, batch.get_images())
+                ]
             )
+            for letter, result in zip(batch, results):
+                if result.get("url"):
+                    letter.original_letter_url = result["url"]
+                else:
+                    errors.append(f"{letter.name}: {result['error']}")
+        if errors:
+            # Keep the uploaded images for the next attempt
+            if not test_mode:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            raise UserError("\n".join(errors))
 
     @api.multi
     def enrich_letter(self, vals):
@@ -756,24 +842,33 @@ class Correspondence(models.Model):
 
     @api.multi
     def download_attach_letter_image(self, letter_type="final_letter_url"):
-        """ Download letter image from US service and attach to letter. """
+        """ Download letter image from US service and attach to letter.
+        The images are downloaded concurrently. """
+        letters = self.filtered(letter_type)
+        images = dict()
+        if letters:
+            results = SBCConnector().get_letter_images(
+                letters.mapped(letter_type), "pdf", dpi=300)  # resolution
+            images = {
+                letter.id: result.get("data")
+                for letter, result in zip(letters, results)
+            }
+        missing = self.env[self._name]
         for letter in self:
-            # Download and store letter
-            letter_url = getattr(letter, letter_type)
-            image_data = None
-            if letter_url:
-                image_data = SBCConnector().get_letter_image(
-                    letter_url, "pdf", dpi=300
-                )  # resolution
+            # Store letter
+            image_data = images.get(letter.id)
             if image_data is None:
-                raise UserError(
-                    _(
-                        "Image of letter %s was not found remotely."
-                    ) % letter.kit_identifier
-                )
+                missing += letter
+                continue
             letter.write(
                 {"file_name": letter._get_file_name(), "letter_image": image_data}
             )
+        if missing:
+            raise UserError(
+                _(
+                    "Image of letter %s was not found remotely."
+                ) % ", ".join(missing.mapped(lambda l: l.kit_identifier or ""))
+            )
 
     @api.multi
     def attach_original(self):
@@ -789,31 +884,89 @@ class Correspondence(models.Model):
 
         return base64.b64decode(self.letter_image)
 
+    @api.multi
+    def get_images(self):
+        """
+        Retrieves the images of several letters. The PDFs of the letters
+        without stored image are generated together.
+        :return: list of image data, in the same order as the letters
+        """
+        to_generate = self.filtered(
+            lambda l: not l.store_letter_image or not l.letter_image)
+        generated = dict(zip(to_generate.ids, to_generate.generate_original_pdfs()))
+        return [
+            generated[letter.id] if letter.id in generated
+            else base64.b64decode(letter.letter_image)
+            for letter in self
+        ]
+
     def generate_original_pdf(self):
         """
         For S2B
         Generate a PDF with `template_id`, `original_attachment_ids` and `original_text`
         """
         self.ensure_one()
-        sponsor = self.sponsorship_id.correspondent_id
-        child = self.sponsorship_id.child_id
-        pdf_name = self.name or _("Letter")
-
-        header = (
-            f"{sponsor.global_id} - {sponsor.preferred_name}\n"
-            f"{child.local_id} - {child.preferred_name} - "
-            f"{child.gender == 'F' and 'Female' or 'Male'} - {child.age}"
-        )
+        return self.generate_original_pdfs()[0]
 
-        image_data = self.mapped("original_attachment_ids.datas") or []
-        text_data = {"Original": [self.original_text]}
-        if self.kit_identifier:
-            # Only compose translation if the letter was already transmitted
-            # to GMC (to avoid transmitting PDF with translation boxes filled)
-            text_data["Translation"] = self._get_translation_boxes()[1]
-        return self.template_id.generate_pdf(
-            pdf_name, (header, ""), text_data, image_data
-        )
+    @api.multi
+    def generate_original_pdfs(self):
+        """
+        Generates the PDFs of several S2B letters. The PDFs that are not
+        in the cache are generated with one call to the PDF renderer.
+        :return: list of PDF data (False if a PDF could not be generated),
+                 in the same order as the letters
+        """
+        cache = PDFCache(self.env)
+        pdfs = list()
+        to_generate = list()
+        for letter in self:
+            sponsor = letter.sponsorship_id.correspondent_id
+            child = letter.sponsorship_id.child_id
+            header = (
+                f"{sponsor.global_id} - {sponsor.preferred_name}\n"
+                f"{child.local_id} - {child.preferred_name} - "
+                f"{child.gender == 'F' and 'Female' or 'Male'} - {child.age}"
+            )
+
+            attachments = letter.original_attachment_ids
+            text_data = {"Original": [letter.original_text]}
+            if letter.kit_identifier:
+                # Only compose translation if the letter was already
+                # transmitted to GMC (to avoid transmitting PDF with
+                # translation boxes filled)
+                text_data["Translation"] = letter._get_translation_boxes()[1]
+
+            # The PDF is cached using everything needed to generate it
+            cache_key = get_cache_key(
+                letter.template_id.get_layout_signature(),
+                self.env.lang,
+                header,
+                text_data,
+                attachments.mapped("checksum"),
+            )
+            pdf = cache.get(cache_key)
+            if pdf is None:
+                to_generate.append((
+                    len(pdfs),
+                    cache_key,
+                    (
+                        letter.template_id,
+                        (header, ""),
+                        text_data,
+                        attachments.mapped("datas") or [],
+                        None,
+                    ),
+                ))
+            pdfs.append(pdf)
+
+        if to_generate:
+            generated = self.env["correspondence.template"].generate_pdfs(
+                [pdf_values for index, cache_key, pdf_values in to_generate])
+            for (index, cache_key, pdf_values), pdf in zip(to_generate, generated):
+                if pdf:
+                    cache.set(cache_key, pdf)
+                pdfs[index] = pdf
+        return pdfs
 
     def download_pdf(self):
         return {
@@ -940,52 +1093,93 @@ class Correspondence(models.Model):
 
     @api.model
     def json_to_data(self, json, mapping_name=None):
-        template_name = json.pop("Template", "CH-A-6S11-1")
-        odoo_data = super().json_to_data(json, mapping_name)
-
-        if not template_name.startswith("CH"):
-            template = self.env["correspondence.template"].search(
-                [("name", "like", "L" + template_name[5]), ("name", "like", "B2S")],
-                limit=1,
-            )
-            odoo_data["template_id"] = template.id
-
-        if "child_id" in odoo_data and "partner_id" in odoo_data:
-            partner = odoo_data.pop("partner_id")
-            child = odoo_data.pop("child_id")
-            sponsorship = self.env["recurring.contract"].search(
+        """ Converts one or several letters received from GMC. The
+        sponsorships, templates and pages of all the letters are searched
+        at once. """
+        json_list = json if isinstance(json, list) else [json]
+        template_names = [
+            letter_json.pop("Template", "CH-A-6S11-1") for letter_json in json_list
+        ]
+        odoo_data_list = super().json_to_data(json_list, mapping_name)
+        if isinstance(odoo_data_list, dict):
+            odoo_data_list = [odoo_data_list]
+
+        templates = dict()
+        for template_name in set(template_names):
+            if not template_name.startswith("CH"):
+                templates[template_name] = self.env["correspondence.template"].search(
+                    [("name", "like", "L" + template_name[5]),
+                     ("name", "like", "B2S")],
+                    limit=1,
+                ).id
+
+        # Search the sponsorships of all letters
+        sponsorship_keys = list()
+        for odoo_data in odoo_data_list:
+            key = None
+            if "child_id" in odoo_data and "partner_id" in odoo_data:
+                partner = odoo_data.pop("partner_id")
+                child = odoo_data.pop("child_id")
+                key = (partner.get("global_id"), child.get("global_id"))
+            sponsorship_keys.append(key)
+        sponsorships = dict()
+        keys = [key for key in sponsorship_keys if key]
+        if keys:
+            for sponsorship in self.env["recurring.contract"].search(
                 [
-                    ("correspondent_id.global_id", "=", partner.get("global_id")),
-                    ("child_id.global_id", "=", child.get("global_id")),
-                ],
-                limit=1,
-            )
-            if sponsorship:
-                odoo_data["sponsorship_id"] = sponsorship.id
-
-        # Replace dict by a tuple for the ORM update/create
-        if "page_ids" in odoo_data:
-            pages = list()
-            for page in odoo_data["page_ids"]:
-                page_url = page.get("original_page_url")
-                if not page_url:
-                    # We don't need to save pages not accessible
-                    continue
-                page_id = (
-                    self.env["correspondence.page"]
-                    .search([("original_page_url", "=", page_url)], limit=1)
-                    .id
+                    ("correspondent_id.global_id", "in",
+                     list({key[0] for key in keys})),
+                    ("child_id.global_id", "in", list({key[1] for key in keys})),
+                ]
+            ):
+                sponsorships.setdefault(
+                    (sponsorship.correspondent_id.global_id,
+                     sponsorship.child_id.global_id),
+                    sponsorship.id,
                 )
-                # if page_url already exist update it
-                if page_id:
-                    orm_tuple = (1, page_id, page)
-                # else create a new one
-                else:
-                    orm_tuple = (0, 0, page)
-                pages.append(orm_tuple)
-            odoo_data["page_ids"] = pages or False
 
-        return odoo_data
+        # Search the pages already received
+        page_urls = [
+            page.get("original_page_url")
+            for odoo_data in odoo_data_list
+            for page in odoo_data.get("page_ids") or []
+            if page.get("original_page_url")
+        ]
+        existing_pages = dict()
+        if page_urls:
+            for page in self.env["correspondence.page"].search(
+                [("original_page_url", "in", page_urls)]
+            ):
+                existing_pages.setdefault(page.original_page_url, page.id)
+
+        for odoo_data, template_name, sponsorship_key in zip(
+                odoo_data_list, template_names, sponsorship_keys):
+            if template_name in templates:
+                odoo_data["template_id"] = templates[template_name]
+            if sponsorship_key in sponsorships:
+                odoo_data["sponsorship_id"] = sponsorships[sponsorship_key]
+
+            # Replace dict by a tuple for the ORM update/create
+            if "page_ids" in odoo_data:
+                pages = list()
+                for page in odoo_data["page_ids"]:
+                    page_url = page.get("original_page_url")
+                    if not page_url:
+                        # We don't need to save pages not accessible
+                        continue
+                    page_id = existing_pages.get(page_url)
+                    # if page_url already exist update it
+                    if page_id:
+                        orm_tuple = (1, page_id, page)
+                    # else create a new one
+                    else:
+                        orm_tuple = (0, 0, page)
+                    pages.append(orm_tuple)
+                odoo_data["page_ids"] = pages or False
+
+        if isinstance(json, list):
+            return odoo_data_list
+        return odoo_data_list[0]
 
     @api.multi
     def resubmit_letter(self):
@@ -172,36 +172,27 @@ class CorrespondenceS2bGenerator(models.Model):
         if utms is None:
             utms = dict()
         utms = defaultdict(lambda: None, utms)
-        letters = self.env["correspondence"]
-        for sponsorship in self.sponsorship_ids:
-            text = self._get_text(sponsorship)
-            vals = {
-                "sponsorship_id": sponsorship.id,
-                "store_letter_image": False,
-                "template_id": self.s2b_template_id.id,
-                "direction": "Supporter To Beneficiary",
-                "source": self.source,
-                "original_language_id": self.language_id.id,
-                "original_text": text,
-                "campaign_id": utms["campaign"],
-                "medium_id": utms["medium"],
-                "source_id": utms["source"],
-            }
-            if self.image_ids:
-                vals["original_attachment_ids"] = [
-                    (
-                        0,
-                        0,
-                        {
-                            "datas_fname": atchmt.datas_fname,
-                            "datas": atchmt.datas,
-                            "name": atchmt.name,
-                            "res_model": letters._name,
-                        },
-                    )
-                    for atchmt in self.image_ids
-                ]
-            letters += letters.create(vals)
+        sponsorships = self.sponsorship_ids
+        texts = self._get_texts(sponsorships)
+        letters = self.env["correspondence"].create(
+            [
+                {
+                    "sponsorship_id": sponsorship.id,
+                    "store_letter_image": False,
+                    "template_id": self.s2b_template_id.id,
+                    "direction": "Supporter To Beneficiary",
+                    "source": self.source,
+                    "original_language_id": self.language_id.id,
+                    "original_text": text,
+                    "campaign_id": utms["campaign"],
+                    "medium_id": utms["medium"],
+                    "source_id": utms["source"],
+                }
+                for sponsorship, text in zip(sponsorships, texts)
+            ]
+        )
+        if self.image_ids:
+            self._attach_images(letters)
 
         self.letter_ids = letters
         return self.write({"state": "done", "date": fields.Datetime.now()})
@@ -237,6 +228,47 @@ class CorrespondenceS2bGenerator(models.Model):
 
         return text
 
+    def _get_texts(self, sponsorships):
+        """ Generates the texts of several sponsorships, reading the data of
+        all the children and sponsors at once. """
+        self.ensure_one()
+        sponsorships.mapped("child_id").read(["preferred_name", "age"])
+        sponsorships.mapped("correspondent_id").read(["firstname", "lastname", "name"])
+        return [self._get_text(sponsorship) for sponsorship in sponsorships]
+
+    def _attach_images(self, letters):
+        """
+        Attaches the images of the generator to the letters. The attachments
+        of all letters share the file of each image, which is stored only once
+        in the filestore.
+        :param letters: correspondence records
+        """
+        self.ensure_one()
+        attachment_obj = self.env["ir.attachment"]
+        for image in self.image_ids:
+            vals = {
+                "datas_fname": image.datas_fname,
+                "name": image.name,
+                "res_model": letters._name,
+                "mimetype": image.mimetype,
+            }
+            if image.store_fname:
+                vals["store_fname"] = image.store_fname
+            else:
+                # Image stored in the database
+                vals["datas"] = image.datas
+            attachments = attachment_obj.create(
+                [dict(vals, res_id=letter.id) for letter in letters])
+            if image.store_fname:
+                # The checksum and size are computed when writing the data,
+                # which is not done for shared files.
+                self.env.cr.execute(
+                    "UPDATE ir_attachment SET checksum = %s, file_size = %s "
+                    "WHERE id IN %s",
+                    (image.checksum, image.file_size, tuple(attachments.ids)),
+                )
+                attachments.invalidate_cache(["checksum", "file_size"])
+
     def _get_pdf(self, sponsorship):
         """ Generates a PDF given a sponsorship. """
         self.ensure_one()
@@ -9,18 +9,20 @@
 ##############################################################################
 
 import base64
-import json
+import glob
 import logging
-import os.path
-import subprocess
+import os
 import tempfile
 
 from odoo import fields, models, api, _
 from odoo.exceptions import ValidationError, UserError
-from odoo.tools import config
+from ..tools.pdf_renderer import PDFRenderer
 
 _logger = logging.getLogger(__name__)
 
+# Version of the PDF layout, to increase when FPDF renders PDFs differently
+PDF_LAYOUT_VERSION = 1
+
 try:
     import numpy
     import cv2
@@ -123,9 +125,8 @@ class CorrespondenceTemplate(models.Model):
         Generate a pdf file
         This function is nearly as generic as it should be to be implemented
         directly to generate PDF for any template, text and image
-        We save every text to a temp txt file to avoid having to escape all
-        characters that could potentially be problematic
-        :param pdf_name: path and name of the pdf file to write on
+        :param pdf_name: name of the pdf (not used anymore, the PDF is
+                         directly returned)
         :param header: tuple of text for the headers to display
                        (first value is for front pages, second for back pages)
         :param text: a dict of {type of text ('Original' or 'Translation'):
@@ -134,12 +135,71 @@ class CorrespondenceTemplate(models.Model):
         :param background_list: an optional list of page background images
                                 if not specified, it will be taken from
                                 the template.
+        :return: the PDF data or False if it could not be generated
+        """
+        self.ensure_one()
+        return self.generate_pdfs(
+            [(self, header, text, image_data, background_list)])[0]
+
+    def get_layout_signature(self):
+        """
+        Get the values of the template used to generate a PDF, which change
+        whenever the template is modified.
+        :return: list of values
         """
         self.ensure_one()
+        pages = self.page_ids | self.additional_page_id
+        return [
+            PDF_LAYOUT_VERSION,
+            self.id,
+            self.type,
+            self.additional_page_id.id,
+            [
+                (
+                    page.id,
+                    page.write_date,
+                    page.header_box_id and page.header_box_id.get_json_repr(),
+                    [box.get_json_repr() for box in page.text_box_ids],
+                    [box.get_json_repr() for box in page.image_box_ids],
+                )
+                for page in pages
+            ],
+        ]
 
-        temp_img = []
-        temp_header = []
-        temp_text = []
+    @api.model
+    def generate_pdfs(self, pdf_list):
+        """
+        Generate several pdf files with one call to the PDF renderer.
+        :param pdf_list: list of tuples (template, header, text, image_data,
+                         background_list) with the values given to
+                         generate_pdf
+        :return: list of PDF data (False if a PDF could not be generated)
+        """
+        with tempfile.TemporaryDirectory(prefix="sbc_pdf_") as directory:
+            layouts = [
+                template._get_pdf_layout(
+                    directory, header, text, image_data, background_list)
+                for template, header, text, image_data, background_list
+                in pdf_list
+            ]
+            res = PDFRenderer.get_renderer().render(layouts)
+        if not all(res):
+            _logger.error("Cannot generate PDF with FPDF.")
+        return res
+
+    ##########################################################################
+    #                             PRIVATE METHODS                            #
+    ##########################################################################
+
+    def _get_pdf_layout(self, directory, header, text, image_data,
+                        background_list=None):
+        """
+        Get the JSON description of a PDF given to FPDF. The texts are given
+        directly in the description and the images are written in files.
+        :param directory: temporary directory where the images are written
+        :return: dictionary describing the PDF (see FPDF/README.rst)
+        """
+        self.ensure_one()
         if background_list is None:
             background_list = []
         overflow_template = False
@@ -147,34 +207,19 @@ class CorrespondenceTemplate(models.Model):
         pages = self.mapped("page_ids") - self.additional_page_id
         template_list = []
         image_list = []
-        page_count = 0
+        header_data = []
+        image_boxes = []
         for i, page in enumerate(pages):
-            page_count += 1
             header_index = i % 2
             try:
-                background = background_list[i]
+                background_file = self._write_image(directory, background_list[i])
             except (TypeError, IndexError):
-                background = page.background
-            if background:
-                temp_img.append(
-                    tempfile.NamedTemporaryFile(prefix="img_", suffix=".jpg")
-                )
-                temp_img[-1].write(base64.b64decode(background))
-                temp_img[-1].flush()
-                background_file = temp_img[-1].name
-            else:
-                background_file = False
+                background_file = self._get_background_file(page)
             header_data = []
             page_header = page.header_box_id
             if page_header and len(header) >= header_index:
-                header_file = tempfile.NamedTemporaryFile(
-                    "w", prefix="header_", suffix=".txt"
-                )
-                header_file.write(header[header_index])
-                header_file.flush()
-                header_data = [header_file.name]
+                header_data = [[header[header_index]]]
                 header_data.extend(page_header.get_json_repr())
-                temp_header.append(header_file)
             text_list = []
             for text_box in page.text_box_ids:
                 text_list.append(text_box.get_json_repr())
@@ -189,53 +234,38 @@ class CorrespondenceTemplate(models.Model):
             # and we should add pages for additional translation.
             if len(background_list) > len(pages):
                 for i in range(len(pages), len(background_list)):
-                    bf = tempfile.NamedTemporaryFile(prefix="img_", suffix=".jpg")
-                    bf.write(base64.b64decode(background_list[i]))
-                    bf.flush()
-                    temp_img.append(bf)
-                    template_list.append([bf.name, [], [], []])
+                    template_list.append(
+                        [self._write_image(directory, background_list[i]), [], [], []]
+                    )
             additional_page = self.env.ref("sbc_compassion.b2s_additional_page")
-            bf_name = False
-            if additional_page.background:
-                bf = tempfile.NamedTemporaryFile(prefix="img_", suffix=".jpg")
-                bf.write(base64.b64decode(additional_page.background))
-                bf.flush()
-                bf_name = bf.name
-                temp_img.append(bf)
             text_list = []
             for text_box in additional_page.text_box_ids:
                 text_list.append(text_box.get_json_repr())
-            overflow_template = [bf_name, [], text_list, image_boxes]
+            overflow_template = [
+                self._get_background_file(additional_page), [], text_list, image_boxes
+            ]
         elif self.additional_page_id:
             # We are generating a new PDF (S2B case). We provide
             # an overflow template using the template
-            add_background = tempfile.NamedTemporaryFile(prefix="img_", suffix=".jpg")
-            add_background.write(base64.b64decode(self.additional_page_id.background))
-            add_background.flush()
-            temp_img.append(add_background)
             text_list = []
             for text_box in self.additional_page_id.text_box_ids:
                 text_list.append(text_box.get_json_repr())
-            overflow_template = [add_background.name, header_data, text_list, []]
+            overflow_template = [
+                self._get_background_file(self.additional_page_id),
+                header_data,
+                text_list,
+                [],
+            ]
 
         text_list = []
         for t_type, t_boxes in list(text.items()):
             for txt in t_boxes:
-                temp_text.append(
-                    tempfile.NamedTemporaryFile("w", prefix=t_type + "_", suffix=".txt")
-                )
-                temp_text[-1].write(txt)
-                temp_text[-1].flush()
-                text_list.append([temp_text[-1].name, t_type])
+                text_list.append([[txt], t_type])
 
         for image in image_data:
-            ifile = tempfile.NamedTemporaryFile(prefix="img_", suffix=".jpg")
-            ifile.write(base64.b64decode(image))
-            ifile.flush()
-            image_list.append(ifile.name)
-            temp_img.append(ifile)
+            image_list.append(self._write_image(directory, image))
 
-        generated_json = {
+        return {
             "images": image_list,
             "templates": template_list,
             "texts": text_list,
@@ -246,52 +276,53 @@ class CorrespondenceTemplate(models.Model):
             "prevent_overflow": self.type == "b2s",
         }
 
-        json_val = json.dumps(generated_json).replace(" ", "")
-
-        std_err_file = open(self.path_to("stderr.txt"), "w")
-
-        php_command_args = ["php", self.path_to("pdf.php"), pdf_name, json_val]
-        if config.get("php_debug"):
-            # Allow php debugging with Xend
-            os.environ["XDEBUG_CONFIG"] = "PHPSTORM"
-            php_command_args.extend(
-                [
-                    "-dxdebug.remote_enable=1",
-                    "-dxdebug.remote_mode=req",
-                    "-dxdebug.remote_port=9000",
-                    "-dxdebug.remote_host=127.0.0.1",
-                ]
-            )
-        proc = subprocess.Popen(php_command_args, stderr=std_err_file)
-        proc.communicate()
+    @api.model
+    def _write_image(self, directory, image):
+        """ Writes a base64 image in a file of the directory. """
+        fd, path = tempfile.mkstemp(prefix="img_", suffix=".jpg", dir=directory)
+        with os.fdopen(fd, "wb") as image_file:
+            image_file.write(base64.b64decode(image))
+        return path
 
-        # Clean temp files
-        for img in temp_img:
-            img.close()
-        for h in temp_header:
-            h.close()
-        for t in temp_text:
-            t.close()
-        std_err_file.close()
-
-        # Read and return output
+    @api.model
+    def _get_background_file(self, page):
+        """
+        Get the file of the background of a template page. The background is
+        decoded once and kept on disk for the next PDFs, until the page is
+        modified.
+        :param page: correspondence.template.page record
+        :return: path of the image or False if the page has no background
+        """
+        directory = os.path.join(tempfile.gettempdir(), "sbc_compassion_backgrounds")
+        path = os.path.join(
+            directory,
+            "%s_%s_%s.jpg"
+            % (
+                self.env.cr.dbname,
+                page.id,
+                fields.Datetime.to_datetime(page.write_date).strftime("%Y%m%d%H%M%S%f"),
+            ),
+        )
+        if os.path.exists(path):
+            return path
+        background = page.background
+        if not background:
+            return False
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory)
         try:
-            pdf_file = open(pdf_name, "rb")
-            res = pdf_file.read()
-            pdf_file.close()
-            os.remove(pdf_file.name)
-        except FileNotFoundError:
-            _logger.error("Cannot read PDF made by FPDF.")
-            res = False
-        return res
-
-    # path of the FPDF folder
-    _absolute_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "FPDF/"
-    )
-
-    # create path to the subfolder of FPDF
-    def path_to(self, filename, folder=""):
-        if folder == "":
-            return os.path.join(self._absolute_path, filename)
-        return os.path.join(self._absolute_path, folder + "/" + filename)
+            with os.fdopen(fd, "wb") as background_file:
+                background_file.write(base64.b64decode(background))
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        # Remove the backgrounds of the previous versions of the page
+        for old_path in glob.glob(
+                os.path.join(directory, "%s_%s_*.jpg" % (self.env.cr.dbname, page.id))):
+            if old_path != path:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+        return path
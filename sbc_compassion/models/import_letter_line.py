@@ -65,15 +65,22 @@ class ImportLetterLine(models.Model):
     ##########################################################################
     #                              ORM METHODS                               #
     ##########################################################################
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         # Fetch default values in import configuration.
-        create_vals = dict()
-        if vals.get("import_id"):
-            config = self.env["import.letters.history"].browse(vals["import_id"])
-            create_vals = config.get_correspondence_metadata()
-        create_vals.update(vals)
-        return super().create(create_vals)
+        metadata = dict()
+        create_vals_list = list()
+        for vals in vals_list:
+            import_id = vals.get("import_id")
+            create_vals = dict()
+            if import_id:
+                if import_id not in metadata:
+                    config = self.env["import.letters.history"].browse(import_id)
+                    metadata[import_id] = config.get_correspondence_metadata()
+                create_vals.update(metadata[import_id])
+            create_vals.update(vals)
+            create_vals_list.append(create_vals)
+        return super().create(create_vals_list)
 
     ##########################################################################
     #                             FIELDS METHODS                             #
@@ -12,17 +12,134 @@ This module reads a zip file containing scans of mail and finds the relation
 between the database and the mail.
 """
 import base64
+import importlib.util
 import logging
+import multiprocessing
+import os
+import site
+import sys
 import traceback
+from concurrent.futures import ProcessPoolExecutor
 
 from odoo.addons.queue_job.job import job, related_action
 
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.tools.config import config
 from ..tools import read_barcode
 
 logger = logging.getLogger(__name__)
 
+# Name under which read_barcode is imported by the processes reading barcodes
+BARCODE_READER = "read_barcode"
+
+
+def _load_barcode_reader():
+    """
+    Loads read_barcode from its file as a top-level module. The processes
+    reading the barcodes import it from the tools directory, without loading
+    Odoo (it only needs fitz, pyzbar and PIL), so that its functions must be
+    given from this module.
+    :return: module
+    """
+    module = sys.modules.get(BARCODE_READER)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(
+            BARCODE_READER, read_barcode.__file__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[BARCODE_READER] = module
+    return module
+
+
+class LetterAnalysisBatch(object):
+    """ Analyzes the scanned letters of an import and inserts the import lines
+    by batches.
+
+    If more than one process is given, the barcodes are read in a pool of
+    processes while the next files are read, otherwise they are read in the
+    current process. The partners and children of a batch are then searched
+    at once and the import lines are created and committed together.
+    """
+
+    def __init__(self, letters_import, processes=1, batch_size=20):
+        self.letters_import = letters_import
+        self.batch_size = batch_size
+        # Barcodes found by each strategy, given to the processes reading the
+        # barcodes, which return the strategy that succeeded.
+        self.strategy_stats = letters_import.get_barcode_strategy_stats()
+        self.executor = None
+        self.pipeline = read_barcode.letter_barcode_detection_pipeline
+        if processes > 1:
+            # The Odoo workers run other threads (ingest buffer, image
+            # downloads, PDF renderer), so that a forked process could
+            # inherit a lock held by one of them. The processes are started
+            # from a fork server instead, which runs none of these threads,
+            # and import the barcode reader from its file.
+            self.executor = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("forkserver"),
+                initializer=site.addsitedir,
+                initargs=(os.path.dirname(read_barcode.__file__),),
+            )
+            self.pipeline = _load_barcode_reader().letter_barcode_detection_pipeline
+        self.pending = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            if self.executor:
+                self.executor.shutdown(wait=exc_type is None)
+        return False
+
+    def add(self, pdf_data, file_name):
+        if self.executor:
+            result = self.executor.submit(
+                self.pipeline,
+                pdf_data,
+                self.strategy_stats,
+            )
+        else:
+            try:
+                result = self.pipeline(pdf_data, self.strategy_stats)
+            except Exception:
+                logger.error(
+                    f"Couldn't import file {file_name} : \n{traceback.format_exc()}"
+                )
+                return
+        self.pending.append((pdf_data, file_name, result))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        analyzed = list()
+        found = dict()  # Barcodes found by each strategy
+        for pdf_data, file_name, result in self.pending:
+            if self.executor:
+                try:
+                    result = result.result()
+                except Exception:
+                    logger.error(
+                        f"Couldn't import file {file_name} : \n"
+                        f"{traceback.format_exc()}"
+                    )
+                    continue
+            partner_code, child_code, preview, strategy = result
+            analyzed.append((pdf_data, file_name, partner_code, child_code, preview))
+            if strategy:
+                found[strategy] = found.get(strategy, 0) + 1
+        self.pending = list()
+        if found:
+            self.strategy_stats = \
+                self.letters_import.add_barcode_strategy_stats(found)
+        if analyzed:
+            self.letters_import._create_import_lines(analyzed)
+
 
 class ImportLettersHistory(models.Model):
     _name = "import.letters.history"
@@ -190,16 +307,31 @@ class ImportLettersHistory(models.Model):
             int: the current step in the analysis
             int: the current last step for the analysis (may or may
             str: the name of the file analysed
-        """
-        if generator is None:
-            generator = self.manual_imports_generator
 
+        The generator can be given as the name of a method of the import,
+        which receives the current analysis batch in its context. A generator
+        given as a function analyzes each letter right away.
+
+        The barcodes are read in a pool of processes if the option
+        letter_analysis_processes of the configuration file is greater than 1
+        and the import lines are created by batches of
+        letter_analysis_batch_size letters (20 by default).
+        """
         self.ensure_one()
         self.state = "pending"
         logger.info("Letters import started...")
 
-        for current_file, nb_files_to_import, filename in generator():
-            logger.info(f"{current_file}/{nb_files_to_import} : {filename}")
+        processes = int(config.get("letter_analysis_processes") or 1)
+        batch_size = int(config.get("letter_analysis_batch_size") or 20)
+        with LetterAnalysisBatch(self, processes, batch_size) as batch:
+            # The letters given to _analyze_pdf are added to the batch
+            letters_import = self.with_context(letter_analysis_batch=batch)
+            if generator is None:
+                generator = letters_import.manual_imports_generator
+            elif isinstance(generator, str):
+                generator = getattr(letters_import, generator)
+            for current_file, nb_files_to_import, filename in generator():
+                logger.info(f"{current_file}/{nb_files_to_import} : {filename}")
 
         logger.info(f"Letters import completed !")
         # remove all the files (now they are inside import_line_ids)
@@ -207,26 +339,65 @@ class ImportLettersHistory(models.Model):
         self.import_completed = True
 
     def _analyze_pdf(self, pdf_data, file_name):
-        try:
-            partner_code, child_code, preview = read_barcode.letter_barcode_detection_pipeline(pdf_data)
-        except Exception as e:
-            logger.error(f"Couldn't import file {file_name} : \n{traceback.format_exc()}")
-            return
-
-        partner = self.env["res.partner"].search([("ref", "=", partner_code)], limit=1)
-        child = self.env["compassion.child"].search(["|", ("code", "=", child_code), ("local_id", "=", child_code)], limit=1)
-
-        data = {
-            "import_id": self.id,
-            "partner_id": partner.id,
-            "child_id": child.id,
-            "letter_image_preview": preview,
-            "letter_image": pdf_data,
-            "file_name": file_name,
-            "template_id": self.template_id.id,
-        }
-        self.env["import.letter.line"].create(data)
+        batch = self.env.context.get("letter_analysis_batch")
+        if batch is None:
+            # Called outside of run_analyze: analyze the letter right away
+            with LetterAnalysisBatch(self, batch_size=1) as batch:
+                batch.add(pdf_data, file_name)
+        else:
+            batch.add(pdf_data, file_name)
+
+    @api.model
+    def get_barcode_strategy_stats(self):
+        """
+        :return: dict with the number of barcodes found by each strategy of
+                 read_barcode, used to try the best strategies first
+        """
+        return self.env["letter.barcode.strategy.stat"].sudo().get_stats()
+
+    @api.model
+    def add_barcode_strategy_stats(self, found):
+        """
+        Adds the barcodes found by the strategies to the stored statistics.
+        :param found: dict with the number of barcodes found by each strategy
+        :return: the updated statistics
+        """
+        return self.env["letter.barcode.strategy.stat"].sudo().add_stats(found)
+
+    def _create_import_lines(self, analyzed_letters):
+        """
+        Creates the import lines of analyzed letters, searching all their
+        partners and children at once.
+        :param analyzed_letters: list of tuples (pdf_data, file_name,
+                                 partner_code, child_code, preview)
+        """
+        partner_codes = {letter[2] for letter in analyzed_letters if letter[2]}
+        child_codes = {letter[3] for letter in analyzed_letters if letter[3]}
+        partners = dict()
+        for partner in self.env["res.partner"].search(
+                [("ref", "in", list(partner_codes))]):
+            partners.setdefault(partner.ref, partner.id)
+        children = dict()
+        for child in self.env["compassion.child"].search(
+                ["|", ("code", "in", list(child_codes)),
+                 ("local_id", "in", list(child_codes))]):
+            children.setdefault(child.code, child.id)
+            children.setdefault(child.local_id, child.id)
+
+        self.env["import.letter.line"].create([
+            {
+                "import_id": self.id,
+                "partner_id": partners.get(partner_code, False),
+                "child_id": children.get(child_code, False),
+                "letter_image_preview": preview,
+                "letter_image": pdf_data,
+                "file_name": file_name,
+                "template_id": self.template_id.id,
+            }
+            for pdf_data, file_name, partner_code, child_code, preview
+            in analyzed_letters
+        ])
         # this commit is really important
         # it avoid having to keep the "data"s in memory until the whole process is finished
-        # each time a letter is scanned, it is also inserted in the DB
+        # each time a batch of letters is scanned, it is also inserted in the DB
         self._cr.commit()
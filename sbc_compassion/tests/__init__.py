@@ -9,3 +9,5 @@
 ##############################################################################
 
 from . import test_sbc_compassion
+from . import test_pdf_renderer
+from . import test_pdf_cache
@@ -0,0 +1,64 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import os
+import shutil
+import tempfile
+
+from odoo.tests import TransactionCase
+from ..tools import pdf_cache
+from ..tools.pdf_cache import PDFCache, get_cache_key
+
+
+class TestPDFCache(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = PDFCache(self.env)
+        self.cache.directory = tempfile.mkdtemp()
+        self.cache.max_size = 100
+        self.addCleanup(shutil.rmtree, self.cache.directory)
+        self.addCleanup(pdf_cache._sizes.pop, self.cache.directory, None)
+
+    def test_cache_key(self):
+        self.assertEqual(get_cache_key("letter", 1), get_cache_key("letter", 1))
+        self.assertNotEqual(
+            get_cache_key("letter", 1), get_cache_key("letter", 2))
+
+    def test_get_set(self):
+        key = get_cache_key("letter", 1)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, b"pdf")
+        self.assertEqual(self.cache.get(key), b"pdf")
+        self.cache.set(key, b"new pdf")
+        self.assertEqual(self.cache.get(key), b"new pdf")
+
+    def test_eviction(self):
+        """ The least recently used PDFs are removed when the cache is
+        full. """
+        first, second, third = [get_cache_key("letter", i) for i in range(3)]
+        self.cache.set(first, b"1" * 40)
+        self.cache.set(second, b"2" * 40)
+        os.utime(self.cache._get_path(first), (1, 1))
+        os.utime(self.cache._get_path(second), (2, 2))
+        # The first PDF becomes the most recently used
+        self.assertTrue(self.cache.get(first))
+
+        self.cache.set(third, b"3" * 40)
+        self.assertIsNone(self.cache.get(second))
+        self.assertTrue(self.cache.get(first))
+        self.assertTrue(self.cache.get(third))
+        self.assertEqual(pdf_cache._sizes[self.cache.directory], 80)
+
+    def test_cache_disabled(self):
+        self.env["ir.config_parameter"].set_param(
+            "sbc_compassion.pdf_cache_size", "0")
+        cache = PDFCache(self.env)
+        key = get_cache_key("letter", 1)
+        cache.set(key, b"pdf")
+        self.assertIsNone(cache.get(key))
+        self.assertFalse(os.path.exists(cache._get_path(key)))
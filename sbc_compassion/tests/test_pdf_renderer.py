@@ -0,0 +1,85 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import subprocess
+import sys
+
+import mock
+
+from odoo.tests import TransactionCase
+from odoo.tools.config import config
+from ..tools.pdf_renderer import PDFRenderer
+
+mock_popen = "odoo.addons.sbc_compassion.tools.pdf_renderer.subprocess.Popen"
+
+# Python process following the protocol of FPDF/renderer.php, where the
+# layouts tell what to answer.
+FAKE_RENDERER = """
+import json, sys, time
+stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+while True:
+    line = stdin.readline()
+    if not line:
+        break
+    layout = json.loads(stdin.read(int(line)).decode())
+    if layout.get("exit"):
+        break
+    time.sleep(layout.get("sleep", 0))
+    pdf = layout.get("pdf", "").encode()
+    stdout.write(b"%d\\n%s" % (len(pdf), pdf) if pdf else b"-1\\n")
+    stdout.flush()
+"""
+
+# Original Popen, used to start the fake renderer while Popen is patched
+popen = subprocess.Popen
+
+
+def fake_renderer(args, **kwargs):
+    return popen([sys.executable, "-c", FAKE_RENDERER], **kwargs)
+
+
+class TestPDFRenderer(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.renderer = PDFRenderer()
+        self.addCleanup(self.renderer._stop)
+        patcher = mock.patch(mock_popen, side_effect=fake_renderer)
+        self.popen = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_render(self):
+        """ The PDFs are all generated by the same process. """
+        self.assertEqual(
+            self.renderer.render([{"pdf": "first"}, {}, {"pdf": "second"}]),
+            [b"first", False, b"second"],
+        )
+        self.assertEqual(self.renderer.render([{"pdf": "third"}]), [b"third"])
+        self.assertEqual(self.popen.call_count, 1)
+
+    def test_restart(self):
+        """ A new renderer is started when the previous one stopped. """
+        self.assertEqual(
+            self.renderer.render([{"exit": True}, {"pdf": "first"}]),
+            [False, b"first"],
+        )
+        self.assertEqual(self.popen.call_count, 2)
+
+        self.renderer._process.kill()
+        self.renderer._process.wait()
+        self.assertEqual(self.renderer.render([{"pdf": "second"}]), [b"second"])
+        self.assertEqual(self.popen.call_count, 3)
+
+    def test_timeout(self):
+        """ A renderer not answering in time is killed and replaced. """
+        with mock.patch.dict(config.options, {"fpdf_render_timeout": 0.5}):
+            self.assertEqual(
+                self.renderer.render([
+                    {"pdf": "slow", "sleep": 5}, {"pdf": "fast"}]),
+                [False, b"fast"],
+            )
+        self.assertEqual(self.popen.call_count, 2)
@@ -13,12 +13,24 @@ import logging
 import os
 from os import path
 
+import mock
+import requests
+
 from odoo.addons.sponsorship_compassion.tests.test_sponsorship_compassion import (
     BaseSponsorshipTest,
 )
 
+from odoo.exceptions import UserError
+from ..tools.onramp_connector import SBCConnector
+
 logger = logging.getLogger(__name__)
 
+mock_connector = "odoo.addons.sbc_compassion.models.correspondence.SBCConnector"
+mock_get_images = (
+    "odoo.addons.sbc_compassion.models.correspondence.Correspondence.get_images"
+)
+mock_test_mode = "odoo.addons.sbc_compassion.models.correspondence.test_mode"
+
 DATA_DIR = os.path.dirname(os.path.realpath(__file__)) + "/data/"
 
 
@@ -88,3 +100,152 @@ class TestSbcCompassion(BaseSponsorshipTest):
                 self.assertEqual(line.child_id.display_name, "TT123456789")
             if line.file_name.startswith("Postman"):
                 self.assertEqual(line.template_id.name, "Postman")
+
+    def test_process_commkit_batch(self):
+        """
+            Process a B2S commkit containing several letters: the letters
+            must be created at once and updated when received again.
+        """
+        def letter_json(kit_identifier, page_url):
+            return {
+                "CompassionSBCId": kit_identifier,
+                "Direction": "Beneficiary To Supporter",
+                "Status": "Received in the system",
+                "Template": "CH-A-6S11-1",
+                "Beneficiary": {"GlobalId": self.t_child.global_id},
+                "Supporter": {"GlobalId": "12345678"},
+                "Pages": [{
+                    "OriginalPageURL": page_url,
+                    "OriginalText": [""],
+                    "EnglishTranslatedText": [""],
+                    "TranslatedText": [""],
+                }],
+            }
+
+        letter_obj = self.env["correspondence"]
+        letter_ids = letter_obj.process_commkit({"Responses": [
+            letter_json("TEST-B2S-1", "http://test/page1"),
+            letter_json("TEST-B2S-2", "http://test/page2"),
+        ]})
+        letters = letter_obj.browse(letter_ids)
+        self.assertEqual(len(letters), 2)
+        self.assertEqual(letters.mapped("sponsorship_id"), self.t_sponsorship)
+        self.assertEqual(
+            letters.mapped("kit_identifier"), ["TEST-B2S-1", "TEST-B2S-2"])
+        self.assertEqual(
+            letters.mapped("page_ids.original_page_url"),
+            ["http://test/page1", "http://test/page2"])
+
+        # Receiving the letters again updates them
+        new_ids = letter_obj.process_commkit({"Responses": [
+            letter_json("TEST-B2S-2", "http://test/page2"),
+            letter_json("TEST-B2S-3", "http://test/page3"),
+        ]})
+        self.assertEqual(new_ids[0], letter_ids[1])
+        self.assertNotIn(new_ids[1], letter_ids)
+        self.assertEqual(len(letter_obj.browse(new_ids[0]).page_ids), 1)
+
+    def test_barcode_strategy_stats(self):
+        """
+            The barcodes found by each strategy are added to the counters.
+        """
+        import_obj = self.env["import.letters.history"]
+        stats = import_obj.get_barcode_strategy_stats()
+        found = stats.get("test_strategy", 0)
+        import_obj.add_barcode_strategy_stats({"test_strategy": 2})
+        stats = import_obj.add_barcode_strategy_stats({"test_strategy": 1})
+        self.assertEqual(stats["test_strategy"], found + 3)
+        self.assertEqual(import_obj.get_barcode_strategy_stats(), stats)
+
+    def test_send_letter_images(self):
+        """ The failed uploads don't prevent the others, and the results
+        are given in the order of the images. """
+        responses = {
+            b"ok": mock.MagicMock(status_code=201, text="http://test/ok"),
+            b"refused": mock.MagicMock(status_code=500, text="Server error"),
+        }
+
+        def request(method, url, data=None, **kwargs):
+            if data not in responses:
+                raise requests.ConnectionError("Connection lost")
+            return responses[data]
+
+        connector = object.__new__(SBCConnector)
+        connector._connect_url = "http://test/"
+        with mock.patch.object(connector, "_request", side_effect=request):
+            results = connector.send_letter_images([
+                {"image_data": data, "image_type": "pdf",
+                 "base64encoded": False}
+                for data in (b"ok", b"refused", b"lost", b"ok")
+            ])
+        self.assertEqual(results[0], {"url": "http://test/ok", "error": None})
+        self.assertEqual(results[1], {"url": None, "error": "[500] Server error"})
+        self.assertEqual(results[2], {"error": "Connection lost"})
+        self.assertEqual(results[3]["url"], "http://test/ok")
+
+    @mock.patch(mock_get_images, autospec=True)
+    @mock.patch(mock_connector)
+    def test_send_to_connect_partial_failure(self, connector, get_images):
+        """ The URLs of the uploaded images are committed before raising
+        the errors of the other uploads. """
+        letters = self.env["correspondence"].with_context(
+            no_comm_kit=True).create([
+                {"sponsorship_id": self.t_sponsorship.id},
+                {"sponsorship_id": self.t_sponsorship.id},
+            ])
+        get_images.side_effect = lambda self: [b"pdf"] * len(self)
+        connector.return_value.send_letter_images.return_value = [
+            {"url": "http://test/ok", "error": None},
+            {"url": None, "error": "[500] Server error"},
+        ]
+        with mock.patch(mock_test_mode, False), mock.patch.object(
+                self.env.cr, "commit") as commit:
+            with self.assertRaises(UserError) as error:
+                letters.on_send_to_connect()
+            commit.assert_called_once()
+        self.assertIn("[500] Server error", str(error.exception))
+        self.assertEqual(letters[0].original_letter_url, "http://test/ok")
+        self.assertFalse(letters[1].original_letter_url)
+
+        # Only the failed image is sent again
+        connector.return_value.send_letter_images.return_value = [
+            {"url": "http://test/ok2", "error": None}]
+        letters.on_send_to_connect()
+        sent = connector.return_value.send_letter_images.call_args[0][0]
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(letters[1].original_letter_url, "http://test/ok2")
+
+    def test_generator_shared_images(self):
+        """ The letters of a generator share the files of its images,
+        with the checksum and size of the images. """
+        letters = self.env["correspondence"].with_context(
+            no_comm_kit=True).create([
+                {"sponsorship_id": self.t_sponsorship.id},
+                {"sponsorship_id": self.t_sponsorship.id},
+            ])
+        image = self.env["ir.attachment"].create({
+            "name": "image.jpg",
+            "datas_fname": "image.jpg",
+            "datas": base64.b64encode(b"image data"),
+        })
+        generator = self.env["correspondence.s2b.generator"].create({
+            "name": "Test generator",
+            "s2b_template_id": self.env.ref(
+                "sbc_compassion.default_template").id,
+            "sponsorship_ids": [(6, 0, self.t_sponsorship.ids)],
+            "body": "Hello %child%",
+            "image_ids": [(6, 0, image.ids)],
+        })
+        generator._attach_images(letters)
+        attachments = self.env["ir.attachment"].search([
+            ("res_model", "=", "correspondence"),
+            ("res_id", "in", letters.ids),
+        ])
+        self.assertEqual(len(attachments), 2)
+        self.assertEqual(attachments.mapped("res_id"), letters.ids)
+        for attachment in attachments:
+            self.assertEqual(attachment.store_fname, image.store_fname)
+            self.assertEqual(attachment.checksum, image.checksum)
+            self.assertEqual(attachment.file_size, len(b"image data"))
+            self.assertEqual(
+                base64.b64decode(attachment.datas), b"image data")
@@ -9,3 +9,5 @@
 ##############################################################################
 from . import onramp_connector
 from . import read_barcode
+from . import pdf_renderer
+from . import pdf_cache
@@ -9,9 +9,14 @@
 ##############################################################################
 import base64
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from odoo.addons.message_center_compassion.tools.onramp_connector import OnrampConnector
+
+from odoo.addons.message_center_compassion.tools.onramp_connector import (
+    OnrampConnector,
+    _config_value,
+)
 
 from odoo import _
 from odoo.exceptions import UserError
@@ -36,9 +41,8 @@ class SBCConnector(OnrampConnector):
             if connect_url and api_key:
                 SBCConnector.__instance._connect_url = connect_url
                 SBCConnector.__instance._api_key = api_key
-                session = requests.Session()
-                session.params.update({"api_key": api_key, "gpid": "CH"})
-                SBCConnector.__instance._session = session
+                SBCConnector.__instance._session = cls._create_session(
+                    {"api_key": api_key, "gpid": "CH"})
             else:
                 raise UserError(
                     _(
@@ -55,6 +59,48 @@ class SBCConnector(OnrampConnector):
 
         Returns the uploaded image URL.
         """
+        result = self._upload_letter_image(image_data, image_type, base64encoded)
+        if result["error"]:
+            raise UserError(result["error"])
+        return result["url"]
+
+    def send_letter_images(self, images):
+        """ Sends several letter images concurrently to Onramp U.S. Image
+        Upload Service. The number of transfers running at the same time is
+        limited by the connect_max_concurrency setting.
+
+        :param images: list of dictionaries with the arguments of
+                       send_letter_image (image_data, image_type, base64encoded)
+        :returns: list of dictionaries {'url': uploaded image URL,
+                  'error': error message}, in the same order as the images.
+                  Only one of the two values is set for each image.
+        """
+        return self._transfer_concurrently(
+            lambda image: self._upload_letter_image(**image), images)
+
+    def get_letter_image(self, letter_url, img_type="jpeg", pages=0, dpi=96):
+        """ Calls Letter Image Service from Onramp U.S. and get the data
+        http://developer.compassion.com/docs/read/compassion_connect2/
+        service_catalog/Image_Retrieval
+        """
+        return self._download_letter_image(letter_url, img_type, pages, dpi)["data"]
+
+    def get_letter_images(self, letter_urls, img_type="jpeg", pages=0, dpi=96):
+        """ Downloads several letter images concurrently from Letter Image
+        Service. The number of transfers running at the same time is limited
+        by the connect_max_concurrency setting.
+
+        :param letter_urls: list of letter image URLs
+        :returns: list of dictionaries {'data': base64 image data,
+                  'error': error message}, in the same order as the URLs.
+                  Only one of the two values is set for each image.
+        """
+        return self._transfer_concurrently(
+            lambda url: self._download_letter_image(url, img_type, pages, dpi),
+            letter_urls,
+        )
+
+    def _upload_letter_image(self, image_data, image_type, base64encoded=True):
         content_type = ""
         if image_type == "pdf":
             content_type = "application"
@@ -70,23 +116,57 @@ class SBCConnector(OnrampConnector):
             data = base64.b64decode(image_data)
         else:
             data = image_data
-        r = self._session.post(url, params=params, headers=headers, data=data)
-        status = r.status_code
-        if status == 201:
-            letter_url = r.text
-        else:
-            raise UserError(_("[%s] %s") % (str(r.status_code), r.text))
-        return letter_url
+        r = self._request("POST", url, params=params, headers=headers, data=data)
+        if r.status_code == 201:
+            return {"url": r.text, "error": None}
+        return {"url": None, "error": _("[%s] %s") % (str(r.status_code), r.text)}
 
-    def get_letter_image(self, letter_url, img_type="jpeg", pages=0, dpi=96):
-        """ Calls Letter Image Service from Onramp U.S. and get the data
-        http://developer.compassion.com/docs/read/compassion_connect2/
-        service_catalog/Image_Retrieval
-        """
+    def _download_letter_image(self, letter_url, img_type, pages, dpi):
         params = {"format": img_type, "pg": pages, "dpi": dpi}
         OnrampConnector.log_message("GET", letter_url)
-        r = self._session.get(letter_url, params=params)
-        letter_data = None
-        if r.status_code == 200:
-            letter_data = base64.b64encode(r.content)
-        return letter_data
+        # The image is streamed to avoid keeping the raw response in memory
+        # besides the encoded image.
+        with self._request("GET", letter_url, params=params, stream=True) as r:
+            if r.status_code != 200:
+                return {"data": None, "error": _("[%s] %s") % (
+                    str(r.status_code), r.text)}
+            encoder = _Base64StreamEncoder()
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                encoder.write(chunk)
+            return {"data": encoder.getvalue(), "error": None}
+
+    @staticmethod
+    def _transfer_concurrently(transfer, items):
+        """ Runs a transfer function for each item in a bounded thread pool.
+        Network errors are returned as {'error': error_message}. """
+        if not items:
+            return []
+
+        def _transfer(item):
+            try:
+                return transfer(item)
+            except requests.RequestException as e:
+                logger.error("Connect letter transfer failed: %s", e)
+                return {"error": str(e)}
+
+        max_workers = min(len(items), _config_value("connect_max_concurrency", 8))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_transfer, items))
+
+
+class _Base64StreamEncoder(object):
+    """ Encodes a stream of bytes in base64 as it is received. """
+
+    def __init__(self):
+        self._parts = list()
+        self._remainder = b""
+
+    def write(self, chunk):
+        data = self._remainder + chunk
+        # base64 encodes groups of 3 bytes
+        cut = len(data) - len(data) % 3
+        self._parts.append(base64.b64encode(data[:cut]))
+        self._remainder = data[cut:]
+
+    def getvalue(self):
+        return b"".join(self._parts) + base64.b64encode(self._remainder)
@@ -0,0 +1,130 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+_logger = logging.getLogger(__name__)
+
+# Sub-directory of the filestore holding the cached PDFs
+CACHE_DIR = "sbc_pdf_cache"
+# Ratio of the maximum size kept when the cache is full
+EVICTION_RATIO = 0.8
+
+# Estimated size of the cache directories, computed once by each process
+_sizes = dict()
+_sizes_lock = threading.Lock()
+
+
+def get_cache_key(*values):
+    """
+    :param values: JSON serializable values used to generate a PDF
+    :return: key of the PDF in the cache
+    """
+    data = json.dumps(values, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+class PDFCache(object):
+    """ Cache of generated PDFs stored in the filestore.
+
+    The PDFs are addressed by a hash of everything used to generate them,
+    which means that an entry is never outdated: when an input changes, the
+    PDF gets a new key and the old one is eventually evicted. The least
+    recently used PDFs are removed when the cache exceeds the size set in the
+    system parameter sbc_compassion.pdf_cache_size (in MB, default 256,
+    0 disables the cache).
+    """
+
+    def __init__(self, env):
+        self.directory = env["ir.attachment"]._full_path(CACHE_DIR)
+        self.max_size = int(
+            env["ir.config_parameter"]
+            .sudo()
+            .get_param("sbc_compassion.pdf_cache_size", "256")
+        ) * 1024 ** 2
+
+    def get(self, key):
+        """
+        :param key: key of the PDF
+        :return: the PDF data or None if it is not in the cache
+        """
+        if not self.max_size:
+            return None
+        path = self._get_path(key)
+        try:
+            with open(path, "rb") as pdf_file:
+                data = pdf_file.read()
+            # Mark the PDF as recently used
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def set(self, key, data):
+        """ Stores a PDF in the cache.
+        :param key: key of the PDF
+        :param data: PDF data
+        """
+        if not self.max_size:
+            return
+        path = self._get_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as pdf_file:
+                pdf_file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            _logger.warning("Cannot write PDF in cache %s", path, exc_info=True)
+            return
+        with _sizes_lock:
+            size = _sizes.get(self.directory)
+            if size is None:
+                size = sum(f[1] for f in self._list_files())
+            else:
+                size += len(data)
+            if size > self.max_size:
+                size = self._evict()
+            _sizes[self.directory] = size
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _list_files(self):
+        """ :return: list of tuples (last use, size, path) of the cached PDFs """
+        res = list()
+        for dirpath, _dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                res.append((stat.st_mtime, stat.st_size, path))
+        return res
+
+    def _evict(self):
+        """ Removes the least recently used PDFs.
+        :return: the size of the cache
+        """
+        files = sorted(self._list_files())
+        size = sum(f[1] for f in files)
+        for _mtime, file_size, path in files:
+            if size <= self.max_size * EVICTION_RATIO:
+                break
+            try:
+                os.remove(path)
+                size -= file_size
+            except OSError:
+                continue
+        return size
@@ -0,0 +1,179 @@
+##############################################################################
+#
+#    Copyright (C) 2021 Compassion CH (http://www.compassion.ch)
+#    Releasing children from poverty in Jesus' name
+#
+#    The licence is in the file __manifest__.py
+#
+##############################################################################
+import json
+import logging
+import os
+import select
+import subprocess
+import threading
+import time
+
+from odoo.tools.config import config
+
+_logger = logging.getLogger(__name__)
+
+# path of the FPDF folder
+FPDF_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "FPDF"
+)
+
+
+class PDFRenderer(object):
+    """ Long-lived PHP process generating the PDFs of the letters with FPDF.
+
+    The layouts of the PDFs are sent through a pipe to FPDF/renderer.php,
+    which avoids starting a new PHP process for each letter. One renderer is
+    started by each Odoo worker and is restarted if it stops. A renderer that
+    doesn't answer within the fpdf_render_timeout setting of the Odoo
+    configuration file (in seconds, default 60) is killed.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._process = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Output of the renderer read after the end of the last answer
+        self._buffer = b""
+
+    @classmethod
+    def get_renderer(cls):
+        """ Returns the PDF renderer of the worker. """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def render(self, layouts):
+        """
+        Generates PDFs.
+        :param layouts: list of dictionaries describing the PDFs
+                        (see FPDF/README.rst)
+        :return: list of PDF data, False for the PDFs that could not be
+                 generated
+        """
+        with self._lock:
+            return [self._render(json.dumps(layout).encode()) for layout in layouts]
+
+    def _render(self, message):
+        try:
+            process = self._get_process()
+            process.stdin.write(b"%d\n" % len(message) + message)
+            process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            # The renderer stopped since the last PDF, start a new one.
+            self._stop()
+            process = self._get_process()
+            process.stdin.write(b"%d\n" % len(message) + message)
+            process.stdin.flush()
+        try:
+            deadline = time.time() + float(config.get("fpdf_render_timeout") or 60)
+            length = self._read_line(process, deadline).strip()
+            if not length:
+                _logger.error("FPDF renderer stopped while generating a PDF.")
+                self._stop()
+                return False
+            length = int(length)
+            if length < 0:
+                return False
+            return self._read(process, length, deadline)
+        except (TimeoutError, ValueError, OSError) as error:
+            _logger.error("FPDF renderer failed, restarting it: %s", error)
+            self._stop()
+            return False
+
+    @staticmethod
+    def _read_chunk(process, size, deadline):
+        """ Reads at most size bytes of the output of the renderer, waiting
+        until the deadline. The pipe is read directly, without the buffer of
+        process.stdout, so that it is never blocked. """
+        fd = process.stdout.fileno()
+        timeout = deadline - time.time()
+        if timeout <= 0 or not select.select([fd], [], [], timeout)[0]:
+            raise TimeoutError("no answer from the FPDF renderer")
+        return os.read(fd, size)
+
+    def _read_line(self, process, deadline):
+        line = self._buffer
+        while b"\n" not in line:
+            data = self._read_chunk(process, 64, deadline)
+            if not data:
+                self._buffer = b""
+                return line
+            line += data
+        line, self._buffer = line.split(b"\n", 1)
+        return line
+
+    def _read(self, process, length, deadline):
+        data = self._buffer[:length]
+        self._buffer = self._buffer[length:]
+        chunks = [data]
+        remaining = length - len(data)
+        while remaining > 0:
+            data = self._read_chunk(process, min(remaining, 1024 ** 2), deadline)
+            if not data:
+                raise OSError("FPDF renderer stopped while sending a PDF")
+            chunks.append(data)
+            remaining -= len(data)
+        return b"".join(chunks)
+
+    def _get_process(self):
+        if (
+            self._process is None
+            or self._process.poll() is not None
+            or self._pid != os.getpid()
+        ):
+            args = ["php"]
+            env = None
+            if config.get("php_debug"):
+                # Allow php debugging with Xend
+                env = dict(os.environ, XDEBUG_CONFIG="PHPSTORM")
+                args.extend(
+                    [
+                        "-dxdebug.remote_enable=1",
+                        "-dxdebug.remote_mode=req",
+                        "-dxdebug.remote_port=9000",
+                        "-dxdebug.remote_host=127.0.0.1",
+                    ]
+                )
+            args.append(os.path.join(FPDF_PATH, "renderer.php"))
+            self._process = subprocess.Popen(
+                args,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=FPDF_PATH,
+                env=env,
+            )
+            self._pid = os.getpid()
+            self._buffer = b""
+            threading.Thread(
+                target=self._log_errors,
+                args=(self._process.stderr,),
+                name="fpdf.renderer.stderr",
+                daemon=True,
+            ).start()
+        return self._process
+
+    def _stop(self):
+        if self._process is not None and self._pid == os.getpid():
+            try:
+                self._process.kill()
+                self._process.wait()
+            except OSError:
+                pass
+        self._process = None
+        self._buffer = b""
+
+    @staticmethod
+    def _log_errors(stderr):
+        for line in iter(stderr.readline, b""):
+            _logger.error("FPDF: %s", line.decode(errors="replace").rstrip())
@@ -2,6 +2,7 @@ import fitz
 import base64
 import io
 import re
+from collections import Counter
 
 from pyzbar import pyzbar
 from PIL import Image, ImageEnhance, ImageFilter
@@ -11,9 +12,17 @@ def read_pdf(pdf_data):
     return fitz.Document("pdf", pdf_data)
 
 
-def convert_pdf_page_to_image(page):
-    mat = fitz.Matrix(4.5, 4.5)
-    pix = page.get_pixmap(matrix=mat, alpha=0)
+# Zoom used to read the barcodes
+DETECTION_ZOOM = 4.5
+# Zoom of the preview displayed to the users
+PREVIEW_ZOOM = 1.5
+# Part of the page where the barcode is printed (ratios of width and height)
+BARCODE_REGION = (0.38, 0.15)
+
+
+def convert_pdf_page_to_image(page, zoom=DETECTION_ZOOM, clip=None):
+    mat = fitz.Matrix(zoom, zoom)
+    pix = page.get_pixmap(matrix=mat, clip=clip, alpha=0)
     mode = "RGBA" if pix.alpha else "RGB"
     size = [pix.width, pix.height]
     image = Image.frombytes(mode, size, pix.samples)
@@ -25,8 +34,15 @@ def detect_barcode_in_image(image):
     return barcodes
 
 
-def top_left(img):
-    return img.crop([0, 0, 0.38 * img.width, 0.15 * img.height])
+def top_left_rect(page):
+    """ Region of the page where the barcode is printed. """
+    rect = page.rect
+    return fitz.Rect(
+        rect.x0,
+        rect.y0,
+        rect.x0 + BARCODE_REGION[0] * rect.width,
+        rect.y0 + BARCODE_REGION[1] * rect.height,
+    )
 
 
 def threshold(img):
@@ -49,27 +65,60 @@ def blue_channel(img):
     return img.split()[2]
 
 
+# The strategies are applied on the top left region of the page, rendered
+# by top_left_rect. When none of them finds the barcode, the whole page is
+# read (FULL_PAGE_STRATEGY).
 strategies = [
-    (top_left, blue_channel, contrast(2), erode(3)),
-    (top_left, threshold),
-    (top_left,),
-    (), # do nothing
+    ("blue_contrast_erode", (blue_channel, contrast(2), erode(3))),
+    ("threshold", (threshold,)),
+    ("top_left", ()),
 ]
+FULL_PAGE_STRATEGY = "full_page"
+
+
+def get_sorted_strategies(strategy_stats=None):
+    """
+    :param strategy_stats: number of barcodes found by each strategy, used
+                           to try first the strategies that work best with
+                           the scanned letters
+    :return: the strategies in the order they should be tried
+    """
+    strategy_stats = Counter(strategy_stats or {})
+    return sorted(strategies, key=lambda s: strategy_stats[s[0]], reverse=True)
+
+
+def find_barcode(img):
+    barcodes = detect_barcode_in_image(img)
+    if len(barcodes) > 1:
+        print("multiple barcode detected, used the first one")
+    if barcodes:
+        return barcodes[0].data.decode("utf8")
+    return None
 
 
-def find_barcode_using_multiple_strategies(original):
-    for strategy in strategies:
-        img = original.copy()
-        for operation in strategy:
+def find_barcode_using_multiple_strategies(
+        original, page=None, strategy_stats=None):
+    """
+    Reads the barcode of a letter.
+    :param original: image of the top left region of the page
+    :param page: PDF page, rendered entirely if no strategy found the barcode
+                 in the region
+    :param strategy_stats: number of barcodes found by each strategy
+    :return: tuple (the barcode or None, name of the strategy that found it)
+    """
+    for name, operations in get_sorted_strategies(strategy_stats):
+        img = original
+        for operation in operations:
             img = operation(img)
-        barcodes = detect_barcode_in_image(img)
-
-        if len(barcodes) > 1:
-            print("multiple barcode detected, used the first one")
-        if barcodes:
-            return barcodes[0].data.decode("utf8")
-
-    return None
+        barcode = find_barcode(img)
+        if barcode:
+            return barcode, name
+
+    if page is not None:
+        barcode = find_barcode(convert_pdf_page_to_image(page))
+        if barcode:
+            return barcode, FULL_PAGE_STRATEGY
+    return None, None
 
 
 def get_info_from_barcode(code):
@@ -94,11 +143,20 @@ def create_preview(image):
     return preview_b64
 
 
-def letter_barcode_detection_pipeline(pdf_data):
+def letter_barcode_detection_pipeline(pdf_data, strategy_stats=None):
+    """
+    Reads the barcode of a scanned letter and renders its preview.
+    :param pdf_data: PDF of the letter
+    :param strategy_stats: number of barcodes found by each strategy
+    :return: tuple (partner code, child code, preview, name of the strategy
+             that found the barcode)
+    """
     pdf = read_pdf(pdf_data)
     page0 = next(pdf.pages())
-    original = convert_pdf_page_to_image(page0)
-    barcode = find_barcode_using_multiple_strategies(original)
+    # Only the region of the barcode is rendered at high resolution
+    region = convert_pdf_page_to_image(page0, clip=top_left_rect(page0))
+    barcode, strategy = find_barcode_using_multiple_strategies(
+        region, page0, strategy_stats)
     partner, child = get_info_from_barcode(barcode)
-    preview = create_preview(original)
-    return partner, child, preview
+    preview = create_preview(convert_pdf_page_to_image(page0, PREVIEW_ZOOM))
+    return partner, child, preview, strategy
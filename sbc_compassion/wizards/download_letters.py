@@ -8,10 +8,17 @@
 #
 ##############################################################################
 import base64
-from io import BytesIO
-from zipfile import ZipFile
+
+from odoo.addons.child_compassion.tools.zip_export import (
+    ZipExport,
+    get_download_action,
+)
 
 from odoo import models, api, fields, _
+from odoo.exceptions import UserError
+
+# Number of letter PDFs generated together
+GENERATION_BATCH_SIZE = 20
 
 
 class DownloadLetters(models.TransientModel):
@@ -27,7 +34,7 @@ class DownloadLetters(models.TransientModel):
     #                                 FIELDS                                 #
     ##########################################################################
     fname = fields.Char(compute="_compute_filename")
-    download_data = fields.Binary(readonly=True)
+    export_id = fields.Many2one("ir.attachment", "Archive", readonly=True)
 
     ##########################################################################
     #                             VIEW CALLBACKS                             #
@@ -39,28 +46,53 @@ class DownloadLetters(models.TransientModel):
 
     @api.multi
     def _compute_data(self):
-        """ Create the zip archive from the selected letters. """
-        letters = (
-            self.env[self.env.context["active_model"]]
-            .browse(self.env.context["active_ids"])
-            .with_context(bin_size=False)
+        """ Create the zip archive from the selected letters. The PDFs are
+        copied from the filestore into the archive, which is itself written
+        in the filestore, so that no stored letter is loaded in memory.
+        The letters without stored image are generated by batches. """
+        letters = self.env[self.env.context["active_model"]].browse(
+            self.env.context["active_ids"]
         )
-        zip_buffer = BytesIO()
-        with ZipFile(zip_buffer, "w") as zip_data:
+        attachments = {
+            attachment.res_id: attachment
+            for attachment in self.env["ir.attachment"].search(
+                [
+                    ("res_model", "=", letters._name),
+                    ("res_field", "=", "letter_image"),
+                    ("res_id", "in", letters.ids),
+                ]
+            )
+        }
+        self.export_id.unlink()
+        with ZipExport(self.env, self.fname, self) as export:
             for letter in letters:
-                zip_data.writestr(
-                    letter.file_name, base64.b64decode(letter.letter_image)
-                )
-        zip_buffer.seek(0)
-        self.download_data = base64.b64encode(zip_buffer.read())
+                attachment = attachments.get(letter.id)
+                if attachment and attachment.store_fname:
+                    export.write(
+                        attachment._full_path(attachment.store_fname),
+                        letter.file_name,
+                    )
+                elif attachment:
+                    # Attachment stored in the database
+                    letter_image = letter.with_context(bin_size=False).letter_image
+                    export.writestr(letter.file_name, base64.b64decode(letter_image))
+            # Letters whose PDF is generated when requested, by batches
+            to_generate = letters.filtered(lambda l: l.id not in attachments)
+            for i in range(0, len(to_generate), GENERATION_BATCH_SIZE):
+                batch = to_generate[i: i + GENERATION_BATCH_SIZE]
+                for letter, pdf in zip(batch, batch.generate_original_pdfs()):
+                    if pdf:
+                        export.writestr(letter.file_name, pdf)
+        self.export_id = export.attachment
 
     @api.multi
     def get_letters(self):
         self._compute_data()
-        return {
-            "type": "ir.actions.act_window",
-            "res_id": self.id,
-            "res_model": self._name,
-            "view_mode": "form",
-            "target": "new",
-        }
+        if not self.export_id:
+            raise UserError(_("The selected letters have no PDF to download."))
+        return get_download_action(self.export_id)
+
+    @api.multi
+    def unlink(self):
+        self.mapped("export_id").unlink()
+        return super().unlink()
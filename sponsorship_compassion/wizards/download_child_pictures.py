@@ -9,15 +9,23 @@
 ##############################################################################
 import base64
 import logging
-import urllib.error
-import urllib.request
-from io import BytesIO
-from zipfile import ZipFile
+
+from odoo.addons.child_compassion.tools.image_cache import (
+    download_image,
+    download_images,
+)
+from odoo.addons.child_compassion.tools.zip_export import (
+    ZipExport,
+    get_download_action,
+)
 
 from odoo import models, api, fields
 
 logger = logging.getLogger(__name__)
 
+# Number of pictures downloaded before being written in the archive
+DOWNLOAD_CHUNK_SIZE = 40
+
 
 class DownloadChildPictures(models.TransientModel):
     """
@@ -37,7 +45,7 @@ class DownloadChildPictures(models.TransientModel):
     )
     height = fields.Integer()
     width = fields.Integer()
-    download_data = fields.Binary(readonly=True)
+    export_id = fields.Many2one("ir.attachment", "Archive", readonly=True)
     preview = fields.Binary(compute="_compute_preview")
     information = fields.Text(readonly=True)
 
@@ -63,41 +71,39 @@ class DownloadChildPictures(models.TransientModel):
 
     @api.multi
     def get_pictures(self):
-        """ Create the zip archive from the selected letters. """
-        children = self._get_children()
-
-        zip_buffer = BytesIO()
-        with ZipFile(zip_buffer, "w") as zip_data:
-            found = 0
-
-            for child in children.filtered("image_url"):
-                child_code = child.local_id
-                url = self.get_picture_url(
-                    raw_url=child.image_url,
-                    pic_type=self.type,
-                    height=self.height,
-                    width=self.width,
-                )
-                try:
-                    data = base64.encodestring(urllib.request.urlopen(url).read())
-                except urllib.error.URLError:
-                    # Not good, the url doesn't lead to an image
-                    logger.error("Image cannot be fetched: " + str(url))
-                    continue
-
-                _format = url.split(".")[-1]
-                sponsor_ref = child.sponsor_ref
-                fname = sponsor_ref + "_" + child_code + "." + _format
-
-                zip_data.writestr(fname, base64.b64decode(data))
-                found += 1
-
-        zip_buffer.seek(0)
-        if found:
-            self.download_data = base64.b64encode(zip_buffer.read())
-
-        self.information = "Zip file contains " + str(found) + " " "pictures.\n\n"
-        self._check_picture_availability()
+        """ Create the zip archive from the selected letters. The pictures
+        are downloaded in parallel and written in the archive by chunks, so
+        that only a few of them are kept in memory. """
+        children = self._get_children().filtered("image_url")
+        urls = {
+            child.id: self.get_picture_url(
+                raw_url=child.image_url,
+                pic_type=self.type,
+                height=self.height,
+                width=self.width,
+            )
+            for child in children
+        }
+        self.export_id.unlink()
+        children_with_invalid_url = self.env["compassion.child"]
+        with ZipExport(self.env, self.fname, self) as export:
+            for i in range(0, len(children), DOWNLOAD_CHUNK_SIZE):
+                chunk = children[i:i + DOWNLOAD_CHUNK_SIZE]
+                images = download_images([urls[child.id] for child in chunk])
+                for child in chunk:
+                    url = urls[child.id]
+                    data = images.get(url)
+                    if data is None:
+                        # Not good, the url doesn't lead to an image
+                        children_with_invalid_url += child
+                        continue
+                    _format = url.split(".")[-1]
+                    fname = "%s_%s.%s" % (child.sponsor_ref, child.local_id, _format)
+                    export.writestr(fname, data)
+        self.export_id = export.attachment
+
+        self.information = "Zip file contains " + str(export.count) + " pictures.\n\n"
+        self._check_picture_availability(children_with_invalid_url)
         return {
             "type": "ir.actions.act_window",
             "view_type": "form",
@@ -108,6 +114,15 @@ class DownloadChildPictures(models.TransientModel):
             "target": "new",
         }
 
+    @api.multi
+    def download_pictures(self):
+        return get_download_action(self.export_id)
+
+    @api.multi
+    def unlink(self):
+        self.mapped("export_id").unlink()
+        return super().unlink()
+
     _height_change = 0
     _width_change = 0
 
@@ -151,18 +166,21 @@ class DownloadChildPictures(models.TransientModel):
         children = self._get_children()
 
         for child in children.filtered("image_url"):
-            url = child.image_url
-            try:
-                url = self.get_picture_url(url, self.type, self.width, self.height)
-                self.preview = base64.encodestring(
-                    urllib.request.urlopen(url[0]).read()
-                )
+            url = self.get_picture_url(
+                child.image_url, self.type, self.width, self.height
+            )
+            data = download_image(url)
+            if data is not None:
+                self.preview = base64.b64encode(data)
                 break
-            except:
-                logger.error("Image cannot be fetched : " + url)
 
     @api.multi
-    def _check_picture_availability(self):
+    def _check_picture_availability(self, children_with_invalid_url):
+        """
+        Adds the children without picture in the information.
+        :param children_with_invalid_url: children whose picture could not be
+                                          downloaded when making the archive
+        """
         children = self._get_children()
 
         # Search children having a 'image_url' returning False
@@ -175,21 +193,10 @@ class DownloadChildPictures(models.TransientModel):
                     child_codes) + "\n\n"
             )
 
-        # Now we want children having an invalid 'image_url'.
-        # To find them, we have to try to open their url and catch exceptions.
-        children_with_invalid_url = []
-        for child in children.filtered("image_url"):
-            url = self.get_picture_url(
-                raw_url=child.image_url, pic_type="fullshot", height=1, width=1
-            )
-            try:
-                urllib.request.urlopen(url)
-            except urllib.error.URLError:
-                # Not good, the url doesn't lead to an image
-                children_with_invalid_url += [child.local_id]
         if children_with_invalid_url:
-            self.information += "Invalid image url for child(ren):\n\t" + "\n\t".join(
-                children_with_invalid_url
+            child_codes = children_with_invalid_url.mapped("local_id")
+            self.information += (
+                "Invalid image url for child(ren):\n\t" + "\n\t".join(child_codes)
             )
 
     @api.multi